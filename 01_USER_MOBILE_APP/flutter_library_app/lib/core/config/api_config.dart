@@ -23,6 +23,7 @@ class ApiConfig {
   static const String dashboardStats = '/user/dashboard-stats';
   static const String availableBooks = '/books/available';
   static const String searchBooks = '/books/search';
+  static const String syncBooks = '/sync/books';
   
   // Headers
   static Map<String, String> getHeaders(String? token) {
@@ -1,11 +1,35 @@
+import 'dart:convert';
+
 import '../../core/config/api_config.dart';
 import '../services/api_service.dart';
+import '../services/storage_service.dart';
 import '../models/book.dart';
 
 class BookRepository {
   final ApiService _apiService = ApiService();
+  final StorageService _storageService = StorageService();
+
+  static const String _catalogueKey = 'book_catalogue';
+  static const String _syncTokenKey = 'book_sync_token';
 
+  // Available books from the local catalogue, brought up to date by a delta sync
   Future<List<Book>> getAvailableBooks() async {
+    Map<int, Book> catalogue;
+    try {
+      catalogue = await _syncCatalogue();
+    } catch (e) {
+      // Servers without /sync/books still serve the full list
+      return _getAllAvailableBooks();
+    }
+    final books = catalogue.values.where((book) => book.isAvailable).toList()
+      ..sort((a, b) {
+        final byTitle = a.title.compareTo(b.title);
+        return byTitle != 0 ? byTitle : a.id.compareTo(b.id);
+      });
+    return books;
+  }
+
+  Future<List<Book>> _getAllAvailableBooks() async {
     try {
       final response = await _apiService.get(ApiConfig.availableBooks);
       final List<dynamic> data = response.data['books'] ?? response.data;
@@ -15,6 +39,47 @@ class BookRepository {
     }
   }
 
+  // Applies every change since the stored sync token and saves the result
+  Future<Map<int, Book>> _syncCatalogue() async {
+    final catalogue = await _loadCatalogue();
+    String? token = await _storageService.getString(_syncTokenKey);
+    var hasMore = true;
+    while (hasMore) {
+      final response = await _apiService.get(
+        ApiConfig.syncBooks,
+        queryParameters: {if (token != null) 'since': token},
+      );
+      final data = response.data;
+      if (data['reset'] == true) {
+        catalogue.clear();
+      }
+      for (final json in data['books'] as List<dynamic>) {
+        final book = Book.fromJson(json);
+        catalogue[book.id] = book;
+      }
+      for (final id in data['deleted'] as List<dynamic>) {
+        catalogue.remove(id as int);
+      }
+      token = data['next_token'] as String;
+      hasMore = data['has_more'] == true;
+    }
+    await _storageService.saveString(
+      _catalogueKey,
+      jsonEncode(catalogue.values.map((book) => book.toJson()).toList()),
+    );
+    await _storageService.saveString(_syncTokenKey, token!);
+    return catalogue;
+  }
+
+  Future<Map<int, Book>> _loadCatalogue() async {
+    final stored = await _storageService.getString(_catalogueKey);
+    if (stored == null) {
+      return {};
+    }
+    final List<dynamic> data = jsonDecode(stored);
+    return {for (final json in data) json['id'] as int: Book.fromJson(json)};
+  }
+
   Future<List<Book>> searchBooks(String query) async {
     try {
       final response = await _apiService.get(
@@ -28,4 +93,3 @@ class BookRepository {
     }
   }
 }
-
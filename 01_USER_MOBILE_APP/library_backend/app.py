@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, g
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
@@ -6,6 +6,14 @@ import sqlite3
 import bcrypt
 import os
 import socket
+import base64
+import binascii
+import json
+import re
+from db_pool import ConnectionPool, open_connection, shared_db
+import user_versions
+import book_changes
+from read_routing import ReadRouter
 
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = 'your-secret-key-change-in-production'
@@ -16,6 +24,13 @@ app.config['JWT_ALGORITHM'] = 'HS256'
 app.config['JWT_TOKEN_LOCATION'] = ['headers']
 app.config['JWT_HEADER_NAME'] = 'Authorization'
 app.config['JWT_HEADER_TYPE'] = 'Bearer'
+# Pooled SQLite connections per process; 0 opens a fresh connection for every request
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 8))
+# Where read-only endpoints read from: primary, readonly (mode=ro pool) or snapshot (backup-API copy)
+app.config['DB_READ_MODE'] = os.getenv('DB_READ_MODE', 'primary')
+app.config['DB_READ_POOL_SIZE'] = int(os.getenv('DB_READ_POOL_SIZE', 8))
+app.config['DB_READ_MAX_STALENESS'] = float(os.getenv('DB_READ_MAX_STALENESS', 5))  # seconds, snapshot mode
+app.config['DB_SNAPSHOT_DIR'] = os.getenv('DB_SNAPSHOT_DIR')  # default: the system temp dir
 
 jwt = JWTManager(app)
 
@@ -78,7 +93,8 @@ def init_db():
             cover_url TEXT,
             total_copies INTEGER NOT NULL DEFAULT 1,
             available_copies INTEGER NOT NULL DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP
         )
     ''')
     
@@ -135,10 +151,38 @@ def init_db():
             type TEXT NOT NULL,
             seen BOOLEAN NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            dedupe_key VARCHAR(100),
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
     ''')
     
+    # Notifications are written ahead of time by the librarian system (one row
+    # per user and dedupe_key) and read newest first per user
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(notifications)')}
+    if 'dedupe_key' not in columns:
+        cursor.execute('ALTER TABLE notifications ADD COLUMN dedupe_key VARCHAR(100)')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_notifications_user_dedupe_key
+        ON notifications (user_id, dedupe_key)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_notifications_user_created_at
+        ON notifications (user_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_notifications_user_seen_created_at
+        ON notifications (user_id, seen, created_at)
+    ''')
+    
+    # Per-user data versions behind the read endpoints' ETags (shared with the librarian app)
+    user_versions.install(conn)
+    
+    # Book change log behind /api/sync/books; the librarian app stamps books.updated_at
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(books)')}
+    if 'updated_at' not in columns:
+        cursor.execute('ALTER TABLE books ADD COLUMN updated_at TIMESTAMP')
+    book_changes.install(conn)
+    
     conn.commit()
     conn.close()
     
@@ -175,11 +219,73 @@ def create_default_data():
     
     conn.close()
 
+_pool = None
+
+def get_pool():
+    """The process-wide connection pool for DATABASE"""
+    global _pool
+    if _pool is None or _pool.database != DATABASE:
+        _pool = ConnectionPool(DATABASE, max_size=app.config['DB_POOL_SIZE'])
+    return _pool
+
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the request's database connection.
+    
+    The first call in a request borrows a connection from the pool and binds
+    it to ``g``; later calls reuse it and teardown hands it back, so handlers
+    never close it themselves.
+    """
+    if 'db' not in g:
+        if app.config['DB_POOL_SIZE'] > 0:
+            g.db = get_pool().acquire()
+        else:
+            g.db = open_connection(DATABASE)
+    return g.db
+
+_read_router = None
+
+def get_read_router():
+    """The process-wide read router for DATABASE and the configured read mode"""
+    global _read_router
+    mode = app.config['DB_READ_MODE']
+    if _read_router is None or _read_router.database != DATABASE or _read_router.mode != mode:
+        if _read_router is not None:
+            _read_router.close()
+        _read_router = ReadRouter(DATABASE, mode,
+                                  max_staleness=app.config['DB_READ_MAX_STALENESS'],
+                                  pool_size=app.config['DB_READ_POOL_SIZE'],
+                                  snapshot_dir=app.config['DB_SNAPSHOT_DIR'])
+    return _read_router
+
+def get_read_connection():
+    """Get a connection for a read-only handler.
+    
+    Routed by ``DB_READ_MODE``; anything that writes must use
+    get_db_connection(), which is always the primary.
+    """
+    if 'read_db' not in g:
+        routed = get_read_router().acquire()
+        if routed is None:
+            return get_db_connection()
+        g.read_db = routed
+    return g.read_db[1]
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    routed = g.pop('read_db', None)
+    if routed is not None:
+        pool, read_conn = routed
+        pool.release(read_conn)
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    if app.config['DB_POOL_SIZE'] > 0:
+        get_pool().release(conn)
+    else:
+        conn.close()
+
+# 304 Not Modified for per-user reads while the user's data version is unchanged
+conditional_user_get = user_versions.conditional_get(get_read_connection, get_jwt_identity)
 
 # Authentication routes
 @api_bp.route('/auth/login', methods=['POST'])
@@ -196,7 +302,6 @@ def login():
         cursor = conn.cursor()
         cursor.execute('SELECT id, name, email, password_hash, role FROM users WHERE email = ?', (email,))
         user = cursor.fetchone()
-        conn.close()
         
         if not user:
             return jsonify({'error': 'Invalid email or password'}), 401
@@ -245,7 +350,6 @@ def get_user_profile():
         cursor = conn.cursor()
         cursor.execute('SELECT id, name, email, membership_id FROM users WHERE id = ?', (user_id,))
         user = cursor.fetchone()
-        conn.close()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -263,11 +367,12 @@ def get_user_profile():
 
 @api_bp.route('/user/borrowed-books', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional_user_get
 def get_borrowed_books():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)  # Convert string back to int
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -293,7 +398,6 @@ def get_borrowed_books():
         ''', (user_id,))
         
         rows = cursor.fetchall()
-        conn.close()
         
         books = []
         for row in rows:
@@ -320,11 +424,12 @@ def get_borrowed_books():
 
 @api_bp.route('/user/fines', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional_user_get
 def get_fines():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)  # Convert string back to int
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -335,7 +440,6 @@ def get_fines():
         ''', (user_id,))
         
         rows = cursor.fetchall()
-        conn.close()
         
         fines = []
         for row in rows:
@@ -353,23 +457,34 @@ def get_fines():
 
 @api_bp.route('/user/notifications', methods=['GET'])
 @jwt_required()
+@conditional_user_get
 def get_notifications():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)  # Convert string back to int
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        # Served by ix_notifications_user_created_at / ix_notifications_user_seen_created_at
+        filters, params = ['user_id = ?'], [user_id]
+        seen = request.args.get('seen')
+        if seen is not None:
+            filters.append('seen = ?')
+            params.append(1 if seen.lower() in ('1', 'true', 'yes') else 0)
+        since = request.args.get('since')
+        if since:
+            filters.append('created_at > ?')
+            params.append(since.replace('T', ' '))
+        
+        cursor.execute(f'''
             SELECT id, title, body, type, seen, created_at
             FROM notifications
-            WHERE user_id = ?
-            ORDER BY created_at DESC
+            WHERE {' AND '.join(filters)}
+            ORDER BY created_at DESC, id DESC
             LIMIT 50
-        ''', (user_id,))
+        ''', params)
         
         rows = cursor.fetchall()
-        conn.close()
         
         notifications = []
         for row in rows:
@@ -393,54 +508,160 @@ def mark_notification_as_read(notification_id):
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)  # Convert string back to int
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('''
+        shared_db.run_write(conn, lambda conn: conn.execute('''
             UPDATE notifications
             SET seen = 1
             WHERE id = ? AND user_id = ?
-        ''', (notification_id, user_id))
-        
-        conn.commit()
-        conn.close()
+        ''', (notification_id, user_id)))
         
         return jsonify({'success': True}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Book routes
+BOOK_PAGE_DEFAULT_LIMIT = 20
+BOOK_PAGE_MAX_LIMIT = 100
+
+BOOK_LIST_COLUMNS = '''
+    b.id, b.title, b.author, b.publisher, b.isbn, b.total_copies, b.available_copies, c.name as category
+'''
+
+# Same column weights as the librarian system: title, author, publisher, isbn, category
+BOOKS_FTS_RANK = 'bm25(books_fts, 10.0, 5.0, 1.0, 2.0, 1.0)'
+
+def books_fts_available(conn):
+    """Whether the librarian system has installed the books_fts search index"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone() is not None
+
+def fts_match_expression(query):
+    """Every word of ``query`` as a quoted FTS5 prefix term, or None if there are none"""
+    tokens = re.findall(r'\w+', query)
+    if not tokens:
+        return None
+    return ' '.join('"%s"*' % token for token in tokens)
+
+def encode_book_cursor(sort_value, book_id):
+    """Opaque cursor pointing just past (sort_value, id); same format as the librarian API"""
+    payload = json.dumps([sort_value, book_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_book_cursor(cursor, sort_type):
+    """Inverse of encode_book_cursor; raises ValueError on a malformed cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, book_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(sort_value, sort_type) or not isinstance(book_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_value, book_id
+
+def book_row_to_dict(row):
+    return {
+        'id': row[0],
+        'title': row[1],
+        'author': row[2],
+        'category': row[7] or 'Unknown',
+        'description': f'Publisher: {row[3]}\nISBN: {row[4]}',
+        'cover_url': None,
+        'total_copies': row[5],
+        'available_copies': row[6]
+    }
+
+def list_books_response(conn, where, params, ranked=False):
+    """Books matching ``where`` in (title, id) order, or (bm25 rank, id) when ``ranked``.
+    
+    Without ``limit``/``cursor`` every match is returned for older app builds;
+    otherwise one keyset page plus ``next_cursor`` (None on the last page).
+    """
+    if ranked:
+        sort_key, sort_type = BOOKS_FTS_RANK, (int, float)
+        joins = 'JOIN books_fts ON books_fts.rowid = b.id LEFT JOIN categories c ON b.category_id = c.id'
+    else:
+        sort_key, sort_type = 'b.title', str
+        joins = 'LEFT JOIN categories c ON b.category_id = c.id'
+    
+    cursor_arg = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    paginated = cursor_arg is not None or limit is not None
+    
+    sql = f'SELECT {BOOK_LIST_COLUMNS}, {sort_key} AS sort_key FROM books b {joins} WHERE ({where})'
+    params = list(params)
+    if paginated:
+        limit = min(max(limit or BOOK_PAGE_DEFAULT_LIMIT, 1), BOOK_PAGE_MAX_LIMIT)
+        if cursor_arg:
+            try:
+                after_value, after_id = decode_book_cursor(cursor_arg, sort_type)
+            except ValueError as exc:
+                return jsonify({'error': str(exc)}), 400
+            sql += f' AND ({sort_key}, b.id) > (?, ?)'
+            params += [after_value, after_id]
+        sql += ' ORDER BY sort_key ASC, b.id ASC LIMIT ?'
+        params.append(limit + 1)
+    else:
+        sql += ' ORDER BY sort_key ASC, b.id ASC'
+    
+    rows = conn.execute(sql, params).fetchall()
+    
+    if not paginated:
+        return jsonify({'books': [book_row_to_dict(row) for row in rows]}), 200
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'books': [book_row_to_dict(row) for row in rows],
+        'next_cursor': encode_book_cursor(rows[-1][8], rows[-1][0]) if has_more else None,
+        'limit': limit
+    }), 200
+
 @api_bp.route('/books/available', methods=['GET', 'OPTIONS'])
 @jwt_required()
 def get_available_books():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT b.id, b.title, b.author, b.publisher, b.isbn, b.total_copies, b.available_copies, c.name as category
-            FROM books b
-            LEFT JOIN categories c ON b.category_id = c.id
-            WHERE b.available_copies > 0
-            ORDER BY b.title ASC
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
+        conn = get_read_connection()
+        return list_books_response(conn, 'b.available_copies > 0', ())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/sync/books', methods=['GET'])
+@jwt_required()
+def sync_books():
+    """Books created, updated or deleted since ``?since=<token>``.
+    
+    Repeat with the returned ``next_token`` while ``has_more``; ``reset``
+    means the local catalogue must be rebuilt from this response on.
+    """
+    try:
+        since = book_changes.parse_token(request.args.get('since'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    try:
+        limit = book_changes.page_limit(request.args.get('limit', type=int))
+        conn = get_read_connection()
+        page = book_changes.read_changes(conn, since, limit)
+        rows = {}
+        if page['changed']:
+            placeholders = ', '.join('?' * len(page['changed']))
+            rows = {row[0]: row for row in conn.execute(f'''
+                SELECT {BOOK_LIST_COLUMNS}, COALESCE(b.updated_at, b.created_at)
+                FROM books b LEFT JOIN categories c ON b.category_id = c.id
+                WHERE b.id IN ({placeholders})
+            ''', page['changed'])}
         books = []
-        for row in rows:
-            books.append({
-                'id': row[0],
-                'title': row[1],
-                'author': row[2],
-                'category': row[7] or 'Unknown',
-                'description': f'Publisher: {row[3]}\nISBN: {row[4]}',
-                'cover_url': None,
-                'total_copies': row[5],
-                'available_copies': row[6]
-            })
-        
-        return jsonify({'books': books}), 200
+        for book_id in page['changed']:
+            if book_id in rows:
+                books.append({**book_row_to_dict(rows[book_id]), 'updated_at': rows[book_id][8]})
+        return jsonify({
+            'books': books,
+            # Logged as changed but gone by now: deleted since
+            'deleted': page['deleted'] + [book_id for book_id in page['changed'] if book_id not in rows],
+            'next_token': page['next_token'],
+            'has_more': page['has_more'],
+            'reset': page['reset']
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -452,45 +673,31 @@ def search_books():
         if not query:
             return jsonify({'books': []}), 200
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT b.id, b.title, b.author, b.publisher, b.isbn, b.total_copies, b.available_copies, c.name as category
-            FROM books b
-            LEFT JOIN categories c ON b.category_id = c.id
-            WHERE b.title LIKE ? OR b.author LIKE ? OR c.name LIKE ?
-            ORDER BY b.title ASC
-        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        books = []
-        for row in rows:
-            books.append({
-                'id': row[0],
-                'title': row[1],
-                'author': row[2],
-                'category': row[7] or 'Unknown',
-                'description': f'Publisher: {row[3]}\nISBN: {row[4]}',
-                'cover_url': None,
-                'total_copies': row[5],
-                'available_copies': row[6]
-            })
-        
-        return jsonify({'books': books}), 200
+        conn = get_read_connection()
+        if books_fts_available(conn):
+            match = fts_match_expression(query)
+            if match is None:
+                return jsonify({'books': []}), 200
+            return list_books_response(conn, 'books_fts MATCH ?', (match,), ranked=True)
+        
+        # LIKE fallback until the librarian system has created the index
+        return list_books_response(
+            conn,
+            'b.title LIKE ? OR b.author LIKE ? OR c.name LIKE ?',
+            (f'%{query}%', f'%{query}%', f'%{query}%')
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Dashboard stats route
 @api_bp.route('/user/dashboard-stats', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional_user_get
 def get_dashboard_stats():
     try:
         user_id_str = get_jwt_identity()
         user_id = int(user_id_str)  # Convert string back to int
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
         
         # Get borrowed books count
@@ -528,7 +735,6 @@ def get_dashboard_stats():
         # Use the maximum of transaction fines and fines table
         total_fines = max(float(total_fines), float(pending_fines))
         
-        conn.close()
         
         return jsonify({
             'borrowed_count': borrowed_count,
@@ -543,6 +749,16 @@ def get_dashboard_stats():
 def health_check():
     return jsonify({'status': 'healthy'}), 200
 
+# Shared database lock contention and pool usage for this process
+@api_bp.route('/db-metrics', methods=['GET'])
+@jwt_required()
+def db_metrics():
+    metrics = {'process': 'mobile', **shared_db.lock_metrics.snapshot()}
+    if app.config['DB_POOL_SIZE'] > 0:
+        metrics['pool'] = get_pool().stats()
+    metrics['reads'] = get_read_router().stats()
+    return jsonify(metrics), 200
+
 def get_local_ip():
     """Get local IP address"""
     try:
@@ -0,0 +1,98 @@
+"""
+Bounded SQLite connection pool for the mobile backend.
+
+Connections are opened lazily up to ``max_size`` through the shared
+connection factory (WAL, busy timeout and the other PRAGMAs the librarian app
+uses too) and then reused across requests instead of reconnecting (and
+starting with a cold page cache) every time.
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import threading
+
+# The connection factory shared with the librarian app lives in 03_SHARED_RESOURCES
+SHARED_RESOURCES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '03_SHARED_RESOURCES'
+)
+if SHARED_RESOURCES_DIR not in sys.path:
+    sys.path.append(SHARED_RESOURCES_DIR)
+import shared_db
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the acquire timeout"""
+
+
+def open_connection(database, pragmas=shared_db.CONNECTION_PRAGMAS):
+    """A configured connection that may be handed between request threads"""
+    conn = shared_db.connect(database, pragmas, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, database, max_size=8, timeout=10.0, connect=open_connection):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def acquire(self):
+        """Reuse an idle connection, open a new one below max_size, else wait for one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.max_size:
+                self._opened += 1
+                try:
+                    return self._connect(self.database)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f'No database connection free after {self.timeout}s')
+
+    def release(self, conn):
+        """Hand a connection back, rolling back anything its borrower left open"""
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close every idle connection, and borrowed ones as they come back"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def stats(self):
+        return {'opened': self._opened, 'idle': self._idle.qsize(), 'max_size': self.max_size}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Load test for the mobile backend: throughput and latency of
+GET /api/user/borrowed-books with pooled connections against the old
+connection-per-request behaviour, and with reads routed to a read-only pool
+or a backup-API snapshot (DB_READ_MODE).
+
+Runs the app in-process on a threaded server over a scratch copy of the
+shared database, so the real one is never written to. ``--writer`` adds a
+thread that keeps committing fine updates to the primary, standing in for
+the librarian app.
+
+Usage: python load_test.py [--clients 8] [--seconds 10] [--writer] [--database PATH]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+
+from werkzeug.serving import make_server
+from flask_jwt_extended import create_access_token
+
+import app as backend
+from db_pool import shared_db
+
+
+def busiest_user(database):
+    """The user with the most active loans, so the endpoint has rows to return"""
+    conn = sqlite3.connect(database)
+    try:
+        row = conn.execute('''
+            SELECT u.id FROM users u
+            LEFT JOIN transactions t ON t.user_id = u.id AND t.status IN ('issued', 'overdue')
+            WHERE u.role = 'user'
+            GROUP BY u.id ORDER BY COUNT(t.id) DESC LIMIT 1
+        ''').fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise SystemExit('The database has no users with role "user"')
+    return row[0]
+
+
+def write_loop(database, stop, counter):
+    """Commit small fine updates to the primary until ``stop`` is set"""
+    conn = shared_db.connect(database)
+    try:
+        while not stop.is_set():
+            shared_db.run_write(conn, lambda conn: conn.execute(
+                "UPDATE transactions SET fine_amount = fine_amount + 0 "
+                "WHERE id IN (SELECT id FROM transactions ORDER BY random() LIMIT 20)"
+            ))
+            counter.append(1)
+            time.sleep(0.005)
+    finally:
+        conn.close()
+
+
+def run_round(pool_size, read_mode, url, token, clients, seconds, writer=False):
+    backend.app.config['DB_POOL_SIZE'] = pool_size
+    backend.app.config['DB_READ_MODE'] = read_mode
+    backend._pool = None
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    latencies, errors, writes = [], [], []
+    stop = threading.Event()
+    if writer:
+        threading.Thread(target=write_loop, args=(backend.DATABASE, stop, writes), daemon=True).start()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        request = urllib.request.Request(base + url, headers={'Authorization': f'Bearer {token}'})
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                local.append(time.perf_counter() - start)
+            except Exception as exc:
+                errors.append(exc)
+        latencies.extend(local)
+
+    workers = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    server.shutdown()
+    if backend._pool is not None:
+        backend._pool.close()
+    if backend._read_router is not None:
+        backend._read_router.close()
+        backend._read_router = None
+
+    latencies.sort()
+    pick = lambda pct: latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000 if latencies else 0
+    return len(latencies) / elapsed, pick(50), pick(99), len(errors), len(writes) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--writer', action='store_true', help='commit fine updates to the primary during each round')
+    parser.add_argument('--database', default=backend.DATABASE,
+                        help='database to copy for the test (default: the shared one)')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='pustak_load_')
+    backend.DATABASE = os.path.join(scratch, 'pustak_tracker.db')
+    shutil.copy(args.database, backend.DATABASE)
+    try:
+        with backend.app.app_context():
+            token = create_access_token(identity=str(busiest_user(backend.DATABASE)))
+
+        rounds = (
+            ('connect per request', 0, 'primary'),
+            (f'pool of {args.pool_size}', args.pool_size, 'primary'),
+            ('read-only pool', args.pool_size, 'readonly'),
+            ('snapshot reads', args.pool_size, 'snapshot'),
+        )
+        print(f"{'mode':>20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'writes/s':>9}")
+        for label, pool_size, read_mode in rounds:
+            rps, p50, p99, errors, wps = run_round(pool_size, read_mode, '/api/user/borrowed-books', token,
+                                                   args.clients, args.seconds, args.writer)
+            print(f"{label:>20} {rps:>9.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7} {wps:>9.0f}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
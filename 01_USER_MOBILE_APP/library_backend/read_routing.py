@@ -0,0 +1,169 @@
+"""
+Read routing for the mobile backend's read-only endpoints.
+
+Writes always use the primary pool. Reads go wherever ``DB_READ_MODE`` says:
+
+``primary``
+    the same pool as writes (the default).
+``readonly``
+    a separate pool of ``mode=ro`` connections to the primary file. In WAL
+    mode these read the latest committed data without taking write locks.
+``snapshot``
+    a private copy of the database made with the SQLite backup API and
+    opened ``immutable``, so reads take no locks on the shared file at all.
+    A snapshot older than ``max_staleness`` seconds is refreshed by the next
+    read. Reads that arrive while another thread is refreshing go to the
+    primary pool instead, so no read is served from data past the bound.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from db_pool import ConnectionPool, shared_db
+
+READ_MODES = ('primary', 'readonly', 'snapshot')
+
+
+def open_readonly_connection(database):
+    conn = shared_db.connect_readonly(database, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def open_snapshot_connection(path):
+    conn = shared_db.connect_readonly(path, immutable=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class SnapshotStore:
+    """Backup-API copies of the primary, replaced once they get too old"""
+
+    def __init__(self, database, max_staleness=5.0, pool_size=8, directory=None):
+        self.database = database
+        self.max_staleness = max_staleness
+        self.pool_size = pool_size
+        self.directory = directory or tempfile.gettempdir()
+        self.pool = None
+        self._previous = None
+        self.taken_at = None
+        self.refreshes = 0
+        self.last_refresh_seconds = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def age(self):
+        return None if self.taken_at is None else time.monotonic() - self.taken_at
+
+    def is_fresh(self):
+        age = self.age()
+        return age is not None and age <= self.max_staleness
+
+    def refresh(self):
+        """Copy the primary into a new snapshot file and switch reads over to it"""
+        start = time.monotonic()
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='pustak_snapshot_', dir=self.directory)
+        os.close(fd)
+        source = shared_db.connect(self.database)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        except BaseException:
+            target.close()
+            os.remove(path)
+            raise
+        finally:
+            source.close()
+        target.close()
+
+        # The replaced snapshot stops lending connections now but its file is
+        # kept until the next refresh, for readers that picked it up just before
+        if self._previous is not None:
+            self._remove(self._previous)
+        self._previous = self.pool
+        self.pool = ConnectionPool(path, max_size=self.pool_size, connect=open_snapshot_connection)
+        if self._previous is not None:
+            self._previous.close()
+        self.taken_at = start
+        self.refreshes += 1
+        self.last_refresh_seconds = time.monotonic() - start
+
+    def _remove(self, pool):
+        pool.close()
+        try:
+            os.remove(pool.database)
+        except OSError:
+            pass  # still open somewhere on platforms that lock open files
+
+    def acquire(self):
+        """A (pool, connection) pair from a fresh-enough snapshot, or None to read the primary"""
+        if not self.is_fresh():
+            if not self._refresh_lock.acquire(blocking=False):
+                return None
+            try:
+                if not self.is_fresh():
+                    self.refresh()
+            finally:
+                self._refresh_lock.release()
+        pool = self.pool
+        return pool, pool.acquire()
+
+    def close(self):
+        for pool in (self._previous, self.pool):
+            if pool is not None:
+                self._remove(pool)
+        self.pool = self._previous = None
+
+    def stats(self):
+        age = self.age()
+        return {
+            'snapshot_age_seconds': None if age is None else round(age, 3),
+            'max_staleness_seconds': self.max_staleness,
+            'refreshes': self.refreshes,
+            'last_refresh_ms': round(self.last_refresh_seconds * 1000, 3),
+            'pool': self.pool.stats() if self.pool is not None else None,
+        }
+
+
+class ReadRouter:
+    """Hands read-only handlers a connection according to the configured mode"""
+
+    def __init__(self, database, mode='primary', max_staleness=5.0, pool_size=8, snapshot_dir=None):
+        if mode not in READ_MODES:
+            raise ValueError(f'DB_READ_MODE must be one of {", ".join(READ_MODES)}, not {mode!r}')
+        self.database = database
+        self.mode = mode
+        self.fallbacks = 0
+        self._pool = None
+        self._snapshots = None
+        if mode == 'readonly':
+            self._pool = ConnectionPool(database, max_size=pool_size, connect=open_readonly_connection)
+        elif mode == 'snapshot':
+            self._snapshots = SnapshotStore(database, max_staleness, pool_size, snapshot_dir)
+
+    def acquire(self):
+        """A (pool, connection) pair to read from, or None when reads should use the primary"""
+        if self._pool is not None:
+            return self._pool, self._pool.acquire()
+        if self._snapshots is not None:
+            routed = self._snapshots.acquire()
+            if routed is None:
+                self.fallbacks += 1
+            return routed
+        return None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+        if self._snapshots is not None:
+            self._snapshots.close()
+
+    def stats(self):
+        stats = {'mode': self.mode, 'primary_fallbacks': self.fallbacks}
+        if self._pool is not None:
+            stats['pool'] = self._pool.stats()
+        if self._snapshots is not None:
+            stats.update(self._snapshots.stats())
+        return stats
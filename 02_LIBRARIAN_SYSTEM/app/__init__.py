@@ -5,6 +5,18 @@ from flask_jwt_extended import JWTManager
 from flask_wtf.csrf import CSRFProtect
 from flask_restful import Api
 import os
+import sys
+
+# The connection factory, user data versions and book change log shared with the mobile backend
+# live in 03_SHARED_RESOURCES
+SHARED_RESOURCES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '03_SHARED_RESOURCES'
+)
+if SHARED_RESOURCES_DIR not in sys.path:
+    sys.path.append(SHARED_RESOURCES_DIR)
+import shared_db
+import user_versions
+import book_changes
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -34,11 +46,15 @@ def create_app():
     
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, render_as_batch=True)
     jwt.init_app(app)
     csrf.init_app(app)
     api.init_app(app)
     
+    # WAL, busy timeout and BEGIN IMMEDIATE support on the shared database
+    with app.app_context():
+        shared_db.configure_engine(db.engine)
+    
     # Register blueprints
     from .routes.web_routes import web_bp
     from .routes.api_routes import api_bp
@@ -53,5 +69,32 @@ def create_app():
     # Create tables
     with app.app_context():
         db.create_all()
+        
+        # Per-user data versions behind the mobile endpoints' ETags, and the
+        # book change log behind the mobile catalogue sync
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as connection:
+                user_versions.install(connection.connection)
+                book_changes.install(connection.connection)
+    
+    # Full-text catalogue search index (SQLite FTS5)
+    from . import search
+    search.init_app(app)
+    
+    # Barcode/ISBN lookup cache for the scan endpoints
+    from . import scan_cache
+    scan_cache.init_app(app)
+    
+    # Rendered barcode labels on disk
+    from . import label_cache
+    label_cache.init_app(app)
+    
+    # Latest scans per station, shared across workers
+    from . import state_store
+    state_store.init_app(app)
+    
+    # Per-station scan events pushed to dashboards
+    from . import scan_events
+    scan_events.init_app(app)
     
     return app
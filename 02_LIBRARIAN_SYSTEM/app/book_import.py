@@ -0,0 +1,320 @@
+"""
+Bulk catalogue import from CSV or JSON Lines, behind ``flask import-books``
+and ``POST /api/books/import``.
+
+Records are streamed from the input and inserted a batch at a time, one
+``executemany`` per batch and each batch its own ``BEGIN IMMEDIATE``
+transaction, so a 300k-row export is never held in memory and issue/return
+writes get the lock between batches. Existing ISBNs and barcodes and the
+category name -> id map are loaded once up front and rows are checked
+against them (and against earlier rows of the same input) in Python, so
+the database only sees rows that will insert. Unknown categories are
+created in the batch that first uses them.
+
+Each record needs ``title``, ``author`` and ``category`` (a name) or
+``category_id``; ``publisher``, ``isbn``, ``barcode_id`` and
+``total_copies`` (default 1) are optional. ISBNs are stored without dashes
+or spaces, as scanners read them.
+
+Each batch also writes its books_fts rows and book_changes entries (with
+the per-row insert triggers set aside, see _insert_batch) and bumps
+library_stats as record_book_added() does, so search, the mobile sync and
+the dashboard are current as each batch commits. At the end the scan cache
+is cleared and the typo index dropped, to be rebuilt by the next fuzzy
+search rather than grown word by word.
+"""
+
+import csv
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+from . import db, book_changes
+from .models import Book, Category
+from .scan_cache import book_lookup_cache
+from .search import BOOKS_FTS_INDEX_INSERTED, book_index
+from .utils import bump_library_stats, write_transaction
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Longest value each field may hold, as the book form enforces
+FIELD_LIMITS = {'title': 200, 'author': 100, 'publisher': 100, 'isbn': 20, 'barcode_id': 50, 'category': 50}
+
+# Rejects kept on the report; the rest are only counted (and passed to on_reject)
+MAX_REPORTED_REJECTS = 1000
+
+CONFLICT_REASON = 'isbn or barcode_id added by someone else during the import'
+
+# Per-row insert triggers on books, each with the statement doing its work for a whole
+# batch given the largest book id before the batch
+BATCH_TRIGGERS = {
+    'books_fts_after_insert': BOOKS_FTS_INDEX_INSERTED,
+    'book_changes_after_insert': book_changes.BOOK_CHANGES_RECORD_INSERTED,
+}
+
+INSERT_BOOK_SQL = """
+    INSERT INTO books (title, author, publisher, isbn, barcode_id, category_id,
+                       total_copies, available_copies, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class ImportReport:
+    """Running totals of one import"""
+
+    def __init__(self):
+        self.read = self.imported = self.rejected = self.categories_created = 0
+        self.rejects = []   # (line, reason), the first MAX_REPORTED_REJECTS
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append((line, reason))
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'read': self.read,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'categories_created': self.categories_created,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second),
+            'rejects': [{'line': line, 'reason': reason} for line, reason in self.rejects],
+        }
+
+
+def format_for_name(name):
+    """``jsonl`` for .jsonl/.ndjson/.json file names, else ``csv``"""
+    return 'jsonl' if name and name.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_records(stream, fmt):
+    """``(line, record, error)`` for each record of a text stream; ``record`` is None when ``error`` is set"""
+    if fmt == 'csv':
+        reader = csv.reader(stream)
+        header = [name.strip().lower().replace(' ', '_') for name in next(reader, [])]
+        for values in reader:
+            if not values:
+                continue
+            if len(values) > len(header):
+                yield reader.line_num, None, 'more fields than the header'
+            else:
+                yield reader.line_num, dict(zip(header, values)), None
+        return
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield line, None, 'invalid JSON'
+            continue
+        if isinstance(record, dict):
+            yield line, record, None
+        else:
+            yield line, None, 'not a JSON object'
+
+
+def _text(record, field):
+    value = record.get(field)
+    if value is None:
+        return None
+    value = value.strip() if isinstance(value, str) else str(value).strip()
+    if len(value) > FIELD_LIMITS[field]:
+        raise ValueError(f'{field} longer than {FIELD_LIMITS[field]} characters')
+    return value or None
+
+
+class _Catalogue:
+    """What rows are checked against: existing codes and categories, plus those of rows accepted so far"""
+
+    def __init__(self):
+        self.isbns = set(db.session.execute(db.select(Book.isbn).where(Book.isbn.isnot(None))).scalars())
+        self.barcodes = set(db.session.execute(
+            db.select(Book.barcode_id).where(Book.barcode_id.isnot(None))).scalars())
+        self.category_ids = {}   # casefolded name -> id
+        for category_id, name in db.session.execute(db.select(Category.id, Category.name)):
+            self.category_ids.setdefault(name.casefold(), category_id)
+        self.known_ids = set(self.category_ids.values())
+        self.new_categories = {}   # casefolded name -> name, created with the next batch
+        db.session.rollback()
+
+    def row(self, record):
+        """The books row for a record, or raises ValueError with the reason it is rejected.
+
+        A new category stays as its casefolded name until the batch creates it.
+        """
+        title = _text(record, 'title')
+        author = _text(record, 'author')
+        if not title or not author:
+            raise ValueError('title and author are required')
+        publisher = _text(record, 'publisher')
+        isbn = _text(record, 'isbn')
+        if isbn:
+            isbn = isbn.replace('-', '').replace(' ', '')
+        barcode_id = _text(record, 'barcode_id')
+
+        copies = record.get('total_copies')
+        if copies in (None, ''):
+            copies = 1
+        try:
+            copies = int(copies)
+        except (TypeError, ValueError):
+            raise ValueError('total_copies must be a whole number') from None
+        if copies < 1:
+            raise ValueError('total_copies must be at least 1')
+
+        category_id = record.get('category_id')
+        new_category = None
+        if category_id not in (None, ''):
+            try:
+                category = int(category_id)
+            except (TypeError, ValueError):
+                raise ValueError('category_id must be a whole number') from None
+            if category not in self.known_ids:
+                raise ValueError(f'no category with id {category}')
+        else:
+            name = _text(record, 'category')
+            if not name:
+                raise ValueError('category or category_id is required')
+            key = name.casefold()
+            category = self.category_ids.get(key)
+            if category is None:
+                category, new_category = key, name
+
+        # Only checked once the row is otherwise valid, so a reject never claims a code or creates a category
+        if isbn and isbn in self.isbns:
+            raise ValueError(f'duplicate isbn {isbn}')
+        if barcode_id and barcode_id in self.barcodes:
+            raise ValueError(f'duplicate barcode_id {barcode_id}')
+        if isbn:
+            self.isbns.add(isbn)
+        if barcode_id:
+            self.barcodes.add(barcode_id)
+        if new_category is not None:
+            self.new_categories.setdefault(category, new_category)
+        return [title, author, publisher, isbn, barcode_id, category, copies]
+
+
+@write_transaction
+def _insert_batch(rows, new_categories):
+    """Insert one batch of rows (and the categories it introduces) in one transaction.
+
+    Returns ``(inserted, conflicts, category_ids)``: the ``(line, row)`` pairs
+    inserted, the lines of rows whose ISBN or barcode was written by someone
+    else since the import started, and ``{casefolded name: id}`` of the new
+    categories.
+    """
+    cursor = db.session.connection().connection.cursor()
+    category_ids = {}
+    for key, name in new_categories.items():
+        cursor.execute('INSERT INTO categories (name, created_at) VALUES (?, ?) ON CONFLICT (name) DO NOTHING',
+                       (name, _now()))
+        category_ids[key] = cursor.execute('SELECT id FROM categories WHERE name = ?', (name,)).fetchone()[0]
+
+    now = _now()
+    params = []
+    for _, row in rows:
+        category = row[5]
+        if isinstance(category, str):
+            category = category_ids[category]
+        params.append((*row[:5], category, row[6], row[6], now, now))
+
+    # The FTS and change log triggers cost more per row than the insert itself, so they are
+    # dropped for the batch and their work done set-based; the write lock is held throughout,
+    # so no other connection ever writes books without them
+    triggers = dict(cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+        % ', '.join('?' * len(BATCH_TRIGGERS)), tuple(BATCH_TRIGGERS)).fetchall())
+    for name in triggers:
+        cursor.execute(f'DROP TRIGGER {name}')
+    last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM books').fetchone()[0]
+
+    inserted, conflicts = rows, []
+    cursor.execute('SAVEPOINT book_import')
+    try:
+        cursor.executemany(INSERT_BOOK_SQL, params)
+    except sqlite3.IntegrityError:
+        # Redo the batch row by row to find the conflicting rows
+        cursor.execute('ROLLBACK TO book_import')
+        inserted = []
+        for (line, row), values in zip(rows, params):
+            try:
+                cursor.execute(INSERT_BOOK_SQL, values)
+                inserted.append((line, row))
+            except sqlite3.IntegrityError:
+                conflicts.append(line)
+    cursor.execute('RELEASE book_import')
+
+    for name, ddl in triggers.items():
+        cursor.execute(BATCH_TRIGGERS[name], (last_id,))
+        cursor.execute(ddl)
+
+    copies = sum(row[6] for _, row in inserted)
+    bump_library_stats(total_books=len(inserted), total_copies=copies, available_copies=copies)
+    db.session.commit()
+    return inserted, conflicts, category_ids
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def import_books(stream, fmt='csv', batch_size=5000, on_progress=None, on_reject=None):
+    """Import every record of a text stream; returns the ImportReport.
+
+    ``on_progress(report)`` is called after each batch commits and
+    ``on_reject(line, reason, record)`` for every rejected record. A batch
+    that fails for any other reason stops the import with the earlier
+    batches committed.
+    """
+    report = ImportReport()
+    catalogue = _Catalogue()
+    batch = []
+
+    def flush():
+        inserted, conflicts, category_ids = _insert_batch(batch, catalogue.new_categories)
+        for line in conflicts:
+            report.reject(line, CONFLICT_REASON)
+            if on_reject is not None:
+                on_reject(line, CONFLICT_REASON, None)
+        report.imported += len(inserted)
+        report.categories_created += len(category_ids)
+        for key, category_id in category_ids.items():
+            catalogue.category_ids[key] = category_id
+            catalogue.known_ids.add(category_id)
+        catalogue.new_categories.clear()
+        batch.clear()
+        report.seconds = time.perf_counter() - report.started
+        if on_progress is not None:
+            on_progress(report)
+
+    try:
+        for line, record, error in read_records(stream, fmt):
+            report.read += 1
+            if error is None:
+                try:
+                    batch.append((line, catalogue.row(record)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                report.reject(line, error)
+                if on_reject is not None:
+                    on_reject(line, error, record)
+            elif len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        report.seconds = time.perf_counter() - report.started
+        if report.imported:
+            book_lookup_cache.clear()
+            book_index.invalidate()
+    return report
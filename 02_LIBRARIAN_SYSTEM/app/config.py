@@ -6,6 +6,7 @@ from datetime import timedelta
 # We need to go up 2 levels to get to the root, then into 03_SHARED_RESOURCES
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 SHARED_DB_PATH = os.path.join(BASE_DIR, '03_SHARED_RESOURCES', 'instance', 'pustak_tracker.db')
+DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{SHARED_DB_PATH}')
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'supersecret-key-change-in-production')
@@ -13,6 +14,23 @@ class Config:
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     FINE_RATE = int(os.getenv('FINE_RATE', 5))  # Rs per day
+    SEARCH_FUZZY_MAX_DISTANCE = int(os.getenv('SEARCH_FUZZY_MAX_DISTANCE', 2))  # Typos tolerated per word
+    SEARCH_FUZZY_MAX_RESULTS = 50
+    SEARCH_FUZZY_MAX_WORDS = 500000  # Vocabulary cap for the in-memory typo index
+    BOOK_LOOKUP_CACHE_SIZE = int(os.getenv('BOOK_LOOKUP_CACHE_SIZE', 4096))  # Scanned barcode/ISBN entries
+    BOOK_LOOKUP_CACHE_TTL = float(os.getenv('BOOK_LOOKUP_CACHE_TTL', 300))  # Seconds
+    STATE_STORE_BACKEND = os.getenv('STATE_STORE_BACKEND', 'sqlite')  # 'sqlite' (shared by all workers) or 'memory'
+    STATE_STORE_MAX_ENTRIES = int(os.getenv('STATE_STORE_MAX_ENTRIES', 100000))
+    SCAN_STATE_TTL = 24 * 3600  # Seconds a station's latest scan is kept
+    SCAN_STREAM_POLL_INTERVAL = 1.0  # Seconds between checks for scans posted to other workers
+    SCAN_STREAM_REPLAY_SIZE = 50  # Recent scans per station kept for Last-Event-ID replay
+    SCAN_STREAM_QUEUE_SIZE = 32  # Undelivered scans before a slow subscriber is dropped
+    SCAN_STREAM_HEARTBEAT = 15.0  # Seconds between keepalive comments
+    SCAN_STREAM_MAX_SECONDS = float(os.getenv('SCAN_STREAM_MAX_SECONDS', 300))  # Stream lifetime before the browser reconnects
+    BOOK_IMPORT_BATCH_SIZE = int(os.getenv('BOOK_IMPORT_BATCH_SIZE', 5000))  # Rows per executemany and transaction
+    LABEL_CACHE_DIR = os.getenv('LABEL_CACHE_DIR')  # Rendered labels; default instance/label_cache
+    LABEL_CACHE_MAX_BYTES = int(os.getenv('LABEL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    LABEL_CACHE_MAX_AGE = 300  # Seconds browsers reuse a label before revalidating its ETag
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
@@ -21,8 +39,8 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
-    SQLALCHEMY_DATABASE_URI = f'sqlite:///{SHARED_DB_PATH}'
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
 
 class ProductionConfig(Config):
     DEBUG = False
-    SQLALCHEMY_DATABASE_URI = f'sqlite:///{SHARED_DB_PATH}'
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
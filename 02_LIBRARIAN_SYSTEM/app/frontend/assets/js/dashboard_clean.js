@@ -2,8 +2,20 @@
 
 let currentScanData = null;
 let scanPollingInterval = null;
+let scanEventSource = null;
 let lastScanTimestamp = 0;
 
+// Scans are scoped to this tab: the scanner link carries the station id and
+// the scanner posts it back with every scan
+function getScanStation() {
+    let station = sessionStorage.getItem('scanStation');
+    if (!station) {
+        station = 'st-' + Math.random().toString(36).slice(2, 12);
+        sessionStorage.setItem('scanStation', station);
+    }
+    return station;
+}
+
 function startIssueProcess() {
     console.log('Issue process started');
     
@@ -20,7 +32,7 @@ function startIssueProcess() {
             console.log('Issue modal fully shown - elements should be accessible');
             
             // Set scanner URL
-            const scannerUrl = generateScannerUrl() + '?mode=issue';
+            const scannerUrl = generateScannerUrl() + '?mode=issue&station=' + encodeURIComponent(getScanStation());
             const scannerLink = document.getElementById('issue-scanner-link');
             if (scannerLink) {
                 scannerLink.href = scannerUrl;
@@ -30,6 +42,9 @@ function startIssueProcess() {
             startScanPolling('issue');
         }, { once: true }); // Use once: true to prevent multiple listeners
         
+        // Close the scan stream when the modal is dismissed without a scan
+        modalElement.addEventListener('hidden.bs.modal', stopScanUpdates, { once: true });
+        
         modal.show();
     } catch (error) {
         console.error('Error opening modal:', error);
@@ -42,7 +57,54 @@ function generateScannerUrl() {
     return `https://${hostname}:9000/scanner`;
 }
 
+function stopScanUpdates() {
+    if (scanEventSource) {
+        scanEventSource.close();
+        scanEventSource = null;
+    }
+    if (scanPollingInterval) {
+        clearInterval(scanPollingInterval);
+        scanPollingInterval = null;
+    }
+}
+
+// Scans are pushed over server-sent events; polling is the fallback for
+// browsers without EventSource or when the stream cannot be opened
 function startScanPolling(mode) {
+    stopScanUpdates();
+    if (!window.EventSource) {
+        startIntervalPolling(mode);
+        return;
+    }
+    
+    const source = new EventSource('/api/scan-stream?station=' + encodeURIComponent(getScanStation()));
+    scanEventSource = source;
+    let opened = false;
+    
+    source.onopen = () => { opened = true; };
+    source.addEventListener('scan', (event) => {
+        const scanData = JSON.parse(event.data);
+        // Replayed scans from before this scan step started are ignored
+        if (scanData && scanData.timestamp > lastScanTimestamp) {
+            lastScanTimestamp = scanData.timestamp;
+            processScanResult(scanData, mode);
+        }
+    });
+    source.onerror = () => {
+        // The browser reconnects by itself (resuming from Last-Event-ID) once a
+        // stream has worked; if it never opened, switch to polling
+        if (!opened || source.readyState === EventSource.CLOSED) {
+            console.warn('Scan stream unavailable, falling back to polling');
+            source.close();
+            if (scanEventSource === source) {
+                scanEventSource = null;
+                startIntervalPolling(mode);
+            }
+        }
+    };
+}
+
+function startIntervalPolling(mode) {
     if (scanPollingInterval) {
         clearInterval(scanPollingInterval);
     }
@@ -51,7 +113,7 @@ function startScanPolling(mode) {
 
 async function checkForNewScan(mode) {
     try {
-        const response = await fetch('/api/latest-scan');
+        const response = await fetch('/api/latest-scan?station=' + encodeURIComponent(getScanStation()));
         if (response.ok) {
             const scanData = await response.json();
             console.log('Polling result:', scanData);
@@ -74,7 +136,7 @@ async function checkForNewScan(mode) {
 
 function processScanResult(scanData, mode) {
     currentScanData = scanData;
-    clearInterval(scanPollingInterval);
+    stopScanUpdates();
     
     if (mode === 'issue') {
         // Use a small delay to ensure modal elements are accessible
@@ -302,7 +364,7 @@ function startReturnProcess() {
             console.log('Return modal fully shown - elements should be accessible');
             
             // Set scanner URL
-            const scannerUrl = generateScannerUrl() + '?mode=return';
+            const scannerUrl = generateScannerUrl() + '?mode=return&station=' + encodeURIComponent(getScanStation());
             const scannerLink = document.getElementById('return-scanner-link');
             if (scannerLink) {
                 scannerLink.href = scannerUrl;
@@ -312,6 +374,9 @@ function startReturnProcess() {
             startScanPolling('return');
         }, { once: true }); // Use once: true to prevent multiple listeners
         
+        // Close the scan stream when the modal is dismissed without a scan
+        modalElement.addEventListener('hidden.bs.modal', stopScanUpdates, { once: true });
+        
         modal.show();
     } catch (error) {
         console.error('Error opening modal:', error);
@@ -0,0 +1,150 @@
+"""
+Content-addressed disk cache of rendered book labels.
+
+A label's key is a hash of everything that goes into drawing it: the
+format, the render parameters, ``LABEL_VERSION`` and the book's barcode_id,
+title and author. An edit to the book therefore changes the key, old files
+are simply never asked for again, and nothing has to be invalidated. The
+key doubles as the response's ETag.
+
+Files live under ``LABEL_CACHE_DIR`` as ``<key[:2]>/<key>.<format>``. A hit
+bumps the file's mtime, so mtime order is recency order; once the
+directory grows past ``LABEL_CACHE_MAX_BYTES`` it is scanned and the least
+recently used files are deleted down to 90% of the cap. Each process keeps
+its own running estimate of the size, so with several workers the cap can
+be overshot by what the other workers wrote since this one last scanned;
+every scan corrects the estimate.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from .labels import LABEL_VERSION
+
+# Eviction deletes down to this fraction of the cap, so it does not run on every write
+LOW_WATER = 0.9
+
+
+def label_key(fmt, barcode_id, title, author, scale=1):
+    return hashlib.sha256(
+        json.dumps([LABEL_VERSION, fmt, scale, barcode_id, title, author]).encode('utf-8')
+    ).hexdigest()
+
+
+class LabelCache:
+    """Size-capped directory of label files, evicted least recently used first"""
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None   # bytes on disk, unknown until the first scan
+        self.hits = self.misses = self.evictions = 0
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def get(self, key, fmt):
+        """Path of the cached file, marked as just used, or None"""
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, fmt, data):
+        """Store ``data`` under ``key`` and return its path"""
+        path = self.path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers only ever see complete files
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _files(self):
+        """``(mtime, size, path)`` of every cached file"""
+        files = []
+        try:
+            shards = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:   # evicted by another worker
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self, keep):
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * LOW_WATER
+        for _, size, path in files:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+label_cache = LabelCache()
+
+
+def init_app(app):
+    """Point the cache at ``LABEL_CACHE_DIR`` (default: the instance folder) and size it from the config"""
+    label_cache.directory = (app.config.get('LABEL_CACHE_DIR')
+                             or os.path.join(app.instance_path, 'label_cache'))
+    label_cache.max_bytes = app.config.get('LABEL_CACHE_MAX_BYTES', label_cache.max_bytes)
@@ -0,0 +1,104 @@
+"""
+Layout of the 400x300 book label, shared by ``barcode_generator.py`` and
+the on-demand ``/barcode/<barcode_id>.png`` route.
+
+PNG labels are drawn with PIL at ``scale`` times the base size (for
+printers that want more dots per label); SVG labels use the same geometry
+in user units, so both formats line up with each other and with the PNGs
+``barcode_generator.py`` writes.
+"""
+
+import html
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .code128 import QUIET_ZONE, bar_runs, code128_modules, draw_code128, fit_module_width, symbol_width
+
+LABEL_WIDTH, LABEL_HEIGHT = 400, 300
+LABEL_BARCODE_WIDTH, LABEL_BARCODE_HEIGHT = 350, 100  # Room for the bars, quiet zones included
+LABEL_BARCODE_Y = 50
+# Bump when the label layout changes so incremental runs and cached labels are redrawn
+LABEL_VERSION = 2
+LABEL_MAX_SCALE = 4
+FOOTER = "Pustak Tracker Library"
+
+
+def load_fonts(size, small_size):
+    try:
+        return ImageFont.truetype("arial.ttf", size), ImageFont.truetype("arial.ttf", small_size)
+    except OSError:
+        return ImageFont.load_default(), ImageFont.load_default()
+
+
+def label_template(small_font, scale=1):
+    """Blank label with the parts every book shares already drawn"""
+    template = Image.new('RGB', (LABEL_WIDTH * scale, LABEL_HEIGHT * scale), 'white')
+    ImageDraw.Draw(template).text((10 * scale, (LABEL_HEIGHT - 30) * scale), FOOTER, fill="blue", font=small_font)
+    return template
+
+
+@lru_cache(maxsize=LABEL_MAX_SCALE)
+def label_assets(scale=1):
+    """``(template, font, small_font)`` for labels drawn at ``scale``, loaded once per process"""
+    font, small_font = load_fonts(14 * scale, 10 * scale)
+    return label_template(small_font, scale), font, small_font
+
+
+def _label_text(title, author):
+    title_text = title[:35] + "..." if len(title) > 35 else title
+    author_text = f"by {author[:30]}..." if len(author) > 30 else f"by {author}"
+    return title_text, author_text
+
+
+def _barcode_geometry(modules, scale):
+    """``(x, module width)`` of the bars centred on a label drawn at ``scale``"""
+    module_width = fit_module_width(modules, LABEL_BARCODE_WIDTH * scale)
+    return (LABEL_WIDTH * scale - symbol_width(modules) * module_width) // 2, module_width
+
+
+def render_label(barcode_id, title, author, template, font, small_font, scale=1):
+    """The label image of one book; ``template`` and the fonts must be drawn at ``scale``"""
+    img = template.copy()
+    draw = ImageDraw.Draw(img)
+
+    # Code128 bars drawn straight onto the label at a whole number of pixels per module
+    modules = code128_modules(barcode_id)
+    barcode_x, module_width = _barcode_geometry(modules, scale)
+    barcode_y = LABEL_BARCODE_Y * scale
+    draw_code128(draw, barcode_x, barcode_y, modules, module_width, LABEL_BARCODE_HEIGHT * scale)
+
+    # Book title and author (truncated)
+    title_text, author_text = _label_text(title, author)
+    draw.text((10 * scale, 10 * scale), title_text, fill="black", font=font)
+    draw.text((10 * scale, 30 * scale), author_text, fill="gray", font=small_font)
+
+    # Barcode ID below barcode, in line with the first bar
+    text_y = barcode_y + (LABEL_BARCODE_HEIGHT + 10) * scale
+    draw.text((barcode_x + QUIET_ZONE * module_width, text_y), barcode_id, fill="black", font=font)
+    return img
+
+
+def label_svg(barcode_id, title, author):
+    """The label of one book as a standalone SVG, laid out like ``render_label`` at scale 1"""
+    modules = code128_modules(barcode_id)
+    barcode_x, module_width = _barcode_geometry(modules, 1)
+    left = barcode_x + QUIET_ZONE * module_width
+    bars = ''.join(f'<rect x="{left + start * module_width}" y="{LABEL_BARCODE_Y}" '
+                   f'width="{run * module_width}" height="{LABEL_BARCODE_HEIGHT}"/>'
+                   for start, run in bar_runs(modules))
+    title_text, author_text = _label_text(title, author)
+
+    def text(x, y, value, size, fill):
+        return (f'<text x="{x}" y="{y}" font-size="{size}" fill="{fill}" dominant-baseline="hanging">'
+                f'{html.escape(value, quote=False)}</text>')
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {LABEL_WIDTH} {LABEL_HEIGHT}" '
+        f'width="{LABEL_WIDTH}" height="{LABEL_HEIGHT}" font-family="Arial, sans-serif">'
+        f'<rect width="100%" height="100%" fill="white"/>'
+        f'{text(10, 10, title_text, 14, "black")}{text(10, 30, author_text, 10, "gray")}'
+        f'<g fill="black" shape-rendering="crispEdges">{bars}</g>'
+        f'{text(left, LABEL_BARCODE_Y + LABEL_BARCODE_HEIGHT + 10, barcode_id, 14, "black")}'
+        f'{text(10, LABEL_HEIGHT - 30, FOOTER, 10, "blue")}</svg>'
+    )
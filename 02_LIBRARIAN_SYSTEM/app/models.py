@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
 
@@ -65,6 +66,12 @@ class Book(db.Model):
     total_copies = db.Column(db.Integer, default=1)
     available_copies = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Also set by Core updates such as the issue/return available_copies changes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_books_title_id', 'title', 'id'),  # Keyset pagination order
+    )
     
     # Relationships
     transactions = db.relationship('Transaction', backref='book', lazy=True)
@@ -82,7 +89,8 @@ class Book(db.Model):
             'category_name': self.category.name if self.category else None,
             'total_copies': self.total_copies,
             'available_copies': self.available_copies,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'updated_at': (self.updated_at or self.created_at).isoformat()
         }
     
     def is_available(self):
@@ -99,8 +107,22 @@ class Transaction(db.Model):
     return_date = db.Column(db.DateTime)
     fine_amount = db.Column(db.Float, default=0.0)
     status = db.Column(db.String(20), default='issued')  # 'issued', 'returned', 'overdue'
+    fines_computed_through = db.Column(db.DateTime)  # Last overdue day boundary fine_amount covers
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_transactions_status_due_date', 'status', 'due_date'),
+        db.Index('ix_transactions_user_id_status', 'user_id', 'status'),
+        db.Index('ix_transactions_book_id_status', 'book_id', 'status'),
+        db.Index('ix_transactions_issue_date', 'issue_date'),
+        db.Index('ix_transactions_return_date', 'return_date'),
+        db.Index('ix_transactions_created_at', 'created_at'),
+        # At most one active loan per user and book
+        db.Index('ux_transactions_active_loan', 'user_id', 'book_id', unique=True,
+                 sqlite_where=db.text("status IN ('issued', 'overdue')"),
+                 postgresql_where=db.text("status IN ('issued', 'overdue')")),
+    )
+    
     def __init__(self, **kwargs):
         super(Transaction, self).__init__(**kwargs)
         if not self.due_date:
@@ -121,19 +143,42 @@ class Transaction(db.Model):
                 overdue_days = (datetime.utcnow() - self.due_date).days
                 self.fine_amount = overdue_days * fine_rate
                 self.status = 'overdue'
+                self.fines_computed_through = self.due_date + timedelta(days=overdue_days)
             else:
                 self.fine_amount = 0.0
         
         return self.fine_amount
     
+    def is_active_loan(self):
+        return self.status in ('issued', 'overdue')
+    
+    @property
+    def current_status(self):
+        """Status as of now, without waiting for the scheduled fine run"""
+        if self.is_active_loan() and datetime.utcnow() > self.due_date:
+            return 'overdue'
+        return self.status
+    
+    @property
+    def accrued_fine(self):
+        """Fine owed as of now, computed on the fly without writing anything"""
+        if not self.is_active_loan():
+            return self.fine_amount or 0.0
+        now = datetime.utcnow()
+        if now <= self.due_date:
+            return 0.0
+        fine_rate = current_app.config.get('FINE_RATE', 5)
+        return float((now - self.due_date).days * fine_rate)
+    
     def return_book(self):
         """Mark book as returned and calculate fine"""
         self.return_date = datetime.utcnow()
         self.calculate_fine()
         self.status = 'returned'
         
-        # Update book availability
-        self.book.available_copies += 1
+        # Update book availability in SQL (available_copies + 1), so concurrent
+        # returns of the same title cannot overwrite each other's increment
+        self.book.available_copies = Book.available_copies + 1
     
     def to_dict(self):
         return {
@@ -145,8 +190,8 @@ class Transaction(db.Model):
             'issue_date': self.issue_date.isoformat(),
             'due_date': self.due_date.isoformat(),
             'return_date': self.return_date.isoformat() if self.return_date else None,
-            'fine_amount': self.fine_amount,
-            'status': self.status,
+            'fine_amount': self.accrued_fine,
+            'status': self.current_status,
             'created_at': self.created_at.isoformat()
         }
 
@@ -160,6 +205,11 @@ class Reservation(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, cancelled, fulfilled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_reservations_book_id_status', 'book_id', 'status'),
+        db.Index('ix_reservations_user_id_status', 'user_id', 'status'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -168,3 +218,76 @@ class Reservation(db.Model):
             'status': self.status,
             'created_at': self.created_at.isoformat(),
         }
+
+
+class Notification(db.Model):
+    """Mobile app notification, written by app/notifications.py and shared with the mobile backend"""
+    __tablename__ = 'notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    type = db.Column(db.Text, nullable=False)  # overdue, reminder, reservation
+    seen = db.Column(db.Boolean, nullable=False, default=False, server_default=db.text('0'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
+    dedupe_key = db.Column(db.String(100))  # e.g. 'overdue:<transaction id>'; one row per user and key
+
+    __table_args__ = (
+        db.Index('ux_notifications_user_dedupe_key', 'user_id', 'dedupe_key', unique=True),
+        db.Index('ix_notifications_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_notifications_user_seen_created_at', 'user_id', 'seen', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'body': self.body,
+            'type': self.type,
+            'seen': self.seen,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class LibraryStats(db.Model):
+    """Materialized dashboard counters (single row, id=1), kept current by the write paths"""
+    __tablename__ = 'library_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    total_books = db.Column(db.Integer, nullable=False, default=0)
+    total_copies = db.Column(db.Integer, nullable=False, default=0)
+    available_copies = db.Column(db.Integer, nullable=False, default=0)
+    issued_count = db.Column(db.Integer, nullable=False, default=0)
+    overdue_count = db.Column(db.Integer, nullable=False, default=0)
+    total_fines = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'total_books': self.total_books,
+            'total_copies': self.total_copies,
+            'available_copies': self.available_copies,
+            'issued_count': self.issued_count,
+            'overdue_count': self.overdue_count,
+            'total_fines': self.total_fines,
+        }
+
+
+class CategoryStats(db.Model):
+    """Materialized borrow count per category for the dashboard"""
+    __tablename__ = 'category_stats'
+
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    borrow_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StateEntry(db.Model):
+    """Shared key/value state for the API (see app/state_store.py); values are JSON text"""
+    __tablename__ = 'state_entries'
+
+    namespace = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    value = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.Float, index=True)  # Unix time; NULL never expires
+    updated_at = db.Column(db.Float, nullable=False)
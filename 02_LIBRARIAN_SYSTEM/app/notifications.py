@@ -0,0 +1,135 @@
+"""
+Persisted notifications for the mobile app.
+
+Rows live in the ``notifications`` table shared with the mobile backend and
+are written ahead of time instead of being rebuilt on every poll:
+
+- the issue, return and reservation paths call the ``on_*`` hooks below;
+- ``flask generate-notifications`` (run from cron) adds overdue and due-soon
+  notices for loans whose due date has come close since the last run.
+
+Each row carries a ``dedupe_key`` such as ``overdue:<transaction id>``,
+unique per user, so running the generator again or racing a hook never
+writes the same notice twice. None of these functions commit.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import Book, Notification, Reservation, Transaction
+
+REMINDER_DAYS = 3  # Due-soon reminders go out this many days ahead
+RESERVATION_HOLD_DAYS = 3
+
+
+def _overdue(transaction_id, user_id, title):
+    return {
+        'user_id': user_id,
+        'dedupe_key': f'overdue:{transaction_id}',
+        'type': 'overdue',
+        'title': 'Overdue Book',
+        'body': f"'{title}' is overdue. Please return it as soon as possible.",
+    }
+
+
+def _reminder(transaction_id, user_id, title, days_left):
+    return {
+        'user_id': user_id,
+        'dedupe_key': f'reminder:{transaction_id}',
+        'type': 'reminder',
+        'title': 'Return Reminder',
+        'body': f"'{title}' is due in {days_left} day(s).",
+    }
+
+
+def _reservation(reservation_id, user_id, title):
+    return {
+        'user_id': user_id,
+        'dedupe_key': f'reservation:{reservation_id}',
+        'type': 'reservation',
+        'title': 'Reservation Confirmed',
+        'body': f"You reserved '{title or 'a book'}'. We will hold it for {RESERVATION_HOLD_DAYS} days.",
+    }
+
+
+def add_notifications(rows, now=None):
+    """Insert notification dicts, skipping any whose (user, dedupe_key) already exists.
+
+    Returns how many rows were written.
+    """
+    if not rows:
+        return 0
+    now = now or datetime.utcnow()
+    rows = [{'seen': False, 'created_at': now, **row} for row in rows]
+    statement = sqlite_insert(Notification.__table__).on_conflict_do_nothing(
+        index_elements=['user_id', 'dedupe_key'])
+    return db.session.execute(statement, rows).rowcount
+
+
+def _loan_notice(transaction_id, user_id, title, due_date, now):
+    if due_date < now:
+        return _overdue(transaction_id, user_id, title)
+    days_left = (due_date - now).days
+    if days_left <= REMINDER_DAYS:
+        return _reminder(transaction_id, user_id, title, days_left)
+    return None
+
+
+def add_due_notifications(now=None):
+    """Overdue and due-soon notices for every active loan that needs one; returns rows written"""
+    now = now or datetime.utcnow()
+    # ix_transactions_status_due_date: only loans due within the reminder window are read
+    loans = (db.session.query(Transaction.id, Transaction.user_id, Book.title, Transaction.due_date)
+             .join(Book, Book.id == Transaction.book_id)
+             .filter(Transaction.status.in_(['issued', 'overdue']),
+                     Transaction.due_date < now + timedelta(days=REMINDER_DAYS + 1))
+             .all())
+    rows = [notice for notice in (_loan_notice(*loan, now) for loan in loans) if notice]
+    # A loan's overdue notice replaces its due-soon reminder
+    stale = [{'user': user_id, 'key': f'reminder:{transaction_id}'}
+             for transaction_id, user_id, _, due_date in loans if due_date < now]
+    if stale:
+        # One indexed delete per loan (ux_notifications_user_dedupe_key), sent as an executemany
+        db.session.execute(
+            Notification.__table__.delete().where(Notification.user_id == bindparam('user'),
+                                                  Notification.dedupe_key == bindparam('key')),
+            stale,
+        )
+
+    reservations = (db.session.query(Reservation.id, Reservation.user_id, Book.title)
+                    .outerjoin(Book, Book.id == Reservation.book_id)
+                    .filter(Reservation.status == 'pending')
+                    .all())
+    rows.extend(_reservation(*reservation) for reservation in reservations)
+    return add_notifications(rows, now)
+
+
+def on_loan_opened(transaction, book):
+    """A loan that is already due soon (a short custom due date) gets its reminder at once"""
+    now = datetime.utcnow()
+    notice = _loan_notice(transaction.id, transaction.user_id, book.title, transaction.due_date, now)
+    add_notifications([notice] if notice else [], now)
+
+
+def on_loan_closed(transaction):
+    """A returned book's overdue and reminder notices no longer apply"""
+    _delete(transaction.user_id, [f'overdue:{transaction.id}', f'reminder:{transaction.id}'])
+
+
+def on_reservation_created(reservation, book):
+    add_notifications([_reservation(reservation.id, reservation.user_id, book.title if book else None)])
+
+
+def on_reservation_closed(reservation):
+    _delete(reservation.user_id, [f'reservation:{reservation.id}'])
+
+
+def _delete(user_id, dedupe_keys):
+    db.session.execute(
+        db.delete(Notification)
+        .where(Notification.user_id == user_id, Notification.dedupe_key.in_(dedupe_keys))
+        .execution_options(synchronize_session=False)
+    )
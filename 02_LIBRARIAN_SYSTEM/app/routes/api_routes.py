@@ -1,14 +1,24 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from werkzeug.security import check_password_hash
 from marshmallow import Schema, fields, ValidationError
-from ..models import User, Book, Transaction, Category, Reservation
-from ..utils import issue_book, return_book, calculate_overdue_fines, get_dashboard_stats
-from .. import db, csrf
-from datetime import datetime, timedelta
-from collections import defaultdict
-# In-memory storage for tracking read notifications per user session
-user_notification_reads = defaultdict(set)
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+from ..models import User, Book, Transaction, Category, Reservation, Notification
+from ..utils import (issue_book, return_book, get_dashboard_stats, record_book_added,
+                     record_book_removed, record_book_copies_changed, record_book_returned,
+                     record_book_category_changed, issue_books_batch, return_books_batch, BATCH_MODES)
+from ..search import search_books, fuzzy_book_ids
+from ..scan_cache import lookup_book, book_availability, book_lookup_cache
+from ..scan_events import scan_broker, normalize_station, parse_last_event_id, stream_scans
+from ..notifications import on_reservation_created, on_reservation_closed, on_loan_closed
+from ..book_import import IMPORT_FORMATS, format_for_name, import_books
+from .. import db, csrf, shared_db, user_versions, book_changes
+from datetime import datetime, timedelta, timezone
+import base64
+import binascii
+import io
+import json
 
 
 def _serialize_user_for_app(user: User):
@@ -22,11 +32,27 @@ def _serialize_user_for_app(user: User):
     }
 
 
-def _serialize_book_for_app(book: Book):
+# Above this many books, count every pending reservation instead of binding an IN list
+PENDING_COUNT_IN_LIMIT = 500
+
+
+def _pending_reservation_counts(books):
+    """Pending reservation count per book id, from one GROUP BY query."""
+    book_ids = {book.id for book in books if book is not None}
+    if not book_ids:
+        return {}
+    query = db.session.query(Reservation.book_id, func.count(Reservation.id)).filter(
+        Reservation.status == 'pending'
+    )
+    if len(book_ids) <= PENDING_COUNT_IN_LIMIT:
+        query = query.filter(Reservation.book_id.in_(book_ids))
+    return {book_id: count for book_id, count in query.group_by(Reservation.book_id).all()
+            if book_id in book_ids}
+
+
+def _serialize_book_for_app(book: Book, pending_counts):
     """Serialize book data with fields expected by the mobile app."""
-    pending_reservations = Reservation.query.filter_by(
-        book_id=book.id, status='pending'
-    ).count()
+    pending_reservations = pending_counts.get(book.id, 0)
     available = max(0, book.available_copies - pending_reservations)
     return {
         'id': book.id,
@@ -40,19 +66,111 @@ def _serialize_book_for_app(book: Book):
     }
 
 
-def _serialize_transaction_for_app(transaction: Transaction):
+def _serialize_books_for_app(books):
+    """Serialize a list of books with a single reservation count query.
+
+    Load the books with joinedload(Book.category) to keep the category lookup
+    out of the loop.
+    """
+    pending_counts = _pending_reservation_counts(books)
+    return [_serialize_book_for_app(book, pending_counts) for book in books]
+
+
+# Page size bounds for the cursor-paginated mobile book lists
+BOOK_PAGE_DEFAULT_LIMIT = 20
+BOOK_PAGE_MAX_LIMIT = 100
+
+
+def _encode_book_cursor(sort_value, book_id):
+    """Opaque cursor pointing just past the book with this sort key and id."""
+    payload = json.dumps([sort_value, book_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def _decode_book_cursor(cursor, sort_type):
+    """Inverse of _encode_book_cursor; raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, book_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+    if not isinstance(sort_value, sort_type) or not isinstance(book_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_value, book_id
+
+
+def _paginated_books_response(query, rank=None):
+    """List the books matched by ``query`` for the mobile app.
+
+    Books come in (title, id) order, or (rank, id) when a search ``rank``
+    expression is given. Without ``limit`` or ``cursor`` every match is
+    returned, as older app builds expect. Otherwise a keyset page is returned
+    with a ``next_cursor`` (None on the last page), so a page costs the same
+    however deep the client scrolls.
+    """
+    if rank is None:
+        sort_key, sort_type = Book.title, str
+    else:
+        sort_key, sort_type = rank, (int, float)
+    query = query.add_columns(sort_key)
+
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    if cursor is None and limit is None:
+        rows = query.order_by(sort_key.asc(), Book.id.asc()).all()
+        return jsonify({'books': _serialize_books_for_app([row[0] for row in rows])}), 200
+
+    limit = min(max(limit or BOOK_PAGE_DEFAULT_LIMIT, 1), BOOK_PAGE_MAX_LIMIT)
+    if cursor:
+        try:
+            after_value, after_id = _decode_book_cursor(cursor, sort_type)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        query = query.filter(tuple_(sort_key, Book.id) > tuple_(after_value, after_id))
+
+    rows = query.order_by(sort_key.asc(), Book.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'books': _serialize_books_for_app([row[0] for row in rows]),
+        'next_cursor': _encode_book_cursor(rows[-1][1], rows[-1][0].id) if has_more else None,
+        'limit': limit,
+    }), 200
+
+
+def _fuzzy_books_response(query_text):
+    """Typo-tolerant matches for ``query_text`` as a single, final page."""
+    book_ids = fuzzy_book_ids(query_text)
+    books_by_id = {
+        book.id: book for book in
+        Book.query.options(joinedload(Book.category)).filter(Book.id.in_(book_ids)).all()
+    } if book_ids else {}
+    books = [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id]
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = min(max(limit, 1), BOOK_PAGE_MAX_LIMIT)
+        books = books[:limit]
+
+    payload = {'books': _serialize_books_for_app(books), 'fuzzy': True}
+    if limit is not None:
+        payload.update(next_cursor=None, limit=limit)
+    return jsonify(payload), 200
+
+
+def _serialize_transaction_for_app(transaction: Transaction, pending_counts):
     """Serialize transaction details for the mobile app borrowed books view."""
     book = transaction.book
     return {
         'id': transaction.id,
-        'book': _serialize_book_for_app(book),
+        'book': _serialize_book_for_app(book, pending_counts),
         'issue_date': transaction.issue_date.isoformat() if transaction.issue_date else None,
         'due_date': transaction.due_date.isoformat() if transaction.due_date else None,
-        'status': transaction.status,
+        'status': transaction.current_status,
     }
 
 
-def _serialize_reservation_for_app(reservation: Reservation):
+def _serialize_reservation_for_app(reservation: Reservation, pending_counts):
     """Serialize reservation information to align with borrowed book structure."""
     book = reservation.book
     if not book:
@@ -66,14 +184,28 @@ def _serialize_reservation_for_app(reservation: Reservation):
     expected_pickup = reservation.created_at + timedelta(days=3)
     return {
         'id': reservation.id,
-        'book': _serialize_book_for_app(book),
+        'book': _serialize_book_for_app(book, pending_counts),
         'issue_date': reservation.created_at.isoformat(),
         'due_date': expected_pickup.isoformat(),
         'status': 'reserved',
     }
 
+
+def _serialize_borrowed_for_app(transactions, reservations):
+    """Serialize active loans followed by pending reservations, batching the book lookups."""
+    pending_counts = _pending_reservation_counts(
+        [tx.book for tx in transactions] + [res.book for res in reservations]
+    )
+    items = [_serialize_transaction_for_app(tx, pending_counts) for tx in transactions]
+    items.extend(_serialize_reservation_for_app(res, pending_counts) for res in reservations)
+    return items
+
 api_bp = Blueprint('api', __name__)
 
+# 304 Not Modified for the mobile app's per-user reads while the user's data version is unchanged
+conditional_user_get = user_versions.conditional_get(
+    lambda: db.session.connection().connection, get_jwt_identity)
+
 # Marshmallow Schemas for serialization
 class UserSchema(Schema):
     id = fields.Int()
@@ -104,8 +236,8 @@ class TransactionSchema(Schema):
     issue_date = fields.DateTime()
     due_date = fields.DateTime()
     return_date = fields.DateTime()
-    fine_amount = fields.Float()
-    status = fields.Str()
+    fine_amount = fields.Float(attribute='accrued_fine')
+    status = fields.Str(attribute='current_status')
     created_at = fields.DateTime()
 
 class CategorySchema(Schema):
@@ -198,40 +330,48 @@ def user_profile():
 
 @api_bp.route('/user/borrowed-books', methods=['GET'])
 @jwt_required()
+@conditional_user_get
 def user_borrowed_books():
     if not _ensure_user_role():
         return jsonify({'error': 'Access denied'}), 403
 
     user_id = get_jwt_identity()
-    calculate_overdue_fines()
 
-    transactions = Transaction.query.filter(
+    transactions = Transaction.query.options(
+        joinedload(Transaction.book).joinedload(Book.category)
+    ).filter(
         Transaction.user_id == user_id,
         Transaction.status.in_(['issued', 'overdue'])
     ).order_by(Transaction.due_date.asc()).all()
 
-    reservations = Reservation.query.filter_by(
+    reservations = Reservation.query.options(
+        joinedload(Reservation.book).joinedload(Book.category)
+    ).filter_by(
         user_id=user_id, status='pending'
     ).order_by(Reservation.created_at.asc()).all()
 
-    borrowed_items = [_serialize_transaction_for_app(tx) for tx in transactions]
-    borrowed_items.extend(_serialize_reservation_for_app(res) for res in reservations)
+    borrowed_items = _serialize_borrowed_for_app(transactions, reservations)
 
     return jsonify({'books': borrowed_items}), 200
 
 
 @api_bp.route('/user/fines', methods=['GET'])
 @jwt_required()
+@conditional_user_get
 def user_fines():
     if not _ensure_user_role():
         return jsonify({'error': 'Access denied'}), 403
 
     user_id = get_jwt_identity()
-    calculate_overdue_fines()
 
+    # Active loans accrue a fine once a full day past due, whether or not the
+    # scheduled fine run has written it yet
     transactions = Transaction.query.filter(
         Transaction.user_id == user_id,
-        Transaction.fine_amount > 0
+        (Transaction.fine_amount > 0) | (
+            Transaction.status.in_(['issued', 'overdue']) &
+            (Transaction.due_date <= datetime.utcnow() - timedelta(days=1))
+        )
     ).order_by(Transaction.due_date.desc()).all()
 
     fines = []
@@ -239,7 +379,7 @@ def user_fines():
         status = 'pending' if tx.status in ('issued', 'overdue') else 'paid'
         fines.append({
             'id': tx.id,
-            'amount': tx.fine_amount,
+            'amount': tx.accrued_fine,
             'reason': f"Fine for '{tx.book.title}'",
             'date': (tx.due_date or tx.issue_date or datetime.utcnow()).isoformat(),
             'status': status,
@@ -248,70 +388,42 @@ def user_fines():
     return jsonify({'fines': fines}), 200
 
 
+NOTIFICATION_PAGE_SIZE = 50
+
+
 @api_bp.route('/user/notifications', methods=['GET'])
 @jwt_required()
+@conditional_user_get
 def user_notifications():
+    """The user's newest notifications.
+    
+    Rows are written ahead of time (see app/notifications.py), so this is one
+    read on ``(user_id, [seen,] created_at)``. ``?seen=false`` returns only
+    unread ones and ``?since=<ISO time>`` only those created after it.
+    """
     if not _ensure_user_role():
         return jsonify({'error': 'Access denied'}), 403
 
     user_id = get_jwt_identity()
-    now = datetime.utcnow()
-
-    notifications = []
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id
-    ).all()
+    query = Notification.query.filter(Notification.user_id == user_id)
 
-    for tx in transactions:
-        due_date = tx.due_date
-        if not due_date:
-            continue
-
-        # Overdue notification
-        if tx.status == 'overdue':
-            notif_id = tx.id * 10 + 1
-            notifications.append({
-                'id': notif_id,
-                'title': 'Overdue Book',
-                'body': f"'{tx.book.title}' is overdue. Please return it as soon as possible.",
-                'type': 'overdue',
-                'created_at': due_date.isoformat(),
-                'seen': notif_id in user_notification_reads[user_id],
-            })
-
-        # Due soon reminder (within 3 days)
-        if tx.status in ('issued', 'reserved'):
-            days_left = (due_date - now).days
-            if days_left >= 0 and days_left <= 3:
-                notif_id = tx.id * 10 + 2
-                notifications.append({
-                    'id': notif_id,
-                    'title': 'Return Reminder',
-                    'body': f"'{tx.book.title}' is due in {days_left} day(s).",
-                    'type': 'reminder',
-                    'created_at': now.isoformat(),
-                    'seen': notif_id in user_notification_reads[user_id],
-                })
-
-    reservations = Reservation.query.filter_by(
-        user_id=user_id, status='pending'
-    ).all()
-
-    for reservation in reservations:
-        notif_id = reservation.id * 10 + 5
-        notifications.append({
-            'id': notif_id,
-            'title': 'Reservation Confirmed',
-            'body': f"You reserved '{reservation.book.title if reservation.book else 'a book'}'. We will hold it for 3 days.",
-            'type': 'reservation',
-            'created_at': reservation.created_at.isoformat(),
-            'seen': notif_id in user_notification_reads[user_id],
-        })
+    seen = request.args.get('seen')
+    if seen is not None:
+        query = query.filter(Notification.seen == (seen.lower() in ('1', 'true', 'yes')))
 
-    # Sort notifications by created_at descending
-    notifications.sort(key=lambda n: n['created_at'], reverse=True)
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 timestamp'}), 400
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        query = query.filter(Notification.created_at > since)
 
-    return jsonify({'notifications': notifications}), 200
+    notifications = (query.order_by(Notification.created_at.desc(), Notification.id.desc())
+                     .limit(NOTIFICATION_PAGE_SIZE).all())
+    return jsonify({'notifications': [n.to_dict() for n in notifications]}), 200
 
 
 @api_bp.route('/user/notifications/<int:notification_id>/read', methods=['PUT'])
@@ -321,7 +433,12 @@ def mark_notification_read(notification_id):
         return jsonify({'error': 'Access denied'}), 403
 
     user_id = get_jwt_identity()
-    user_notification_reads[user_id].add(notification_id)
+    db.session.execute(
+        db.update(Notification)
+        .where(Notification.id == notification_id, Notification.user_id == user_id)
+        .values(seen=True)
+    )
+    db.session.commit()
     return jsonify({'success': True}), 200
 
 
@@ -329,9 +446,43 @@ def mark_notification_read(notification_id):
 @jwt_required(optional=True)
 def books_available():
     """List books available for users (does not require librarian role)."""
-    books = Book.query.filter(Book.available_copies > 0).order_by(Book.title.asc()).all()
-    serialized = [_serialize_book_for_app(book) for book in books]
-    return jsonify({'books': serialized}), 200
+    query = Book.query.options(joinedload(Book.category)).filter(Book.available_copies > 0)
+    return _paginated_books_response(query)
+
+
+@api_bp.route('/sync/books', methods=['GET'])
+@jwt_required(optional=True)
+def sync_books():
+    """Books created, updated or deleted since the client's sync token.
+
+    Pass the ``next_token`` of the previous response as ``?since=`` and
+    repeat while ``has_more``. ``reset`` means the local catalogue must be
+    rebuilt from this response on, as happens without a token. Every book
+    is listed, available or not, and deletions come as ids in ``deleted``.
+    """
+    try:
+        since = book_changes.parse_token(request.args.get('since'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    limit = book_changes.page_limit(request.args.get('limit', type=int))
+
+    page = book_changes.read_changes(db.session.connection().connection, since, limit)
+    books_by_id = {
+        book.id: book for book in
+        Book.query.options(joinedload(Book.category)).filter(Book.id.in_(page['changed'])).all()
+    } if page['changed'] else {}
+    books = [books_by_id[book_id] for book_id in page['changed'] if book_id in books_by_id]
+    serialized = _serialize_books_for_app(books)
+    for book, data in zip(books, serialized):
+        data['updated_at'] = (book.updated_at or book.created_at).isoformat()
+    return jsonify({
+        'books': serialized,
+        # Logged as changed but gone by now: deleted since
+        'deleted': page['deleted'] + [book_id for book_id in page['changed'] if book_id not in books_by_id],
+        'next_token': page['next_token'],
+        'has_more': page['has_more'],
+        'reset': page['reset'],
+    }), 200
 
 
 @api_bp.route('/books/search', methods=['GET'])
@@ -340,18 +491,15 @@ def books_search():
     """Search books by title, author, or ISBN for mobile users."""
     query = request.args.get('query', '').strip()
 
-    q = Book.query
+    q = Book.query.options(joinedload(Book.category))
+    rank = None
     if query:
-        like_query = f"%{query}%"
-        q = q.filter(
-            (Book.title.ilike(like_query)) |
-            (Book.author.ilike(like_query)) |
-            (Book.isbn.ilike(like_query))
-        )
+        q, rank = search_books(q, query)
+        # Nothing spelled that way: retry tolerating typos
+        if not request.args.get('cursor') and q.limit(1).first() is None:
+            return _fuzzy_books_response(query)
 
-    books = q.order_by(Book.title.asc()).all()
-    serialized = [_serialize_book_for_app(book) for book in books]
-    return jsonify({'books': serialized}), 200
+    return _paginated_books_response(q, rank)
 
 
 @api_bp.route('/books/reserve', methods=['POST'])
@@ -404,6 +552,8 @@ def reserve_book_user():
             status='pending'
         )
         db.session.add(reservation)
+        db.session.flush()
+        on_reservation_created(reservation, book)
         db.session.commit()
         return jsonify({'success': True, 'reservation_id': reservation.id}), 200
     except Exception as exc:
@@ -425,6 +575,7 @@ def cancel_reservation_user(reservation_id):
 
     try:
         reservation.status = 'cancelled'
+        on_reservation_closed(reservation)
         db.session.commit()
         return jsonify({'success': True}), 200
     except Exception as exc:
@@ -441,11 +592,9 @@ def get_books():
     
     query = Book.query
     if search:
-        query = query.filter(
-            (Book.title.contains(search)) |
-            (Book.author.contains(search)) |
-            (Book.isbn.contains(search))
-        )
+        query, rank = search_books(query, search)
+        if rank is not None:
+            query = query.order_by(rank, Book.id)
     
     books = query.paginate(
         page=page, per_page=per_page, error_out=False
@@ -474,6 +623,7 @@ def create_book():
             available_copies=data['total_copies']
         )
         db.session.add(book)
+        record_book_added(book)
         db.session.commit()
         
         return jsonify(book_schema.dump(book)), 201
@@ -481,6 +631,49 @@ def create_book():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+# Content types accepted as a raw import body
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+}
+
+@api_bp.route('/books/import', methods=['POST'])
+@csrf.exempt
+@jwt_required()
+def import_books_endpoint():
+    """Bulk-import books from CSV or JSON Lines.
+    
+    The body is the file itself (``Content-Type: text/csv`` or
+    ``application/x-ndjson``) or a multipart upload in ``file``; ``?format=``
+    overrides the detected format and ``?batch_size=`` the rows per batch.
+    Returns the import report, with the first rejects and their line numbers.
+    """
+    if get_jwt().get('role') != 'librarian':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    fmt = request.args.get('format')
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = fmt or format_for_name(upload.filename)
+    else:
+        stream = request.stream
+        fmt = fmt or IMPORT_CONTENT_TYPES.get(request.mimetype)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'Send text/csv or application/x-ndjson, or upload a file'}), 415
+    batch_size = request.args.get('batch_size', current_app.config['BOOK_IMPORT_BATCH_SIZE'], type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be at least 1'}), 400
+    
+    try:
+        report = import_books(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), fmt, batch_size)
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'error': 'The import must be UTF-8 text; batches before the bad bytes were imported'}), 400
+    return jsonify(report.to_dict()), 200
+
 @api_bp.route('/books/<int:book_id>', methods=['GET'])
 @jwt_required()
 def get_book(book_id):
@@ -498,16 +691,20 @@ def update_book(book_id):
         book.author = data.get('author', book.author)
         book.publisher = data.get('publisher', book.publisher)
         book.isbn = data.get('isbn', book.isbn)
+        old_category_id = book.category_id
         book.category_id = data.get('category_id', book.category_id)
         
         # Handle total copies change
         old_total = book.total_copies
+        old_available = book.available_copies
         book.total_copies = data.get('total_copies', book.total_copies)
         if book.total_copies > old_total:
             book.available_copies += (book.total_copies - old_total)
         elif book.total_copies < old_total:
             book.available_copies = max(0, book.available_copies - (old_total - book.total_copies))
         
+        record_book_copies_changed(book, old_total, old_available)
+        record_book_category_changed(book, old_category_id)
         db.session.commit()
         return jsonify(book_schema.dump(book))
     except Exception as e:
@@ -529,6 +726,7 @@ def delete_book(book_id):
         return jsonify({'error': 'Cannot delete book with active transactions'}), 400
     
     db.session.delete(book)
+    record_book_removed(book)
     db.session.commit()
     return jsonify({'message': 'Book deleted successfully'})
 
@@ -623,7 +821,10 @@ def delete_user(user_id):
     
     # Mark all issued books as returned before deleting user
     for transaction in active_transactions:
+        old_status, old_fine = transaction.status, transaction.fine_amount
         transaction.return_book()
+        record_book_returned(transaction, old_status, old_fine)
+        on_loan_closed(transaction)
         print(f"Auto-returned book '{transaction.book.title}' for deleted user '{user.name}'")
     
     # Cancel any pending reservations
@@ -634,6 +835,7 @@ def delete_user(user_id):
     
     for reservation in pending_reservations:
         reservation.status = 'cancelled'
+        on_reservation_closed(reservation)
     
     db.session.delete(user)
     db.session.commit()
@@ -712,14 +914,12 @@ def return_book_api():
 @api_bp.route('/transactions/overdue', methods=['GET'])
 @jwt_required()
 def get_overdue_transactions():
-    # Calculate overdue fines
-    calculate_overdue_fines()
-    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
     overdue_transactions = Transaction.query.filter(
-        Transaction.status == 'overdue'
+        Transaction.status.in_(['issued', 'overdue']),
+        Transaction.due_date < datetime.utcnow()
     ).order_by(Transaction.due_date.asc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
@@ -948,15 +1148,12 @@ def mobile_scan():
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
-        # Look up book by barcode_id
-        book = Book.query.filter_by(barcode_id=code).first()
+        # Look up book by barcode_id (cached); copies and the active loan come fresh
+        book = lookup_book(code)
         
         if book:
-            # Check if book is currently issued or overdue
-            active_transaction = Transaction.query.filter(
-                Transaction.book_id == book.id,
-                Transaction.status.in_(['issued', 'overdue'])
-            ).first()
+            available_copies, active_transaction = book_availability(book.id)
+            is_available = available_copies > 0
             
             result = {
                 'found': True,
@@ -965,17 +1162,17 @@ def mobile_scan():
                     'title': book.title,
                     'author': book.author,
                     'barcode_id': book.barcode_id,
-                    'available_copies': book.available_copies,
-                    'is_available': book.is_available()
+                    'available_copies': available_copies,
+                    'is_available': is_available
                 },
                 'transaction_info': None,
-                'action': 'issue' if book.is_available() else 'unavailable'
+                'action': 'issue' if is_available else 'unavailable'
             }
             
             if active_transaction:
                 result['transaction_info'] = {
                     'id': active_transaction.id,
-                    'user_name': active_transaction.user.name,
+                    'user_name': active_transaction.user_name,
                     'issue_date': active_transaction.issue_date.isoformat(),
                     'due_date': active_transaction.due_date.isoformat()
                 }
@@ -1016,7 +1213,7 @@ def scan_issue_book():
             return jsonify({'success': False, 'error': 'user_id and barcode_id required'}), 400
         
         # Find book by barcode
-        book = Book.query.filter_by(barcode_id=barcode_id).first()
+        book = lookup_book(barcode_id)
         if not book:
             return jsonify({'success': False, 'error': 'Book not found'}), 404
         
@@ -1049,15 +1246,12 @@ def scan_return_book():
             return jsonify({'success': False, 'error': 'barcode_id required'}), 400
         
         # Find book by barcode
-        book = Book.query.filter_by(barcode_id=barcode_id).first()
+        book = lookup_book(barcode_id)
         if not book:
             return jsonify({'success': False, 'error': 'Book not found'}), 404
         
         # Find active transaction for this book
-        transaction = Transaction.query.filter(
-            Transaction.book_id == book.id,
-            Transaction.status.in_(['issued', 'overdue'])
-        ).first()
+        _, transaction = book_availability(book.id)
         
         if not transaction:
             return jsonify({'success': False, 'error': 'This book is not currently issued'}), 400
@@ -1073,13 +1267,126 @@ def scan_return_book():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# Latest scan storage (in production, use Redis or database)
-latest_scan_storage = {'timestamp': 0}
+SCAN_BATCH_MAX_ITEMS = 200
+
+def _scan_batch_request(default_mode):
+    """Validate a batch scan body; returns (barcodes, mode, error_response)"""
+    data = request.get_json(silent=True) or {}
+    barcodes = data.get('barcodes')
+    mode = data.get('mode', default_mode)
+    
+    if not isinstance(barcodes, list) or not barcodes:
+        return None, None, (jsonify({'success': False, 'error': 'barcodes must be a non-empty list'}), 400)
+    if len(barcodes) > SCAN_BATCH_MAX_ITEMS:
+        return None, None, (jsonify({'success': False,
+                                     'error': f'At most {SCAN_BATCH_MAX_ITEMS} barcodes per batch'}), 400)
+    if mode not in BATCH_MODES:
+        return None, None, (jsonify({'success': False,
+                                     'error': f'mode must be one of: {", ".join(BATCH_MODES)}'}), 400)
+    return [str(barcode).strip() for barcode in barcodes], mode, None
+
+def _scan_batch_response(results, applied, mode):
+    succeeded = applied == len(results)
+    response = jsonify({
+        'success': succeeded,
+        'mode': mode,
+        'applied': applied,
+        'failed': sum(1 for result in results if not result['success']),
+        'results': results
+    })
+    # Nothing was written: an all-or-nothing batch that rolled back
+    return response, 200 if applied or succeeded else 400
+
+@api_bp.route('/scan/issue-batch', methods=['POST'])
+@csrf.exempt
+def scan_issue_batch():
+    """Issue a list of scanned barcodes to one user in a single transaction.
+    
+    Body: ``{"user_id": 3, "barcodes": [...], "mode": "all_or_nothing"}``;
+    ``mode`` may also be ``best_effort``, which keeps the items that worked.
+    Every barcode gets a result in the response, in request order.
+    """
+    from flask import session
+    
+    # Check session authentication
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    try:
+        barcodes, mode, error = _scan_batch_request('all_or_nothing')
+        if error:
+            return error
+        
+        user_id = (request.get_json(silent=True) or {}).get('user_id')
+        if not user_id:
+            return jsonify({'success': False, 'error': 'user_id required'}), 400
+        
+        results, applied = issue_books_batch(user_id, barcodes, mode)
+        if results is None:
+            return jsonify({'success': False, 'error': 'User not found'}), 404
+        return _scan_batch_response(results, applied, mode)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
+@api_bp.route('/scan/return-batch', methods=['POST'])
+@csrf.exempt
+def scan_return_batch():
+    """Check in a list of scanned barcodes in a single transaction.
+    
+    Body: ``{"barcodes": [...], "mode": "best_effort"}``; scanning a barcode
+    twice returns two copies of that book.
+    """
+    from flask import session
+    
+    # Check session authentication
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    try:
+        barcodes, mode, error = _scan_batch_request('best_effort')
+        if error:
+            return error
+        
+        results, applied = return_books_batch(barcodes, mode)
+        return _scan_batch_response(results, applied, mode)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Latest scan per station; the dashboard subscribes to /scan-stream and
+# /latest-scan is kept for browsers without EventSource
 @api_bp.route('/latest-scan', methods=['GET'])
 def get_latest_scan():
     """Get the most recent scan for dashboard polling"""
-    return jsonify(latest_scan_storage)
+    station = normalize_station(request.args.get('station'))
+    return jsonify(scan_broker.latest(station) or {'timestamp': 0})
+
+@api_bp.route('/scan-stream', methods=['GET'])
+def scan_stream():
+    """Server-sent events: each scan posted for ``?station=`` as it arrives.
+    
+    Reconnecting browsers send ``Last-Event-ID`` and get the scans they
+    missed from the station's replay buffer.
+    """
+    from flask import session
+    
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    station = normalize_station(request.args.get('station'))
+    last_event_id = parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    response = Response(stream_with_context(stream_scans(station, last_event_id)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/scan-stream/stats', methods=['GET'])
+@jwt_required()
+def scan_stream_stats():
+    return jsonify(scan_broker.stats())
 
 @api_bp.route('/update-latest-scan', methods=['POST', 'OPTIONS'])
 @csrf.exempt
@@ -1094,10 +1401,10 @@ def update_latest_scan():
         return response
     
     try:
-        global latest_scan_storage
         data = request.get_json()
-        latest_scan_storage = data
-        response = jsonify({'success': True})
+        station = normalize_station(data.get('station') or request.args.get('station'))
+        event_id = scan_broker.publish(station, data)
+        response = jsonify({'success': True, 'station': station, 'event_id': event_id})
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response
     except Exception as e:
@@ -1120,13 +1427,21 @@ def test_connection():
 @api_bp.route('/dashboard/stats', methods=['GET'])
 @jwt_required()
 def get_dashboard_stats_api():
-    # Update fines before getting stats
-    from ..utils import update_all_transaction_fines
-    update_all_transaction_fines()
-    
     stats = get_dashboard_stats()
     return jsonify(stats)
 
+# Barcode/ISBN lookup cache counters for this process
+@api_bp.route('/scan/cache-stats', methods=['GET'])
+@jwt_required()
+def get_scan_cache_stats():
+    return jsonify(book_lookup_cache.stats())
+
+# Shared database lock contention for this process
+@api_bp.route('/db-metrics', methods=['GET'])
+@jwt_required()
+def get_db_metrics():
+    return jsonify({'process': 'librarian', **shared_db.lock_metrics.snapshot()})
+
 # Fine management endpoints
 @api_bp.route('/fines/update', methods=['POST'])
 @jwt_required()
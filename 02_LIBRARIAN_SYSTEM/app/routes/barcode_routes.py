@@ -1,5 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
-from ..models import Book
+import io
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, send_file, current_app
+from ..scan_cache import lookup_book, book_availability
+from ..labels import LABEL_MAX_SCALE, label_assets, label_svg, render_label
+from ..label_cache import label_cache, label_key
 from .. import db
 
 barcode_bp = Blueprint('barcode', __name__)
@@ -22,10 +25,12 @@ def lookup_barcode(barcode):
         # Clean the barcode (remove spaces, dashes, etc.)
         clean_barcode = barcode.strip().replace('-', '').replace(' ', '')
         
-        # Search for book by ISBN
-        book = Book.query.filter_by(isbn=clean_barcode).first()
+        # Search for book by ISBN (cached); availability is read fresh
+        book = lookup_book(clean_barcode, kind='isbn')
         
         if book:
+            available_copies, _ = book_availability(book.id)
+            is_available = available_copies > 0
             return jsonify({
                 'found': True,
                 'book': {
@@ -34,11 +39,11 @@ def lookup_barcode(barcode):
                     'author': book.author,
                     'publisher': book.publisher,
                     'isbn': book.isbn,
-                    'category_name': book.category.name if book.category else None,
+                    'category_name': book.category_name,
                     'total_copies': book.total_copies,
-                    'available_copies': book.available_copies,
-                    'is_available': book.is_available(),
-                    'status': 'Available' if book.is_available() else 'Not Available'
+                    'available_copies': available_copies,
+                    'is_available': is_available,
+                    'status': 'Available' if is_available else 'Not Available'
                 }
             })
         else:
@@ -52,3 +57,66 @@ def lookup_barcode(barcode):
             'found': False,
             'error': f'Error looking up barcode: {str(e)}'
         }), 500
+
+LABEL_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def _render_label_file(fmt, book, scale):
+    """The encoded label of a BookRef"""
+    if fmt == 'svg':
+        return label_svg(book.barcode_id, book.title, book.author).encode('utf-8')
+    template, font, small_font = label_assets(scale)
+    buffer = io.BytesIO()
+    render_label(book.barcode_id, book.title, book.author, template, font, small_font, scale).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+@barcode_bp.route('/barcode/<barcode_id>.<any(png, svg):fmt>')
+def label_image(barcode_id, fmt):
+    """The printable label of a book, rendered once and then served from the label cache.
+    
+    ``?scale=2`` (up to 4) draws a PNG at that multiple of 400x300. The
+    ETag is the label's cache key, so a browser holding the current label
+    gets a 304 without the file being read.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    scale = request.args.get('scale', 1, type=int) if fmt == 'png' else 1
+    if not 1 <= scale <= LABEL_MAX_SCALE:
+        return jsonify({'error': f'scale must be between 1 and {LABEL_MAX_SCALE}'}), 400
+    
+    book = lookup_book(barcode_id, kind='barcode')
+    if book is None:
+        return jsonify({'error': f'No book found with barcode: {barcode_id}'}), 404
+    
+    key = label_key(fmt, book.barcode_id, book.title, book.author, scale)
+    max_age = current_app.config['LABEL_CACHE_MAX_AGE']
+    if key in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(key)
+    else:
+        response = None
+        path = label_cache.get(key, fmt)
+        if path is not None:
+            try:
+                response = send_file(path, mimetype=LABEL_MIMETYPES[fmt], etag=key, conditional=False)
+            except FileNotFoundError:
+                pass    # evicted by another worker since the lookup; drawn again below
+        if response is None:
+            try:
+                data = _render_label_file(fmt, book, scale)
+            except ValueError as e:
+                return jsonify({'error': f'Cannot draw a label for barcode {book.barcode_id}: {e}'}), 422
+            label_cache.put(key, fmt, data)
+            # Served from memory, since the file may already be evicted again
+            response = send_file(io.BytesIO(data), mimetype=LABEL_MIMETYPES[fmt], etag=key, conditional=False)
+    # Labels only change with the book, which changes the key; the short max-age bounds how long an edit takes to show
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+@barcode_bp.route('/barcode/cache-stats')
+def label_cache_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    return jsonify(label_cache.stats())
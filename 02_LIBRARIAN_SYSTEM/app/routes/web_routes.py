@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
-from ..models import User, Book, Transaction, Category
+from ..models import User, Book, Transaction, Category, Notification
 from ..forms import LoginForm, BookForm, UserForm, CategoryForm, IssueBookForm, ReturnBookForm
-from ..utils import get_dashboard_stats, issue_book, return_book, calculate_overdue_fines
+from ..utils import (get_dashboard_stats, issue_book, return_book, calculate_overdue_fines,
+                     record_book_added, record_book_removed, record_book_copies_changed,
+                     record_book_category_changed, rebuild_library_stats)
+from ..search import search_books
 from .. import db, csrf
 from datetime import datetime, timedelta
 
@@ -65,10 +68,6 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('web.login'))
     
-    # Update all transaction fines before getting stats
-    from ..utils import update_all_transaction_fines
-    update_all_transaction_fines()
-    
     stats = get_dashboard_stats()
     
     # Recent transactions
@@ -96,11 +95,9 @@ def books():
     
     query = Book.query
     if search:
-        query = query.filter(
-            (Book.title.contains(search)) |
-            (Book.author.contains(search)) |
-            (Book.isbn.contains(search))
-        )
+        query, rank = search_books(query, search)
+        if rank is not None:
+            query = query.order_by(rank, Book.id)
     
     books = query.paginate(
         page=page, per_page=10, error_out=False
@@ -127,6 +124,7 @@ def add_book():
             available_copies=form.total_copies.data
         )
         db.session.add(book)
+        record_book_added(book)
         db.session.commit()
         flash('Book added successfully!', 'success')
     else:
@@ -149,16 +147,20 @@ def edit_book(book_id):
         book.author = form.author.data
         book.publisher = form.publisher.data
         book.isbn = form.isbn.data
+        old_category_id = book.category_id
         book.category_id = form.category_id.data
         
         # Adjust available copies if total copies changed
         old_total = book.total_copies
+        old_available = book.available_copies
         book.total_copies = form.total_copies.data
         if form.total_copies.data > old_total:
             book.available_copies += (form.total_copies.data - old_total)
         elif form.total_copies.data < old_total:
             book.available_copies = max(0, book.available_copies - (old_total - form.total_copies.data))
         
+        record_book_copies_changed(book, old_total, old_available)
+        record_book_category_changed(book, old_category_id)
         db.session.commit()
         flash('Book updated successfully!', 'success')
     else:
@@ -195,6 +197,7 @@ def delete_book(book_id):
         else:
             print(f"Deleting book: {book.title}")
             db.session.delete(book)
+            record_book_removed(book)
             db.session.commit()
             flash('Book deleted successfully!', 'success')
             print("Book deleted successfully")
@@ -311,11 +314,15 @@ def delete_user(user_id):
         # Delete user and related data
         user_name = user.name
         
-        # Delete related transactions (history)
+        # Delete related transactions (history) and the notices about them
         Transaction.query.filter_by(user_id=user_id).delete()
+        Notification.query.filter_by(user_id=user_id).delete()
         
         # Delete the user
         db.session.delete(user)
+        
+        # Loan history is gone, so fine and borrow totals must be re-derived
+        rebuild_library_stats()
         db.session.commit()
         
         flash(f'User "{user_name}" has been successfully deleted.', 'success')
@@ -356,15 +363,18 @@ def transactions():
     if 'user_id' not in session:
         return redirect(url_for('web.login'))
     
-    # Update all transaction fines before displaying
-    from ..utils import update_all_transaction_fines
-    update_all_transaction_fines()
-    
     page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
     
+    # Overdue is derived from due_date so the list is current between fine runs
     query = Transaction.query
-    if status_filter:
+    if status_filter == 'overdue':
+        query = query.filter(Transaction.status.in_(['issued', 'overdue']),
+                             Transaction.due_date < datetime.utcnow())
+    elif status_filter == 'issued':
+        query = query.filter(Transaction.status.in_(['issued', 'overdue']),
+                             Transaction.due_date >= datetime.utcnow())
+    elif status_filter:
         query = query.filter(Transaction.status == status_filter)
     
     transactions = query.order_by(Transaction.created_at.desc()).paginate(
@@ -442,13 +452,10 @@ def overdue():
     if 'user_id' not in session:
         return redirect(url_for('web.login'))
     
-    # Update all transaction fines and statuses
-    from ..utils import update_all_transaction_fines
-    update_all_transaction_fines()
-    
     page = request.args.get('page', 1, type=int)
     overdue_transactions = Transaction.query.filter(
-        Transaction.status == 'overdue'
+        Transaction.status.in_(['issued', 'overdue']),
+        Transaction.due_date < datetime.utcnow()
     ).order_by(Transaction.due_date.asc()).paginate(
         page=page, per_page=10, error_out=False
     )
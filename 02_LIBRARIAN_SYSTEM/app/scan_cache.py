@@ -0,0 +1,210 @@
+"""
+Process-local LRU cache for the scan hot path: barcode_id or ISBN to the
+book's id and static fields (title, author, publisher, category...).
+
+Dynamic state, available copies and the active loan, is always read from
+the database; a cache hit turns a scan into one primary-key query.
+
+ORM writes to books drop the affected entries (by book for edits and
+deletes, by barcode/ISBN for new books) at flush and again once the
+transaction commits, so a scan racing the commit cannot re-cache the old
+row; renaming a category clears the cache. Code that writes books with raw
+SQL must call ``book_lookup_cache.clear()``. Entries also expire after
+``BOOK_LOOKUP_CACHE_TTL`` seconds, which bounds staleness from other
+processes writing the same database.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+
+from . import db
+from .models import Book, Category, Transaction, User
+
+BookRef = namedtuple('BookRef', 'id title author publisher isbn barcode_id category_id category_name total_copies')
+
+# Book columns copied into BookRef; a change to any of them invalidates it
+STATIC_FIELDS = ('title', 'author', 'publisher', 'isbn', 'barcode_id', 'category_id', 'total_copies')
+
+LOOKUP_COLUMNS = {'barcode': Book.barcode_id, 'isbn': Book.isbn}
+
+
+class BookLookupCache:
+    """Thread-safe LRU of (kind, code) -> BookRef with hit/miss/eviction counters"""
+
+    def __init__(self, max_size=4096, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (kind, code) -> (BookRef, expires_at)
+        self._keys_by_book = {}         # book id -> {(kind, code), ...}
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, kind, code):
+        key = (kind, code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                ref, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ref
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, kind, code, ref):
+        key = (kind, code)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (ref, time.monotonic() + self.ttl)
+            self._keys_by_book.setdefault(ref.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        ref, _ = self._entries.pop(key)
+        keys = self._keys_by_book.get(ref.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_book[ref.id]
+
+    def invalidate_book(self, book_id):
+        with self._lock:
+            for key in list(self._keys_by_book.get(book_id, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def invalidate_code(self, kind, code):
+        with self._lock:
+            if (kind, code) in self._entries:
+                self._drop((kind, code))
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_book.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+book_lookup_cache = BookLookupCache()
+
+
+def init_app(app):
+    """Size the cache from the app config"""
+    book_lookup_cache.max_size = app.config.get('BOOK_LOOKUP_CACHE_SIZE', book_lookup_cache.max_size)
+    book_lookup_cache.ttl = app.config.get('BOOK_LOOKUP_CACHE_TTL', book_lookup_cache.ttl)
+
+
+def lookup_book(code, kind='barcode'):
+    """The BookRef for a scanned barcode_id (``kind='barcode'``) or ISBN, or None"""
+    ref = book_lookup_cache.get(kind, code)
+    if ref is not None:
+        return ref
+    book = (Book.query.options(joinedload(Book.category))
+            .filter(LOOKUP_COLUMNS[kind] == code).first())
+    if book is None:
+        return None
+    ref = BookRef(book.id, book.title, book.author, book.publisher, book.isbn, book.barcode_id,
+                  book.category_id, book.category.name if book.category else None, book.total_copies)
+    book_lookup_cache.put(kind, code, ref)
+    return ref
+
+
+def book_availability(book_id):
+    """``(available_copies, active_loan)`` for a book in one query.
+
+    ``active_loan`` is None or a row with the transaction's ``id``,
+    ``issue_date``, ``due_date`` and borrower ``user_name``.
+    """
+    row = (db.session.query(Book.available_copies, Transaction.id, Transaction.issue_date,
+                            Transaction.due_date, User.name.label('user_name'))
+           .outerjoin(Transaction, sa.and_(Transaction.book_id == Book.id,
+                                           Transaction.status.in_(['issued', 'overdue'])))
+           .outerjoin(User, User.id == Transaction.user_id)
+           .filter(Book.id == book_id)
+           .order_by(Transaction.id)
+           .first())
+    if row is None:
+        return None, None
+    return row.available_copies, (row if row.id is not None else None)
+
+
+def _invalidate(change):
+    kind = change[0]
+    if kind == 'book':
+        book_lookup_cache.invalidate_book(change[1])
+    elif kind == 'code':
+        book_lookup_cache.invalidate_code(change[1], change[2])
+    else:
+        book_lookup_cache.clear()
+
+
+def _queue_invalidation(target, *change):
+    """Drop the entries now and again once the transaction commits"""
+    _invalidate(change)
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault('book_lookup_invalidations', set()).add(change)
+
+
+def _after_book_insert(mapper, connection, target):
+    # Codes are unique and misses are not cached, so this only matters when the
+    # code was freed by an edit or delete this process never saw
+    _queue_invalidation(target, 'code', 'barcode', target.barcode_id)
+    _queue_invalidation(target, 'code', 'isbn', target.isbn)
+
+
+def _after_book_update(mapper, connection, target):
+    state = sa.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in STATIC_FIELDS):
+        _queue_invalidation(target, 'book', target.id)
+
+
+def _after_book_delete(mapper, connection, target):
+    _queue_invalidation(target, 'book', target.id)
+
+
+def _after_category_update(mapper, connection, target):
+    if sa.inspect(target).attrs['name'].history.has_changes():
+        _queue_invalidation(target, 'all')
+
+
+def _apply_invalidations(session):
+    for change in session.info.pop('book_lookup_invalidations', ()):
+        _invalidate(change)
+
+
+def _discard_invalidations(session):
+    session.info.pop('book_lookup_invalidations', None)
+
+
+# Book writes made through the ORM drop cached entries at flush and after commit
+sa.event.listen(Book, 'after_insert', _after_book_insert)
+sa.event.listen(Book, 'after_update', _after_book_update)
+sa.event.listen(Book, 'after_delete', _after_book_delete)
+sa.event.listen(Category, 'after_update', _after_category_update)
+sa.event.listen(sa.orm.Session, 'after_commit', _apply_invalidations)
+sa.event.listen(sa.orm.Session, 'after_rollback', _discard_invalidations)
@@ -0,0 +1,255 @@
+"""
+Per-station fan-out of mobile scans to dashboards over server-sent events.
+
+A station is the dashboard tab that opened the scanner link; the scanner
+posts its scans to ``/api/update-latest-scan`` with that station id and
+``/api/scan-stream?station=...`` pushes them to the tab. Each station keeps
+a small ring buffer of recent events so a reconnecting ``EventSource`` can
+resume from its ``Last-Event-ID``.
+
+Event ids and each station's latest scan (for the ``/api/latest-scan``
+polling fallback) live in the state store. With a shared store, a scan
+posted to another worker process is picked up by polling the store every
+``SCAN_STREAM_POLL_INTERVAL`` seconds; scans posted to this process are
+pushed at once.
+
+Every subscriber has a bounded queue. A subscriber that falls that far
+behind is disconnected rather than allowed to grow without limit; the
+browser reconnects and replays what it missed from the ring buffer.
+"""
+
+import json
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .state_store import MemoryStateStore
+
+DEFAULT_STATION = 'default'
+
+# Station ids come from URLs; anything else is folded into the default station
+STATION_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Placed on a subscriber's queue to end its stream
+_DISCONNECT = object()
+
+
+def normalize_station(station):
+    return station if station and STATION_PATTERN.match(station) else DEFAULT_STATION
+
+
+class Subscription:
+    """One open stream: replayed events, then live ones from a bounded queue"""
+
+    def __init__(self, channel, replay, queue_size, current_id=0):
+        self.channel = channel
+        self.replay = replay
+        self.current_id = current_id   # newest event id when the stream opened
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+    def disconnect(self):
+        # Make room so the marker always fits; the stream is ending anyway
+        while True:
+            try:
+                self.queue.put_nowait(_DISCONNECT)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next_event(self, timeout):
+        """The next live event, None on timeout, or _DISCONNECT"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class StationChannel:
+    def __init__(self, replay_size):
+        self.events = deque(maxlen=replay_size)   # (event id, payload)
+        self.subscribers = set()
+        self.last_used = time.monotonic()
+
+    def replay_after(self, last_event_id, current_id):
+        if last_event_id is None:
+            return []
+        if last_event_id > current_id:
+            # An id the store never issued (it was reset): send everything held
+            return sorted(self.events, key=lambda event: event[0])
+        return sorted((event for event in self.events if event[0] > last_event_id),
+                      key=lambda event: event[0])
+
+
+class ScanBroker:
+    """Thread-safe per-station latest scan, replay buffer and subscriber fan-out"""
+
+    def __init__(self, replay_size=50, queue_size=32, max_stations=256, state=None, latest_ttl=24 * 3600):
+        self.replay_size = replay_size
+        self.queue_size = queue_size
+        self.max_stations = max_stations
+        self.state = state or MemoryStateStore()
+        self.latest_ttl = latest_ttl
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()
+        self.published = self.delivered = self.dropped_subscribers = 0
+
+    def _channel(self, station):
+        channel = self._channels.get(station)
+        if channel is None:
+            channel = self._channels[station] = StationChannel(self.replay_size)
+            self._evict_idle()
+        self._channels.move_to_end(station)
+        channel.last_used = time.monotonic()
+        return channel
+
+    def _evict_idle(self):
+        # Forget the least recently used stations nobody is watching
+        for station in list(self._channels):
+            if len(self._channels) <= self.max_stations:
+                break
+            if not self._channels[station].subscribers:
+                del self._channels[station]
+
+    def publish(self, station, scan):
+        """Record a scan for a station and push it to its subscribers; returns the event id"""
+        event_id = self.state.incr('scan_event_id', station)
+        self.state.set('latest_scan', station, {'id': event_id, 'scan': scan}, ttl=self.latest_ttl)
+        with self._lock:
+            channel = self._channel(station)
+            channel.events.append((event_id, scan))
+            self.published += 1
+            for subscription in list(channel.subscribers):
+                if subscription.offer((event_id, scan)):
+                    self.delivered += 1
+                else:
+                    channel.subscribers.discard(subscription)
+                    subscription.disconnect()
+                    self.dropped_subscribers += 1
+            return event_id
+
+    def latest_event(self, station):
+        """``(event id, scan)`` of the station's most recent scan from any process, or None"""
+        latest = self.state.get('latest_scan', station)
+        return (latest['id'], latest['scan']) if latest else None
+
+    def latest(self, station):
+        latest = self.latest_event(station)
+        return latest[1] if latest else None
+
+    def subscribe(self, station, last_event_id=None):
+        current_id = self.state.get('scan_event_id', station, 0)
+        latest = self.latest_event(station) if self.state.shared and last_event_id is not None else None
+        # Replay and registration happen under one lock so no event falls in between
+        with self._lock:
+            channel = self._channel(station)
+            replay = channel.replay_after(last_event_id, current_id)
+            if latest and latest[0] > last_event_id and latest[0] not in {event[0] for event in replay}:
+                # Posted to another worker while this client was away
+                replay.append(latest)
+            subscription = Subscription(channel, replay, self.queue_size, current_id)
+            channel.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscription.channel.subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stations': len(self._channels),
+                'subscribers': sum(len(channel.subscribers) for channel in self._channels.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped_subscribers': self.dropped_subscribers,
+                'replay_size': self.replay_size,
+                'queue_size': self.queue_size,
+            }
+
+
+scan_broker = ScanBroker()
+
+# Stream tuning, overridden from the app config by init_app
+stream_settings = {'heartbeat': 15.0, 'max_seconds': 300.0, 'poll_interval': 1.0, 'retry_ms': 3000}
+
+
+def init_app(app):
+    """Size the broker and streams from the app config and attach the app's state store"""
+    scan_broker.state = app.extensions['state_store']
+    scan_broker.latest_ttl = app.config.get('SCAN_STATE_TTL', scan_broker.latest_ttl)
+    stream_settings['poll_interval'] = app.config.get('SCAN_STREAM_POLL_INTERVAL', stream_settings['poll_interval'])
+    scan_broker.replay_size = app.config.get('SCAN_STREAM_REPLAY_SIZE', scan_broker.replay_size)
+    scan_broker.queue_size = app.config.get('SCAN_STREAM_QUEUE_SIZE', scan_broker.queue_size)
+    stream_settings['heartbeat'] = app.config.get('SCAN_STREAM_HEARTBEAT', stream_settings['heartbeat'])
+    stream_settings['max_seconds'] = app.config.get('SCAN_STREAM_MAX_SECONDS', stream_settings['max_seconds'])
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def _format_event(event_id, scan):
+    return f'id: {event_id}\nevent: scan\ndata: {json.dumps(scan)}\n\n'
+
+
+def stream_scans(station, last_event_id=None):
+    """Generator of SSE text for one subscriber.
+
+    Ends after ``max_seconds`` (the browser reconnects with its
+    ``Last-Event-ID``) or when the subscriber is dropped for falling behind,
+    so a stream never holds a server thread indefinitely.
+    """
+    subscription = scan_broker.subscribe(station, last_event_id)
+    shared = scan_broker.state.shared
+    heartbeat = stream_settings['heartbeat']
+    wait = min(stream_settings['poll_interval'], heartbeat) if shared else heartbeat
+    now = time.monotonic()
+    deadline = now + stream_settings['max_seconds']
+    last_write = now
+    # Ids already sent, so a scan seen both locally and in the store goes out once
+    sent = deque(maxlen=scan_broker.replay_size)
+    newest = max(subscription.current_id, last_event_id or 0)
+    try:
+        yield f'retry: {stream_settings["retry_ms"]}\n\n'
+        for event_id, scan in subscription.replay:
+            sent.append(event_id)
+            newest = max(newest, event_id)
+            yield _format_event(event_id, scan)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.next_event(min(wait, remaining))
+            if event is _DISCONNECT:
+                return
+            if event is None and shared:
+                latest = scan_broker.latest_event(station)
+                if latest and latest[0] > newest:
+                    event = latest
+            if event is not None and event[0] not in sent:
+                sent.append(event[0])
+                newest = max(newest, event[0])
+                last_write = time.monotonic()
+                yield _format_event(*event)
+            elif time.monotonic() - last_write >= heartbeat:
+                last_write = time.monotonic()
+                yield ': keepalive\n\n'
+    finally:
+        scan_broker.unsubscribe(subscription)
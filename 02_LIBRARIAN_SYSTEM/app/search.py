@@ -0,0 +1,491 @@
+"""
+Catalogue full-text search backed by an SQLite FTS5 table.
+
+``books_fts`` holds one row per book (rowid = books.id) with the title,
+author, publisher, isbn and category name. Triggers on ``books`` and
+``categories`` keep it in sync, so writes from the mobile backend's raw
+sqlite3 connections are indexed too. Where FTS5 is unavailable (another
+database engine, or an SQLite built without it) searches fall back to LIKE.
+
+``book_index`` is an in-process trigram index over the words of titles and
+authors, used as a typo-tolerant fallback when the exact search finds
+nothing. ORM events keep it current; code writing books with raw SQL calls
+rebuild_book_index().
+"""
+
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from collections import defaultdict
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy import func, literal_column, text
+
+from . import db
+from .models import Book
+
+# Column weights for bm25(): a title hit counts most, then author and ISBN
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0, 1.0)
+
+BOOKS_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, publisher, isbn, category,
+        tokenize = 'unicode61', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+        VALUES (new.id, new.title, new.author, new.publisher, new.isbn,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_update
+    AFTER UPDATE OF title, author, publisher, isbn, category_id ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+        INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+        VALUES (new.id, new.title, new.author, new.publisher, new.isbn,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_delete AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+        UPDATE books_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM books WHERE category_id = new.id);
+    END
+    """,
+]
+
+BOOKS_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS books_fts_category_rename',
+    'DROP TRIGGER IF EXISTS books_fts_after_delete',
+    'DROP TRIGGER IF EXISTS books_fts_after_update',
+    'DROP TRIGGER IF EXISTS books_fts_after_insert',
+    'DROP TABLE IF EXISTS books_fts',
+]
+
+BOOKS_FTS_POPULATE = """
+    INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+    SELECT b.id, b.title, b.author, b.publisher, b.isbn, c.name
+    FROM books b LEFT JOIN categories c ON c.id = b.category_id
+"""
+
+# Books with ids above the parameter: the work of books_fts_after_insert for a bulk insert made without it
+BOOKS_FTS_INDEX_INSERTED = BOOKS_FTS_POPULATE + "    WHERE b.id > ?\n"
+
+# Kept out of db.metadata so create_all() never tries to build it as a plain table
+books_fts = sa.Table(
+    'books_fts', sa.MetaData(),
+    sa.Column('rowid', sa.Integer, primary_key=True),
+    sa.Column('title', sa.Text),
+    sa.Column('author', sa.Text),
+    sa.Column('publisher', sa.Text),
+    sa.Column('isbn', sa.Text),
+    sa.Column('category', sa.Text),
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_ready = {}
+
+
+def install_book_search_index(connection):
+    """Create books_fts and its triggers if missing, and fill it when first created.
+
+    Returns False when the database cannot host FTS5, leaving LIKE search in place.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    existed = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )).first() is not None
+    try:
+        for statement in BOOKS_FTS_DDL:
+            connection.execute(text(statement))
+    except sa.exc.OperationalError:
+        return False
+    if not existed:
+        connection.execute(text(BOOKS_FTS_POPULATE))
+    return True
+
+
+def rebuild_book_search_index(connection):
+    """Repopulate books_fts from the books table; returns the number of rows indexed"""
+    connection.execute(text('DELETE FROM books_fts'))
+    return connection.execute(text(BOOKS_FTS_POPULATE)).rowcount
+
+
+def init_app(app):
+    """Install the index for the app's database and remember whether it is usable"""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            _fts_ready[db.engine.url] = install_book_search_index(connection)
+
+
+def fts_enabled():
+    engine = db.engine
+    if engine.url not in _fts_ready:
+        with engine.connect() as connection:
+            _fts_ready[engine.url] = connection.dialect.name == 'sqlite' and connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+            )).first() is not None
+    return _fts_ready[engine.url]
+
+
+def fts_match_expression(search):
+    """Turn free text into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted, so FTS5 operators typed by a user are searched for
+    literally. Returns None when the text contains no searchable word.
+    """
+    tokens = _TOKEN_RE.findall(search)
+    if not tokens:
+        return None
+    return ' '.join('"%s"*' % token for token in tokens)
+
+
+def book_search_rank():
+    """bm25() score of the current books_fts match; lower is more relevant"""
+    return func.bm25(literal_column('books_fts'), *BM25_WEIGHTS)
+
+
+def search_books(query, search, fields=('title', 'author', 'isbn')):
+    """Restrict a Book query to matches for ``search``.
+
+    Returns ``(query, rank)``. With FTS5 the query is joined to books_fts and
+    ``rank`` is the bm25 expression to order by. On the LIKE fallback
+    ``rank`` is None and ``fields`` are matched as substrings.
+    """
+    if fts_enabled():
+        match = fts_match_expression(search)
+        if match is None:
+            return query.filter(sa.false()), None
+        query = query.join(books_fts, books_fts.c.rowid == Book.id)\
+                     .filter(literal_column('books_fts').op('MATCH')(match))
+        return query, book_search_rank()
+
+    condition = sa.or_(*[getattr(Book, field).contains(search) for field in fields])
+    return query.filter(condition), None
+
+
+# ---------------------------------------------------------------------------
+# Typo-tolerant fallback: in-process trigram index over title and author words
+# ---------------------------------------------------------------------------
+
+def normalize_word(word):
+    """Lower-case and strip diacritics, as FTS5's unicode61 tokenizer does"""
+    decomposed = unicodedata.normalize('NFKD', word.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def word_tokens(value):
+    """Distinct normalized words of a title or author"""
+    return {normalize_word(word) for word in _TOKEN_RE.findall(value or '')}
+
+
+def _trigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (an adjacent swap costs 1), or limit + 1 once above ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletions(word):
+    """The word itself and every variant with one letter removed"""
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def allowed_edits(word, max_distance):
+    """Typos tolerated in a query word: none under 3 letters, one under 6"""
+    if len(word) < 3:
+        return 0
+    if len(word) < 6:
+        return min(1, max_distance)
+    return max_distance
+
+
+class TrigramIndex:
+    """Fuzzy lookup of the words used in book titles and authors.
+
+    Each distinct word gets an id, a reference count (how many title/author
+    fields use it) and an entry in the posting list of each of its trigrams.
+    Short words, where a single typo can break every trigram, are instead
+    also posted under each one-letter deletion of themselves. Only the
+    vocabulary is held, never per-book data, so memory follows the number of
+    distinct words, capped at ``max_words``. Matching books are then found
+    through books_fts.
+
+    Uncounted words keep their slot until the next rebuild, so once
+    ``DEAD_SHARE`` of the vocabulary is unused, or a new word finds the
+    index full while unused words hold slots, the index marks itself
+    unbuilt and the next fuzzy search rebuilds it. A new word that finds it
+    full of words in use is dropped, as a rebuild would, and counted.
+    """
+
+    # Query words shorter than this allow one edit and are looked up by deletions
+    SHORT_WORD = 6
+    # Share of unused words at which the index asks to be rebuilt
+    DEAD_SHARE = 0.25
+
+    def __init__(self, max_words=500000):
+        self.max_words = max_words
+        self._lock = threading.RLock()
+        self.built = False
+        self._word_ids = {}
+        self._words = []
+        self._uses = array('I')
+        self._words_by_key = {}
+        self._dead = 0       # words whose use count is back to zero
+        self.dropped = 0     # new words not added because the index was full
+
+    def _add_word(self, word, uses):
+        word_id = self._word_ids.get(word)
+        if word_id is not None:
+            if not self._uses[word_id] and uses:
+                self._dead -= 1
+            self._uses[word_id] += uses
+            return
+        if len(self._words) >= self.max_words:
+            if self._dead:
+                self.built = False
+            else:
+                self.dropped += 1
+            return
+        word_id = len(self._words)
+        self._word_ids[word] = word_id
+        self._words.append(word)
+        self._uses.append(uses)
+        keys = _trigrams(word)
+        if len(word) <= self.SHORT_WORD:
+            keys |= {'-' + variant for variant in _deletions(word)}
+        for key in keys:
+            posting = self._words_by_key.get(key)
+            if posting is None:
+                posting = self._words_by_key[key] = array('I')
+            posting.append(word_id)
+
+    def rebuild(self, word_uses):
+        """Replace the vocabulary with ``word_uses`` of (word, use count); returns the word count.
+
+        The most used words are kept when there are more than ``max_words``.
+        The new index is built on the side and swapped in, so searches keep
+        using the old one meanwhile.
+        """
+        fresh = TrigramIndex(self.max_words)
+        for word, uses in heapq.nlargest(self.max_words, word_uses, key=lambda item: item[1]):
+            fresh._add_word(word, uses)
+        with self._lock:
+            self._word_ids = fresh._word_ids
+            self._words = fresh._words
+            self._uses = fresh._uses
+            self._words_by_key = fresh._words_by_key
+            self._dead = 0
+            self.dropped = 0
+            self.built = True
+            return len(self._words)
+
+    def add(self, *values):
+        """Count the words of newly written title/author ``values``"""
+        with self._lock:
+            if self.built:
+                for value in values:
+                    for word in word_tokens(value):
+                        self._add_word(word, 1)
+
+    def invalidate(self):
+        """Drop the vocabulary after a bulk write; the next fuzzy search rebuilds it"""
+        with self._lock:
+            self.built = False
+
+    def remove(self, *values):
+        """Uncount the words of overwritten or deleted title/author ``values``"""
+        with self._lock:
+            if not self.built:
+                return
+            for value in values:
+                for word in word_tokens(value):
+                    word_id = self._word_ids.get(word)
+                    if word_id is not None and self._uses[word_id]:
+                        self._uses[word_id] -= 1
+                        if not self._uses[word_id]:
+                            self._dead += 1
+            if self._dead > self.DEAD_SHARE * len(self._words):
+                self.built = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self.built,
+                'words': len(self._words),
+                'live_words': len(self._words) - self._dead,
+                'dropped_words': self.dropped,
+                'keys': len(self._words_by_key),
+                'posting_bytes': 4 * sum(len(ids) for ids in self._words_by_key.values()),
+            }
+
+    def close_words(self, query_word, max_distance):
+        """{vocabulary word: distance} for words within the edits allowed for ``query_word``"""
+        query_word = normalize_word(query_word)
+        allowed = allowed_edits(query_word, max_distance)
+        with self._lock:
+            exact = self._word_ids.get(query_word)
+            if allowed == 0:
+                return {query_word: 0} if exact is not None and self._uses[exact] else {}
+
+            if len(query_word) < self.SHORT_WORD:
+                # Words one edit away share a one-letter deletion with the query
+                keys, min_shared = {'-' + variant for variant in _deletions(query_word)}, 1
+            else:
+                # One edit breaks at most three trigrams (four for a swap)
+                keys = _trigrams(query_word)
+                min_shared = max(1, len(keys) - 4 * allowed)
+            shared = defaultdict(int)
+            for key in keys:
+                for word_id in self._words_by_key.get(key, ()):
+                    shared[word_id] += 1
+
+            close = {}
+            shortest, longest = len(query_word) - allowed, len(query_word) + allowed
+            for word_id, count in shared.items():
+                word = self._words[word_id]
+                if count < min_shared or not shortest <= len(word) <= longest or not self._uses[word_id]:
+                    continue
+                distance = edit_distance(query_word, word, allowed)
+                if distance <= allowed:
+                    close[word] = distance
+            return close
+
+
+book_index = TrigramIndex()
+
+# fts5vocab view of books_fts: one row per (word, column) with its document count
+_BOOK_WORD_USES = """
+    SELECT term, sum(doc) FROM temp.books_fts_words
+    WHERE col IN ('title', 'author') GROUP BY term
+"""
+
+
+def rebuild_book_index():
+    """Reload ``book_index`` from the words books_fts has indexed; returns the word count"""
+    book_index.max_words = current_app.config.get('SEARCH_FUZZY_MAX_WORDS', book_index.max_words)
+    if not fts_enabled():
+        return book_index.rebuild([])
+    with db.engine.connect() as connection:
+        connection.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS temp.books_fts_words USING fts5vocab(main, books_fts, col)'
+        ))
+        return book_index.rebuild(connection.execute(text(_BOOK_WORD_USES)))
+
+
+def _fts_term_group(words):
+    return '(' + ' OR '.join('"%s"' % word for word in sorted(words)) + ')'
+
+
+def fuzzy_book_ids(search):
+    """Ids of books matching every word of ``search`` despite typos, best first.
+
+    Each query word is widened to the vocabulary words within the allowed
+    edit distance and books_fts is searched in title and author. Books
+    reachable with single-letter corrections rank ahead of those needing
+    more, then by bm25. Returns [] where FTS5 is unavailable.
+    """
+    if not fts_enabled():
+        return []
+    if not book_index.built:
+        rebuild_book_index()
+
+    max_distance = current_app.config.get('SEARCH_FUZZY_MAX_DISTANCE', 2)
+    limit = current_app.config.get('SEARCH_FUZZY_MAX_RESULTS', 50)
+    query_words = list(dict.fromkeys(_TOKEN_RE.findall(search)))
+    if not query_words:
+        return []
+    candidates = [book_index.close_words(word, max_distance) for word in query_words]
+    if not all(candidates):
+        return []
+
+    ranked = []
+    for tier in range(1, max_distance + 1):
+        groups = [{word for word, distance in close.items() if distance <= tier} for close in candidates]
+        if not all(groups):
+            continue
+        match = '{title author} : ' + ' AND '.join(_fts_term_group(words) for words in groups)
+        query = sa.select(books_fts.c.rowid)\
+                  .where(literal_column('books_fts').op('MATCH')(match))\
+                  .order_by(book_search_rank())\
+                  .limit(limit + len(ranked))
+        found = set(ranked)
+        ranked.extend(book_id for book_id in db.session.execute(query).scalars() if book_id not in found)
+        if len(ranked) >= limit:
+            break
+    return ranked[:limit]
+
+
+def _after_book_insert(mapper, connection, target):
+    _queue_index_change(target, 'add', target.title, target.author)
+
+
+def _after_book_update(mapper, connection, target):
+    state = sa.inspect(target)
+    for attribute in ('title', 'author'):
+        history = state.attrs[attribute].history
+        if history.has_changes():
+            _queue_index_change(target, 'remove', *history.deleted)
+            _queue_index_change(target, 'add', *history.added)
+
+
+def _before_book_delete(mapper, connection, target):
+    _queue_index_change(target, 'remove', target.title, target.author)
+
+
+def _queue_index_change(target, action, *values):
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault('book_index_changes', []).append((action, values))
+
+
+def _apply_index_changes(session):
+    for action, values in session.info.pop('book_index_changes', ()):
+        if action == 'add':
+            book_index.add(*values)
+        else:
+            book_index.remove(*values)
+
+
+def _discard_index_changes(session):
+    session.info.pop('book_index_changes', None)
+
+
+# Book writes made through the ORM reach the index once their transaction commits
+sa.event.listen(Book, 'after_insert', _after_book_insert)
+sa.event.listen(Book, 'after_update', _after_book_update)
+sa.event.listen(Book, 'before_delete', _before_book_delete)
+sa.event.listen(sa.orm.Session, 'after_commit', _apply_index_changes)
+sa.event.listen(sa.orm.Session, 'after_rollback', _discard_index_changes)
@@ -0,0 +1,258 @@
+"""
+Small key/value store for state the API shares between requests, such as
+the latest scan and event id per scan station.
+
+``STATE_STORE_BACKEND`` picks the implementation:
+
+``sqlite``
+    rows in the ``state_entries`` table of the app database, so every worker
+    process sees the same state and it survives restarts (the default).
+``memory``
+    a per-process LRU; fine for a single worker.
+
+Both take a TTL per key and hold at most ``STATE_STORE_MAX_ENTRIES`` keys,
+evicting the least recently written. Values must be JSON-serializable. A
+networked backend (e.g. Redis) only has to implement the abstract
+``StateStore`` methods and register a factory under its name in
+``BACKENDS``.
+"""
+
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import sqlalchemy as sa
+
+import shared_db
+
+
+class StateStore(ABC):
+    """Interface: namespaced keys with optional per-key TTL (seconds)"""
+
+    # True when other processes see the same state, so they need not be told about changes
+    shared = False
+
+    @abstractmethod
+    def get(self, namespace, key, default=None):
+        pass
+
+    @abstractmethod
+    def get_many(self, namespace, keys):
+        """``{key: value}`` for the keys that exist"""
+
+    @abstractmethod
+    def set(self, namespace, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, namespace, key):
+        pass
+
+    @abstractmethod
+    def incr(self, namespace, key):
+        """Add one to an integer value (missing counts as 0) and return it"""
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Thread-safe in-process LRU with expiry"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (namespace, key) -> (value, expires_at or None)
+        self.evictions = 0
+
+    def _live(self, entry_key, now):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[entry_key]
+            return None
+        return entry
+
+    def _store(self, entry_key, value, ttl):
+        self._entries[entry_key] = (value, time.time() + ttl if ttl else None)
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._live((namespace, str(key)), time.time())
+            return default if entry is None else entry[0]
+
+    def get_many(self, namespace, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._live((namespace, str(key)), now)
+                if entry is not None:
+                    found[key] = entry[0]
+        return found
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._store((namespace, str(key)), value, ttl)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, str(key)), None)
+
+    def incr(self, namespace, key):
+        entry_key = (namespace, str(key))
+        with self._lock:
+            entry = self._live(entry_key, time.time())
+            value = (entry[0] if entry is not None else 0) + 1
+            self._store(entry_key, value, None)
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries),
+                    'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class SQLiteStateStore(StateStore):
+    """Rows in ``state_entries``, written on their own short transactions.
+
+    Expired rows are ignored on read and deleted, together with the oldest
+    rows beyond ``max_entries``, every ``prune_every`` writes.
+    """
+
+    shared = True
+
+    def __init__(self, engine, max_entries=100000, prune_every=200):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _read(self, sql, params):
+        with self.engine.connect() as connection:
+            return connection.execute(sa.text(sql), params).fetchall()
+
+    def _write(self, sql, params):
+        def work():
+            with self.engine.connect() as connection:
+                connection.execution_options(**{shared_db.BEGIN_MODE_OPTION: 'immediate'})
+                with connection.begin():
+                    result = connection.execute(sa.text(sql), params)
+                    return result.fetchall() if result.returns_rows else None
+
+        rows = shared_db.retry_on_busy(work)
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.prune_every == 0
+        if due:
+            self.prune()
+        return rows
+
+    def get(self, namespace, key, default=None):
+        rows = self._read(
+            "SELECT value FROM state_entries WHERE namespace = :namespace AND key = :key "
+            "AND (expires_at IS NULL OR expires_at > :now)",
+            {'namespace': namespace, 'key': str(key), 'now': time.time()})
+        return json.loads(rows[0][0]) if rows else default
+
+    def get_many(self, namespace, keys):
+        by_text = {str(key): key for key in keys}
+        if not by_text:
+            return {}
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                sa.text("SELECT key, value FROM state_entries WHERE namespace = :namespace "
+                        "AND key IN :keys AND (expires_at IS NULL OR expires_at > :now)")
+                .bindparams(sa.bindparam('keys', expanding=True)),
+                {'namespace': namespace, 'keys': list(by_text), 'now': time.time()}).fetchall()
+        return {by_text[key]: json.loads(value) for key, value in rows}
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        self._write(
+            "INSERT INTO state_entries (namespace, key, value, expires_at, updated_at) "
+            "VALUES (:namespace, :key, :value, :expires_at, :now) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, "
+            "expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+            {'namespace': namespace, 'key': str(key), 'value': json.dumps(value),
+             'expires_at': now + ttl if ttl else None, 'now': now})
+
+    def delete(self, namespace, key):
+        self._write("DELETE FROM state_entries WHERE namespace = :namespace AND key = :key",
+                    {'namespace': namespace, 'key': str(key)})
+
+    def incr(self, namespace, key):
+        rows = self._write(
+            "INSERT INTO state_entries (namespace, key, value, expires_at, updated_at) "
+            "VALUES (:namespace, :key, '1', NULL, :now) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET "
+            "value = CAST(CASE WHEN expires_at IS NOT NULL AND expires_at <= :now THEN 0 "
+            "ELSE CAST(value AS INTEGER) END + 1 AS TEXT), expires_at = NULL, updated_at = :now "
+            "RETURNING value",
+            {'namespace': namespace, 'key': str(key), 'now': time.time()})
+        return int(rows[0][0])
+
+    def prune(self):
+        """Delete expired rows, then the least recently written beyond ``max_entries``"""
+        def work():
+            with self.engine.connect() as connection:
+                connection.execution_options(**{shared_db.BEGIN_MODE_OPTION: 'immediate'})
+                with connection.begin():
+                    connection.execute(sa.text("DELETE FROM state_entries WHERE expires_at <= :now"),
+                                       {'now': time.time()})
+                    excess = connection.execute(sa.text(
+                        "SELECT COUNT(*) FROM state_entries")).scalar() - self.max_entries
+                    if excess > 0:
+                        connection.execute(sa.text(
+                            "DELETE FROM state_entries WHERE rowid IN "
+                            "(SELECT rowid FROM state_entries ORDER BY updated_at LIMIT :excess)"
+                        ), {'excess': excess})
+                    return max(excess, 0)
+
+        evicted = shared_db.retry_on_busy(work)
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self):
+        entries = self._read("SELECT COUNT(*) FROM state_entries", {})[0][0]
+        return {'backend': 'sqlite', 'entries': entries,
+                'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+# STATE_STORE_BACKEND name -> factory(engine, max_entries)
+BACKENDS = {
+    'memory': lambda engine, max_entries: MemoryStateStore(max_entries),
+    'sqlite': SQLiteStateStore,
+}
+
+
+def create_state_store(app, engine):
+    backend = app.config.get('STATE_STORE_BACKEND', 'sqlite')
+    factory = BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f'STATE_STORE_BACKEND must be one of {", ".join(BACKENDS)}, not {backend!r}')
+    return factory(engine, app.config.get('STATE_STORE_MAX_ENTRIES', 100000))
+
+
+def init_app(app):
+    """Create the configured store as ``app.extensions['state_store']``"""
+    from . import db
+
+    with app.app_context():
+        app.extensions['state_store'] = create_state_store(app, db.engine)
+
+
+def get_state_store():
+    from flask import current_app
+
+    return current_app.extensions['state_store']
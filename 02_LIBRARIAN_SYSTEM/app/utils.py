@@ -1,10 +1,147 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import wraps
 from flask import current_app
-from .models import Transaction, User, Book, Category
-from . import db
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from .models import Transaction, User, Book, Category, LibraryStats, CategoryStats
+from . import db, shared_db
+from .notifications import add_due_notifications, on_loan_opened, on_loan_closed
 
-def calculate_overdue_fines():
+ACTIVE_STATUSES = ('issued', 'overdue')
+
+def write_transaction(fn):
+    """Run ``fn`` as one write transaction, retried while the database is busy.
+    
+    The transaction starts with ``BEGIN IMMEDIATE`` so the write lock is taken
+    (and its wait timed) before ``fn`` reads anything. A transaction the
+    session opened only to read (a lookup before the write, say) is rolled
+    back first, so those reads are redone under the lock. If SQLite is still
+    busy after the busy timeout the transaction is rolled back and ``fn``
+    runs again with backoff. ``fn`` must commit its own changes, and when it
+    returns without committing, or raises (a 404 from ``get_or_404``
+    included), the transaction is rolled back to free the lock.
+    
+    Called inside a transaction that has already written or holds the lock,
+    ``fn`` simply joins it; committing and retrying are then the caller's.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = db.session()
+        if session.in_transaction() and (session.new or session.dirty or session.deleted
+                                         or shared_db.holds_write_lock(session.connection())):
+            return fn(*args, **kwargs)
+        
+        def attempt():
+            session.rollback()
+            session.connection(execution_options={shared_db.BEGIN_MODE_OPTION: 'immediate'})
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                session.rollback()
+                raise
+            if session.in_transaction():
+                session.rollback()
+            return result
+        return shared_db.retry_on_busy(attempt)
+    return wrapper
+
+def overdue_days_expr(due_date, now):
+    """SQL expression for whole days overdue, identical to ``(now - due_date).days``.
+    
+    The whole-day difference comes from julianday() over the date parts, which
+    is exact, minus one while the time of day has not yet come round again.
+    """
+    now_text = now.strftime('%Y-%m-%d %H:%M:%S.%f')
+    return (
+        db.cast(func.julianday(func.date(now_text)) - func.julianday(func.date(due_date)), db.Integer)
+        - case((func.substr(due_date, 12) > now_text[11:], 1), else_=0)
+    )
+
+def _supports_bulk_fines():
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+def _bulk_overdue_fines(now, statuses, extra_conditions=()):
+    """Set-based fine recalculation for loans in ``statuses`` that are past due.
+    
+    One ``UPDATE ... WHERE`` does the overdue-day arithmetic, the
+    ``status='overdue'`` flip and the watermark, and only touches rows whose
+    fine, status or watermark actually changes. Like the ORM loop, every
+    loan it reads gets its watermark, but only those whose fine or status
+    changed are counted, so the return value matches its ``updated_count``.
+    """
+    t = Transaction.__table__
+    fine_rate = current_app.config.get('FINE_RATE', 5)
+    overdue_days = overdue_days_expr(t.c.due_date, now)
+    new_fine = overdue_days * fine_rate
+    computed_through = func.date(
+        t.c.due_date, '+' + db.cast(overdue_days, db.String) + ' days', type_=db.String
+    ).concat(func.substr(t.c.due_date, 11))
+    
+    fine_changes = db.or_(t.c.fine_amount.is_distinct_from(new_fine), t.c.status != 'overdue')
+    conditions = [t.c.status.in_(statuses), t.c.due_date < now, *extra_conditions]
+    
+    changed = db.session.execute(
+        db.select(func.count()).select_from(t).where(fine_changes, *conditions)
+    ).scalar()
+    db.session.execute(
+        db.update(t)
+        .where(db.or_(fine_changes, t.c.fines_computed_through.is_distinct_from(computed_through)), *conditions)
+        .values(fine_amount=new_fine, status='overdue', fines_computed_through=computed_through)
+    )
+    return changed
+
+@write_transaction
+def accrue_fines(bulk=True):
+    """Advance fines for active loans whose next overdue day boundary has passed.
+    
+    This is the scheduled fine batch (``flask calculate-fines``). Each
+    transaction remembers the day boundary its fine was computed through, so
+    only loans that have crossed a new boundary since the last run are touched.
+    """
+    now = datetime.utcnow()
+    crossed_boundary = db.or_(
+        Transaction.fines_computed_through.is_(None),
+        Transaction.fines_computed_through <= now - timedelta(days=1)
+    )
+    
+    if bulk and _supports_bulk_fines():
+        updated_count = _bulk_overdue_fines(now, ACTIVE_STATUSES, [crossed_boundary])
+        _refresh_loan_stats()
+        db.session.commit()
+        return updated_count
+    
+    pending_transactions = Transaction.query.filter(
+        Transaction.status.in_(ACTIVE_STATUSES),
+        Transaction.due_date < now,
+        crossed_boundary
+    ).all()
+    
+    fine_rate = current_app.config.get('FINE_RATE', 5)
+    updated_count = 0
+    
+    for transaction in pending_transactions:
+        old_fine = transaction.fine_amount
+        old_status = transaction.status
+        
+        transaction.calculate_fine(fine_rate)
+        
+        if transaction.fine_amount != old_fine or old_status != transaction.status:
+            updated_count += 1
+    
+    _refresh_loan_stats()
+    db.session.commit()
+    return updated_count
+
+@write_transaction
+def calculate_overdue_fines(bulk=True):
     """Calculate fines for all overdue transactions and update their status"""
+    if bulk and _supports_bulk_fines():
+        updated_count = _bulk_overdue_fines(datetime.utcnow(), ['issued'])
+        _refresh_loan_stats()
+        db.session.commit()
+        return updated_count
+    
     # Find all issued transactions that are past due date
     overdue_transactions = Transaction.query.filter(
         Transaction.status == 'issued',
@@ -24,11 +161,32 @@ def calculate_overdue_fines():
         if transaction.fine_amount != old_fine or old_status != transaction.status:
             updated_count += 1
     
+    _refresh_loan_stats()
     db.session.commit()
     return updated_count
 
-def update_all_transaction_fines():
+@write_transaction
+def update_all_transaction_fines(bulk=True):
     """Update fines for all active transactions (issued and overdue)"""
+    if bulk and _supports_bulk_fines():
+        now = datetime.utcnow()
+        updated_count = _bulk_overdue_fines(now, ACTIVE_STATUSES)
+        
+        # Loans not yet due carry no fine
+        t = Transaction.__table__
+        updated_count += db.session.execute(
+            db.update(t)
+            .where(
+                t.c.status.in_(ACTIVE_STATUSES),
+                t.c.due_date >= now,
+                t.c.fine_amount.is_distinct_from(0.0)
+            )
+            .values(fine_amount=0.0)
+        ).rowcount
+        _refresh_loan_stats()
+        db.session.commit()
+        return updated_count
+    
     active_transactions = Transaction.query.filter(
         Transaction.status.in_(['issued', 'overdue'])
     ).all()
@@ -46,6 +204,7 @@ def update_all_transaction_fines():
         if transaction.fine_amount != old_fine or old_status != transaction.status:
             updated_count += 1
     
+    _refresh_loan_stats()
     db.session.commit()
     return updated_count
 
@@ -65,116 +224,309 @@ def send_overdue_reminders():
     
     return reminders_sent
 
-def get_dashboard_stats():
-    """Get statistics for dashboard"""
-    from sqlalchemy import func, extract
+@write_transaction
+def generate_notifications():
+    """Write the overdue, due-soon and reservation notifications that are missing.
+    
+    Scheduled next to the fine run (``flask generate-notifications``);
+    returns how many notifications were added.
+    """
+    added = add_due_notifications()
+    db.session.commit()
+    return added
+
+def _compute_library_stats():
+    """Recompute the materialized counters from the raw tables"""
+    total_books, total_copies, available_copies = db.session.query(
+        func.count(Book.id),
+        func.coalesce(func.sum(Book.total_copies), 0),
+        func.coalesce(func.sum(Book.available_copies), 0)
+    ).one()
+    issued_count, overdue_count, total_fines = db.session.query(
+        func.coalesce(func.sum(case((Transaction.status == 'issued', 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.status == 'overdue', 1), else_=0)), 0),
+        func.coalesce(func.sum(Transaction.fine_amount), 0.0)
+    ).one()
+    return {
+        'total_books': total_books,
+        'total_copies': total_copies,
+        'available_copies': available_copies,
+        'issued_count': issued_count,
+        'overdue_count': overdue_count,
+        'total_fines': float(total_fines),
+    }
+
+def rebuild_library_stats():
+    """Recompute library_stats and category_stats from scratch.
+    
+    Returns ``{counter: (stored, actual)}`` for every counter that had
+    drifted. The caller commits.
+    """
+    stats = db.session.get(LibraryStats, 1)
+    if stats is None:
+        stats = LibraryStats(id=1)
+        db.session.add(stats)
+    
+    drift = {}
+    for name, value in _compute_library_stats().items():
+        stored = getattr(stats, name)
+        if stored != value:
+            drift[name] = (stored, value)
+        setattr(stats, name, value)
+    
+    borrow_counts = dict(db.session.query(Book.category_id, func.count(Transaction.id))
+                         .join(Transaction, Transaction.book_id == Book.id)
+                         .group_by(Book.category_id).all())
+    for row in CategoryStats.query.all():
+        actual = borrow_counts.pop(row.category_id, 0)
+        if row.borrow_count != actual:
+            drift[f'category:{row.category_id}'] = (row.borrow_count, actual)
+        row.borrow_count = actual
+    for category_id, actual in borrow_counts.items():
+        drift[f'category:{category_id}'] = (None, actual)
+        db.session.add(CategoryStats(category_id=category_id, borrow_count=actual))
+    
+    db.session.flush()
+    return drift
+
+def get_library_stats():
+    """The materialized counters row, built on first use"""
+    stats = db.session.get(LibraryStats, 1)
+    if stats is None:
+        rebuild_library_stats()
+        db.session.commit()
+        stats = db.session.get(LibraryStats, 1)
+    return stats
+
+def bump_library_stats(**deltas):
+    """Apply counter deltas to library_stats inside the caller's transaction.
     
-    # Basic counts
-    total_books = Book.query.count()
-    total_users = User.query.filter_by(role='user').count()
-    issued_books = Transaction.query.filter(Transaction.status == 'issued').count()
-    overdue_books = Transaction.query.filter(Transaction.status == 'overdue').count()
-    total_fines = db.session.query(func.sum(Transaction.fine_amount)).scalar() or 0
+    Uses ``SET col = col + delta`` so concurrent writers never lose updates.
+    Nothing is written until the row exists; the first read builds it.
+    """
+    values = {getattr(LibraryStats, name): getattr(LibraryStats, name) + delta
+              for name, delta in deltas.items() if delta}
+    if values:
+        LibraryStats.query.filter_by(id=1).update(values, synchronize_session=False)
+
+def _refresh_loan_stats():
+    """Re-derive the loan counters after a fine run, inside its transaction"""
+    values = _compute_library_stats()
+    LibraryStats.query.filter_by(id=1).update({
+        LibraryStats.issued_count: values['issued_count'],
+        LibraryStats.overdue_count: values['overdue_count'],
+        LibraryStats.total_fines: values['total_fines'],
+    }, synchronize_session=False)
+
+def _bump_category_borrows(category_id):
+    updated = CategoryStats.query.filter_by(category_id=category_id).update(
+        {CategoryStats.borrow_count: CategoryStats.borrow_count + 1}, synchronize_session=False
+    )
+    if not updated and db.session.get(LibraryStats, 1) is not None:
+        db.session.add(CategoryStats(category_id=category_id, borrow_count=1))
+
+def record_book_category_changed(book, old_category_id):
+    """Move the book's loans from its old category's borrow count to its new one"""
+    if book.category_id == old_category_id:
+        return
+    moved = Transaction.query.filter_by(book_id=book.id).count()
+    if not moved:
+        return
+    CategoryStats.query.filter_by(category_id=old_category_id).update(
+        {CategoryStats.borrow_count: CategoryStats.borrow_count - moved}, synchronize_session=False
+    )
+    updated = CategoryStats.query.filter_by(category_id=book.category_id).update(
+        {CategoryStats.borrow_count: CategoryStats.borrow_count + moved}, synchronize_session=False
+    )
+    if not updated and db.session.get(LibraryStats, 1) is not None:
+        db.session.add(CategoryStats(category_id=book.category_id, borrow_count=moved))
+
+def record_book_added(book):
+    bump_library_stats(total_books=1, total_copies=book.total_copies or 0,
+                       available_copies=book.available_copies or 0)
+
+def record_book_removed(book):
+    bump_library_stats(total_books=-1, total_copies=-(book.total_copies or 0),
+                       available_copies=-(book.available_copies or 0))
+
+def record_book_copies_changed(book, old_total, old_available):
+    bump_library_stats(total_copies=(book.total_copies or 0) - (old_total or 0),
+                       available_copies=(book.available_copies or 0) - (old_available or 0))
+
+def record_book_returned(transaction, old_status, old_fine):
+    """Counter deltas for a loan that has just been marked returned"""
+    bump_library_stats(
+        available_copies=1,
+        issued_count=-1 if old_status == 'issued' else 0,
+        overdue_count=-1 if old_status == 'overdue' else 0,
+        total_fines=(transaction.fine_amount or 0.0) - (old_fine or 0.0)
+    )
+
+def _last_month_starts(now, count):
+    """First instant of each of the last ``count`` calendar months, oldest first"""
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(count):
+        starts.append(datetime(year, month, 1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return starts[::-1]
+
+def get_dashboard_stats():
+    """Get statistics for dashboard.
     
-    # Calculate total copies and available copies
-    total_copies = db.session.query(func.sum(Book.total_copies)).scalar() or 0
-    available_copies = db.session.query(func.sum(Book.available_copies)).scalar() or 0
+    Book, loan and fine totals come from the materialized ``library_stats``
+    row; overdue and fine totals are as of the last fine run.
+    """
+    now = datetime.utcnow()
+    library_stats = get_library_stats()
+    total_copies = library_stats.total_copies
+    available_copies = library_stats.available_copies
     
     # Calculate availability percentage
     availability_percentage = round((available_copies / total_copies * 100), 1) if total_copies > 0 else 0
     
-    # Get new users this week
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
-    new_users_this_week = User.query.filter(
-        User.created_at >= one_week_ago,
-        User.role == 'user'
-    ).count()
+    # User totals, including new users this week
+    one_week_ago = now - timedelta(days=7)
+    total_users, new_users_this_week = db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.created_at >= one_week_ago, 1), else_=0)), 0)
+    ).filter(User.role == 'user').one()
+    
+    # Monthly circulation for the last 10 calendar months, bucketed in SQL
+    month_starts = _last_month_starts(now, 10)
+    issue_month = func.strftime('%Y-%m', Transaction.issue_date)
+    issued_by_month = dict(db.session.query(issue_month, func.count(Transaction.id))
+                           .filter(Transaction.issue_date >= month_starts[0])
+                           .group_by(issue_month).all())
+    return_month = func.strftime('%Y-%m', Transaction.return_date)
+    returned_by_month = dict(db.session.query(return_month, func.count(Transaction.id))
+                             .filter(Transaction.return_date >= month_starts[0],
+                                     Transaction.status == 'returned')
+                             .group_by(return_month).all())
     
-    # Get monthly circulation data for the last 10 months
     circulation_data = []
-    for i in range(9, -1, -1):
-        month_start = datetime.utcnow().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        
-        issued_count = Transaction.query.filter(
-            Transaction.issue_date >= month_start,
-            Transaction.issue_date < month_end
-        ).count()
-        
-        returned_count = Transaction.query.filter(
-            Transaction.return_date >= month_start,
-            Transaction.return_date < month_end,
-            Transaction.status == 'returned'
-        ).count()
-        
+    for month_start in month_starts:
+        key = month_start.strftime('%Y-%m')
         circulation_data.append({
             'month': month_start.strftime('%b'),
-            'issued': issued_count,
-            'returned': returned_count
+            'issued': issued_by_month.get(key, 0),
+            'returned': returned_by_month.get(key, 0)
         })
     
     # Get top 5 categories by borrow count
     category_stats = db.session.query(
         Category.name,
-        func.count(Transaction.id).label('borrow_count')
-    ).join(Book, Book.category_id == Category.id)\
-     .join(Transaction, Transaction.book_id == Book.id)\
-     .group_by(Category.id, Category.name)\
-     .order_by(func.count(Transaction.id).desc())\
+        CategoryStats.borrow_count
+    ).join(CategoryStats, CategoryStats.category_id == Category.id)\
+     .filter(CategoryStats.borrow_count > 0)\
+     .order_by(CategoryStats.borrow_count.desc())\
      .limit(5)\
      .all()
     
     stats = {
-        'total_books': total_books,
+        'total_books': library_stats.total_books,
         'total_copies': total_copies,
         'available_copies': available_copies,
         'availability_percentage': availability_percentage,
         'total_users': total_users,
         'new_users_this_week': new_users_this_week,
-        'total_issued': issued_books,
-        'overdue_count': overdue_books,
-        'total_fines': round(total_fines, 2),
+        'total_issued': library_stats.issued_count,
+        'overdue_count': library_stats.overdue_count,
+        'total_fines': round(library_stats.total_fines, 2),
         'circulation_data': circulation_data,
         'category_stats': [{'name': name, 'count': count} for name, count in category_stats]
     }
     return stats
 
-def issue_book(user_id, book_id, due_date=None):
-    """Issue a book to a user"""
-    user = User.query.get_or_404(user_id)
-    book = Book.query.get_or_404(book_id)
+def _open_loan(user_id, book, due_date=None):
+    """Claim a copy of ``book`` and open a loan for the user, without committing.
     
-    if not book.is_available():
-        return False, "Book is not available"
+    The copy is claimed with one conditional ``UPDATE ... WHERE
+    available_copies > 0``, so two stations issuing the last copy at once
+    cannot both succeed, and the ``ux_transactions_active_loan`` index turns a
+    racing duplicate loan into an IntegrityError that is reported like the
+    up-front check. The work runs in a savepoint, so a refusal leaves the
+    rest of the caller's transaction alone. Returns ``(transaction, message)``
+    with ``transaction`` None when the book could not be issued.
+    """
+    savepoint = db.session.begin_nested()
+    
+    # Claim a copy only if one is left
+    claimed = db.session.execute(
+        db.update(Book)
+        .where(Book.id == book.id, Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1)
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    
+    if not claimed:
+        savepoint.rollback()
+        return None, "Book is not available"
     
     if due_date is None:
         due_date = datetime.utcnow() + timedelta(days=14)
+    elif not isinstance(due_date, datetime):
+        # The issue form gives a date; it is stored as midnight, and the notice check compares datetimes
+        due_date = datetime.combine(due_date, datetime.min.time())
     
     # Check if user already has this book issued or overdue
     existing_transaction = Transaction.query.filter(
         Transaction.user_id == user_id,
-        Transaction.book_id == book_id,
+        Transaction.book_id == book.id,
         Transaction.status.in_(['issued', 'overdue'])
     ).first()
     
     if existing_transaction:
-        return False, "User already has this book issued"
+        savepoint.rollback()
+        return None, "User already has this book issued"
     
     # Create transaction
     transaction = Transaction(
         user_id=user_id,
-        book_id=book_id,
+        book_id=book.id,
         due_date=due_date
     )
     
-    # Update book availability
-    book.available_copies -= 1
-    
     db.session.add(transaction)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        savepoint.rollback()
+        return None, "User already has this book issued"
+    
+    bump_library_stats(available_copies=-1, issued_count=1)
+    _bump_category_borrows(book.category_id)
+    on_loan_opened(transaction, book)
+    savepoint.commit()
+    
+    return transaction, "Book issued successfully"
+
+def _close_loan(transaction):
+    """Mark an active loan returned and update the counters, without committing"""
+    old_status, old_fine = transaction.status, transaction.fine_amount
+    
+    # Return the book; flushed now so a second copy of the same book returned
+    # in this transaction gets its own available_copies + 1
+    transaction.return_book()
+    record_book_returned(transaction, old_status, old_fine)
+    on_loan_closed(transaction)
+    db.session.flush()
+
+@write_transaction
+def issue_book(user_id, book_id, due_date=None):
+    """Issue a book to a user"""
+    user = User.query.get_or_404(user_id)
+    book = Book.query.get_or_404(book_id)
+    
+    transaction, message = _open_loan(user_id, book, due_date)
+    if transaction is None:
+        return False, message
+    
     db.session.commit()
     
-    return True, "Book issued successfully"
+    return True, message
 
+@write_transaction
 def return_book(transaction_id):
     """Return a book"""
     transaction = Transaction.query.get_or_404(transaction_id)
@@ -182,9 +534,92 @@ def return_book(transaction_id):
     if transaction.status not in ['issued', 'overdue']:
         return False, "Book is not currently issued or overdue"
     
-    # Return the book
-    transaction.return_book()
+    _close_loan(transaction)
     
     db.session.commit()
     
     return True, "Book returned successfully"
+
+BATCH_MODES = ('all_or_nothing', 'best_effort')
+
+def _books_by_barcode(barcodes):
+    """Resolve every distinct barcode in one IN query"""
+    distinct = list(dict.fromkeys(barcodes))
+    return {book.barcode_id: book for book in Book.query.filter(Book.barcode_id.in_(distinct)).all()}
+
+def _finish_batch(results, all_or_nothing):
+    """Commit the batch, or roll it all back when all-or-nothing and an item failed"""
+    failed = any(not result['success'] for result in results)
+    if failed and all_or_nothing:
+        db.session.rollback()
+        for result in results:
+            if result['success']:
+                result.update(success=False, transaction_id=None,
+                              message='Not applied: another item in the batch failed')
+        return results, 0
+    
+    db.session.commit()
+    return results, sum(1 for result in results if result['success'])
+
+@write_transaction
+def issue_books_batch(user_id, barcodes, mode='all_or_nothing', due_date=None):
+    """Issue every scanned barcode to one user in a single transaction.
+    
+    Books are resolved in one query and each item is issued in its own
+    savepoint, so every item gets a result. In ``all_or_nothing`` mode any
+    failure rolls the whole batch back; in ``best_effort`` mode the items that
+    succeeded are committed. Returns ``(results, applied_count)``, with
+    ``results`` None when there is no such user; the user is looked up under
+    the write lock, like everything else in the batch.
+    """
+    if db.session.get(User, user_id) is None:
+        return None, 0
+    
+    books = _books_by_barcode(barcodes)
+    results = []
+    for barcode in barcodes:
+        book = books.get(barcode)
+        if book is None:
+            results.append({'barcode': barcode, 'success': False, 'book_id': None,
+                            'transaction_id': None, 'message': 'Book not found'})
+            continue
+        transaction, message = _open_loan(user_id, book, due_date)
+        results.append({'barcode': barcode, 'success': transaction is not None, 'book_id': book.id,
+                        'transaction_id': transaction.id if transaction else None, 'message': message})
+    
+    return _finish_batch(results, mode == 'all_or_nothing')
+
+@write_transaction
+def return_books_batch(barcodes, mode='best_effort'):
+    """Check in every scanned barcode in a single transaction.
+    
+    Active loans for all the books are fetched in one query; scanning the
+    same barcode twice returns two copies. Modes work as in
+    ``issue_books_batch``. Returns ``(results, applied_count)``.
+    """
+    books = _books_by_barcode(barcodes)
+    loans = defaultdict(list)
+    if books:
+        for transaction in (Transaction.query
+                            .filter(Transaction.book_id.in_([book.id for book in books.values()]),
+                                    Transaction.status.in_(['issued', 'overdue']))
+                            .order_by(Transaction.due_date, Transaction.id)):
+            loans[transaction.book_id].append(transaction)
+    
+    results = []
+    for barcode in barcodes:
+        book = books.get(barcode)
+        if book is None:
+            results.append({'barcode': barcode, 'success': False, 'book_id': None,
+                            'transaction_id': None, 'message': 'Book not found'})
+            continue
+        if not loans[book.id]:
+            results.append({'barcode': barcode, 'success': False, 'book_id': book.id,
+                            'transaction_id': None, 'message': 'This book is not currently issued'})
+            continue
+        transaction = loans[book.id].pop(0)
+        _close_loan(transaction)
+        results.append({'barcode': barcode, 'success': True, 'book_id': book.id,
+                        'transaction_id': transaction.id, 'message': 'Book returned successfully'})
+    
+    return _finish_batch(results, mode == 'all_or_nothing')
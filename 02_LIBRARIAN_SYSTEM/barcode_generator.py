@@ -3,186 +3,381 @@
 Barcode generator for library books
 """
 
-import sqlite3
+import argparse
+import json
 import os
-from PIL import Image, ImageDraw, ImageFont
-from barcode import Code128
-from barcode.writer import ImageWriter
-import io
+import sqlite3
+import time
+import zlib
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from PIL import Image, ImageDraw
+from app.code128 import code128_modules, draw_code128, fit_module_width
+from app.labels import LABEL_VERSION, label_assets, load_fonts, render_label
+
+DB_PATH = "../03_SHARED_RESOURCES/instance/pustak_tracker.db"
+BARCODE_DIR = "barcodes"
+
+# barcode_id -> fingerprint of the title/author each label was drawn with
+MANIFEST_NAME = ".labels.json"
+
+# Fonts and blank label of a rendering process, loaded once by _init_worker
+_worker = {}
+
+def label_fingerprint(barcode_id, title, author):
+    return zlib.crc32(json.dumps([LABEL_VERSION, barcode_id, title, author]).encode('utf-8'))
 
-def generate_barcodes():
-    """Generate barcode images for all books in database"""
+def _init_worker(out_dir):
+    template, font, small_font = label_assets()
+    _worker.update(out_dir=out_dir, font=font, small_font=small_font, template=template)
+
+def _render_chunk(rows):
+    """Render and save a chunk of (barcode_id, title, author).
     
-    db_path = "../03_SHARED_RESOURCES/instance/pustak_tracker.db"
+    Returns the (barcode_id, fingerprint) of the labels saved and the
+    (barcode_id, reason) of those that cannot be drawn, such as a barcode
+    too long for the label, which are not saved.
+    """
+    done, failed = [], []
+    for barcode_id, title, author in rows:
+        try:
+            img = render_label(barcode_id, title, author, _worker['template'], _worker['font'], _worker['small_font'])
+        except ValueError as e:
+            failed.append((barcode_id, str(e)))
+            continue
+        img.save(os.path.join(_worker['out_dir'], f"{barcode_id}.png"))
+        done.append((barcode_id, label_fingerprint(barcode_id, title, author)))
+    return done, failed
+
+def iter_book_chunks(conn, chunk_size):
+    """Books with a barcode in chunks, stepped through the cursor rather than fetched at once"""
+    cursor = conn.execute(
+        "SELECT barcode_id, title, author FROM books WHERE barcode_id IS NOT NULL ORDER BY id"
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def generate_barcodes(db_path=DB_PATH, out_dir=BARCODE_DIR, workers=None, chunk_size=250, incremental=False):
+    """Generate barcode images for all books in database.
+    
+    Chunks of books are rendered by ``workers`` processes (default: one per
+    CPU; 1 renders in this process). With ``incremental`` only labels whose
+    PNG is missing, or whose title or author changed since it was drawn, are
+    rendered.
+    """
     
     if not os.path.exists(db_path):
         print("❌ Database not found")
         return
     
     # Create barcodes directory
-    os.makedirs("barcodes", exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    
+    manifest = load_manifest(out_dir)
+    existing = {name[:-4] for name in os.listdir(out_dir) if name.endswith(".png")} if incremental else set()
     
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(out_dir,)) if workers > 1 else None
+    if pool is None:
+        _init_worker(out_dir)
+    
+    started = time.perf_counter()
+    rendered = skipped = failed = 0
+    pending = set()
+    
+    def record(result):
+        nonlocal rendered, failed
+        done, errors = result
+        for barcode_id, fingerprint in done:
+            manifest[barcode_id] = fingerprint
+            rendered += 1
+        for barcode_id, reason in errors:
+            print(f"  ⚠️ {barcode_id}: label not drawn, {reason}")
+            failed += 1
+    
+    def collect(futures):
+        for future in futures:
+            record(future.result())
+        elapsed = time.perf_counter() - started
+        print(f"  ✅ {rendered} labels rendered ({rendered / elapsed:.0f} labels/s)")
     
     try:
-        cursor.execute("SELECT id, title, author, barcode_id FROM books WHERE barcode_id IS NOT NULL")
-        books = cursor.fetchall()
+        print(f"📚 Generating barcodes with {workers} worker(s){' (incremental)' if incremental else ''}...")
         
-        print(f"📚 Generating barcodes for {len(books)} books...")
+        for rows in iter_book_chunks(conn, chunk_size):
+            if incremental:
+                stale = [row for row in rows
+                         if row[0] not in existing or manifest.get(row[0]) != label_fingerprint(*row)]
+                skipped += len(rows) - len(stale)
+                rows = stale
+            if not rows:
+                continue
+            if pool is None:
+                record(_render_chunk(rows))
+                continue
+            # At most two chunks queued per worker, so memory stays flat however many books there are
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(_render_chunk, rows))
         
-        for book in books:
-            book_id, title, author, barcode_id = book
-            
-            # Generate Code128 barcode
-            code = Code128(barcode_id, writer=ImageWriter())
-            
-            # Generate barcode image in memory
-            buffer = io.BytesIO()
-            code.write(buffer)
-            buffer.seek(0)
-            
-            # Open barcode image
-            barcode_img = Image.open(buffer)
-            
-            # Create a larger image with text
-            img_width, img_height = 400, 300
-            img = Image.new('RGB', (img_width, img_height), 'white')
-            
-            # Resize and paste barcode
-            barcode_width, barcode_height = barcode_img.size
-            scale = min(350 / barcode_width, 120 / barcode_height)
-            new_width = int(barcode_width * scale)
-            new_height = int(barcode_height * scale)
-            
-            barcode_img = barcode_img.resize((new_width, new_height))
-            barcode_x = (img_width - new_width) // 2
-            barcode_y = 50
-            img.paste(barcode_img, (barcode_x, barcode_y))
-            
-            # Add text
-            draw = ImageDraw.Draw(img)
-            
-            try:
-                font = ImageFont.truetype("arial.ttf", 14)
-                small_font = ImageFont.truetype("arial.ttf", 10)
-            except:
-                font = ImageFont.load_default()
-                small_font = ImageFont.load_default()
-            
-            # Book title (truncated)
-            title_text = title[:35] + "..." if len(title) > 35 else title
-            draw.text((10, 10), title_text, fill="black", font=font)
-            
-            # Author
-            author_text = f"by {author[:30]}..." if len(author) > 30 else f"by {author}"
-            draw.text((10, 30), author_text, fill="gray", font=small_font)
-            
-            # Barcode ID below barcode
-            text_y = barcode_y + new_height + 10
-            draw.text((barcode_x, text_y), barcode_id, fill="black", font=font)
-            
-            # Library name
-            draw.text((10, img_height - 30), "Pustak Tracker Library", fill="blue", font=small_font)
-            
-            # Save image
-            filename = f"barcodes/{barcode_id}.png"
-            img.save(filename)
-            print(f"  ✅ {barcode_id} - {title[:30]}...")
+        if pending:
+            collect(pending)
+            pending = set()
         
-        print(f"\n🎉 Generated {len(books)} barcode images in 'barcodes/' folder")
+        elapsed = time.perf_counter() - started
+        print(f"\n🎉 Generated {rendered} barcode images in '{out_dir}/' folder "
+              f"in {elapsed:.1f}s ({rendered / elapsed if elapsed else 0:.0f} labels/s)"
+              + (f", {skipped} unchanged skipped" if incremental else "")
+              + (f", {failed} could not be drawn" if failed else ""))
         
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        # Labels finished before an error still count for the next incremental run
+        save_manifest(out_dir, manifest)
         conn.close()
 
-def generate_barcode_sheet():
-    """Generate a single sheet with multiple barcodes for printing"""
+# A4 at 300 DPI
+SHEET_WIDTH, SHEET_HEIGHT, SHEET_DPI = 2480, 3508, 300
+
+class PdfPageWriter:
+    """Multi-page PDF written one page at a time.
+    
+    Each page is a bilevel or greyscale image, Flate-compressed and written
+    as soon as it is added; only object offsets are kept until ``close()``
+    writes the page tree and cross-reference table.
+    """
+    
+    def __init__(self, path, dpi=SHEET_DPI):
+        self.file = open(path, 'wb')
+        self.dpi = dpi
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3   # 1 is the catalog, 2 the page tree
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    
+    def _object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % object_id + body)
+        if stream is not None:
+            self.file.write(b'\nstream\n' + stream + b'\nendstream')
+        self.file.write(b'\nendobj\n')
     
-    db_path = "../03_SHARED_RESOURCES/instance/pustak_tracker.db"
+    def add_page(self, page):
+        image_id, contents_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        width, height = page.size
+        # PIL packs mode '1' rows to whole bytes with 1 for white, as DeviceGray expects
+        bits = 1 if page.mode == '1' else 8
+        data = zlib.compress((page if bits == 1 else page.convert('L')).tobytes(), 3)
+        self._object(image_id, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+                               b'/BitsPerComponent %d /Filter /FlateDecode /Length %d >>'
+                     % (width, height, bits, len(data)), data)
+        points_w, points_h = width * 72 / self.dpi, height * 72 / self.dpi
+        contents = b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % (points_w, points_h)
+        self._object(contents_id, b'<< /Length %d >>' % len(contents), contents)
+        self._object(page_id, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+                              b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>'
+                     % (points_w, points_h, image_id, contents_id))
+        self.page_ids.append(page_id)
+    
+    def close(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        xref = self.file.tell()
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for object_id in range(1, self.next_id):
+            self.file.write(b'%010d 00000 n \n' % self.offsets[object_id])
+        self.file.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_id, xref))
+        self.file.close()
+
+def iter_sheet_pages(conn, per_page, category=None, created_since=None, book_ids=None):
+    """Pages of (barcode_id, title) for the books matching the filters, in id order"""
+    sql = "SELECT b.barcode_id, b.title FROM books b WHERE b.barcode_id IS NOT NULL"
+    params = []
+    if category is not None:
+        if str(category).isdigit():
+            sql += " AND b.category_id = ?"
+        else:
+            sql += " AND b.category_id IN (SELECT id FROM categories WHERE name = ? COLLATE NOCASE)"
+        params.append(category)
+    if created_since is not None:
+        sql += " AND b.created_at >= ?"
+        params.append(created_since.strftime('%Y-%m-%d %H:%M:%S'))
+    if book_ids is not None:
+        # One JSON parameter, however many ids
+        sql += " AND b.id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(book_ids)))
+    cursor = conn.execute(sql + " ORDER BY b.id", params)
+    while True:
+        rows = cursor.fetchmany(per_page)
+        if not rows:
+            return
+        yield rows
+
+def render_sheet_page(books, cols, rows, font, small_font):
+    """One bilevel A4 page with ``books`` laid out on a cols x rows grid.
+    
+    Returns the page and the (barcode_id, reason) of books left off it
+    because their barcode is too wide for a cell.
+    """
+    sheet = Image.new('1', (SHEET_WIDTH, SHEET_HEIGHT), 'white')
+    draw = ImageDraw.Draw(sheet)
+    cell_width = SHEET_WIDTH // cols
+    cell_height = SHEET_HEIGHT // rows
+    margin = min(50, cell_width // 10, cell_height // 10)
+    barcode_height = max(30, min(150, cell_height - 2 * margin - 110))
+    
+    placed, failed = 0, []
+    for barcode_id, title in books:
+        modules = code128_modules(barcode_id)
+        try:
+            module_width = fit_module_width(modules, cell_width - 2 * margin)
+        except ValueError as e:
+            failed.append((barcode_id, str(e)))
+            continue
+        x = (placed % cols) * cell_width + margin
+        y = (placed // cols) * cell_height + margin
+        placed += 1
+        
+        # Title
+        title_text = title[:20] + "..." if len(title) > 20 else title
+        draw.text((x, y), title_text, fill="black", font=small_font)
+        
+        # Barcode for this book, drawn to fit the cell
+        draw_code128(draw, x, y + 50, modules, module_width, barcode_height)
+        
+        # Barcode ID below barcode
+        draw.text((x, y + 70 + barcode_height), barcode_id, fill="black", font=font)
+    return sheet, failed
+
+def generate_barcode_sheet(db_path=DB_PATH, out_dir=BARCODE_DIR, cols=2, rows=6, output_format='pdf',
+                           category=None, created_since=None, book_ids=None):
+    """Generate printable A4 label sheets for every matching book.
+    
+    Books are read a page at a time and each page is written as soon as it
+    is drawn, to one multi-page PDF or to numbered PNGs, so only one page is
+    ever held in memory. ``category`` is a category id or name,
+    ``created_since`` a datetime and ``book_ids`` an iterable of ids.
+    """
     
     if not os.path.exists(db_path):
         print("❌ Database not found")
         return
     
+    os.makedirs(out_dir, exist_ok=True)
+    if output_format == 'png':
+        # Pages left over from a longer earlier run would look like part of this one
+        for name in os.listdir(out_dir):
+            if name.startswith("barcode_sheet_") and name.endswith(".png"):
+                os.remove(os.path.join(out_dir, name))
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    font, small_font = load_fonts(36, 24)
+    pdf_path = os.path.join(out_dir, "barcode_sheets.pdf")
+    pdf = PdfPageWriter(pdf_path) if output_format == 'pdf' else None
+    
+    started = time.perf_counter()
+    pages = labels = failed = 0
     
     try:
-        cursor.execute("SELECT barcode_id, title FROM books WHERE barcode_id IS NOT NULL LIMIT 12")
-        books = cursor.fetchall()
-        
-        # Create A4 sheet (2480x3508 pixels at 300 DPI)
-        sheet_width, sheet_height = 2480, 3508
-        sheet = Image.new('RGB', (sheet_width, sheet_height), 'white')
-        
-        # Grid: 2 columns, 6 rows
-        cols, rows = 2, 6
-        cell_width = sheet_width // cols
-        cell_height = sheet_height // rows
+        for books in iter_sheet_pages(conn, cols * rows, category, created_since, book_ids):
+            sheet, errors = render_sheet_page(books, cols, rows, font, small_font)
+            for barcode_id, reason in errors:
+                print(f"  ⚠️ {barcode_id}: label not printed, {reason}")
+            failed += len(errors)
+            if len(errors) == len(books):
+                continue
+            pages += 1
+            labels += len(books) - len(errors)
+            if pdf is not None:
+                pdf.add_page(sheet)
+            else:
+                sheet.save(os.path.join(out_dir, f"barcode_sheet_{pages:04d}.png"), dpi=(SHEET_DPI, SHEET_DPI))
+            if pages % 50 == 0:
+                print(f"  ✅ {pages} pages ({labels} labels)")
         
-        for i, (barcode_id, title) in enumerate(books):
-            if i >= 12:  # Max 12 per sheet
-                break
-                
-            row = i // cols
-            col = i % cols
-            
-            x = col * cell_width + 50
-            y = row * cell_height + 50
-            
-            # Generate barcode for this book
-            code = Code128(barcode_id, writer=ImageWriter())
-            buffer = io.BytesIO()
-            code.write(buffer)
-            buffer.seek(0)
-            barcode_img = Image.open(buffer)
-            
-            # Resize barcode to fit cell
-            barcode_width = cell_width - 100
-            barcode_height = 150
-            barcode_img = barcode_img.resize((barcode_width, barcode_height))
-            
-            # Paste barcode
-            sheet.paste(barcode_img, (x, y + 50))
-            
-            # Add text
-            draw = ImageDraw.Draw(sheet)
-            try:
-                font = ImageFont.truetype("arial.ttf", 36)
-                small_font = ImageFont.truetype("arial.ttf", 24)
-            except:
-                font = ImageFont.load_default()
-                small_font = ImageFont.load_default()
-            
-            # Title
-            title_text = title[:20] + "..." if len(title) > 20 else title
-            draw.text((x, y), title_text, fill="black", font=small_font)
-            
-            # Barcode ID below barcode
-            draw.text((x, y + 220), barcode_id, fill="blue", font=font)
-        
-        # Save sheet
-        os.makedirs("barcodes", exist_ok=True)
-        sheet.save("barcodes/barcode_sheet.png")
-        print("📄 Generated printable barcode sheet: barcodes/barcode_sheet.png")
+        target = pdf_path if pdf is not None else os.path.join(out_dir, "barcode_sheet_*.png")
+        print(f"📄 Generated {pages} printable page(s) with {labels} labels in "
+              f"{time.perf_counter() - started:.1f}s: {target}"
+              + (f" ({failed} could not be printed)" if failed else ""))
         
     except Exception as e:
         print(f"❌ Error: {e}")
     finally:
+        if pdf is not None:
+            pdf.close()
         conn.close()
 
-if __name__ == '__main__':
+def parse_book_ids(value):
+    """Comma-separated ids, or @path to a file of ids separated by commas or whitespace"""
+    if value.startswith('@'):
+        with open(value[1:]) as f:
+            value = f.read()
+    return [int(part) for part in value.replace(',', ' ').split()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate barcode labels for library books")
+    parser.add_argument('mode', nargs='?', choices=['individual', 'sheet', 'both'],
+                        help='what to generate (asked interactively when omitted)')
+    parser.add_argument('--db', default=DB_PATH, help='path to pustak_tracker.db')
+    parser.add_argument('--out', default=BARCODE_DIR, help='directory for the label PNGs')
+    parser.add_argument('--workers', type=int, help='rendering processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=250, help='books per unit of work')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only render labels that are missing or whose title/author changed')
+    sheets = parser.add_argument_group('print sheets')
+    sheets.add_argument('--format', choices=['pdf', 'png'], default='pdf',
+                        help='one multi-page PDF or numbered PNG pages')
+    sheets.add_argument('--grid', default='2x6', help='labels per page as COLSxROWS')
+    sheets.add_argument('--category', help='only books of this category (id or name)')
+    sheets.add_argument('--since', type=datetime.fromisoformat,
+                        help='only books created on or after this date (YYYY-MM-DD)')
+    sheets.add_argument('--ids', type=parse_book_ids, help='only these book ids: 1,2,3 or @file')
+    args = parser.parse_args()
+    try:
+        cols, rows = (int(n) for n in args.grid.lower().split('x'))
+    except ValueError:
+        parser.error('--grid must look like 2x6')
+    if cols < 1 or rows < 1:
+        parser.error('--grid needs at least one column and one row')
+    sheet_options = dict(cols=cols, rows=rows, output_format=args.format,
+                         category=args.category, created_since=args.since, book_ids=args.ids)
+    
     print("🏷️ BARCODE GENERATOR")
     print("=" * 30)
     
-    choice = input("Generate: (1) Individual barcodes (2) Print sheet (3) Both [1]: ").strip()
+    choice = args.mode
+    if choice is None:
+        choice = input("Generate: (1) Individual barcodes (2) Print sheet (3) Both [1]: ").strip()
     
     if choice in ['2', 'sheet']:
-        generate_barcode_sheet()
+        generate_barcode_sheet(args.db, args.out, **sheet_options)
     elif choice in ['3', 'both']:
-        generate_barcodes()
-        generate_barcode_sheet()
+        generate_barcodes(args.db, args.out, args.workers, args.chunk_size, args.incremental)
+        generate_barcode_sheet(args.db, args.out, **sheet_options)
     else:
-        generate_barcodes()
\ No newline at end of file
+        generate_barcodes(args.db, args.out, args.workers, args.chunk_size, args.incremental)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of one barcode label: the previous python-barcode ImageWriter
+path (PNG encode, decode, resample) against bars drawn straight onto the
+label by app.code128.
+
+Reports per-label time and, from a fresh process per path, peak RSS growth
+and peak Python allocations. Also checks the bars: the native labels are
+read back and compared module by module with the Code128 pattern, and grey
+(resampled) pixels across the bar row are counted for both paths.
+
+Usage: python benchmarks/bench_barcode_render.py [--labels 2000]
+"""
+
+import argparse
+import io
+import multiprocessing
+import resource
+import time
+import tracemalloc
+
+from common import percentile
+from app import labels
+from app.code128 import QUIET_ZONE, code128_modules, fit_module_width
+from barcode import Code128
+from barcode.writer import ImageWriter
+from PIL import Image, ImageDraw
+
+
+def imagewriter_label(barcode_id, title, author, template, font, small_font):
+    """The label as it was drawn before app.code128"""
+    img = template.copy()
+
+    buffer = io.BytesIO()
+    Code128(barcode_id, writer=ImageWriter()).write(buffer)
+    buffer.seek(0)
+    barcode_img = Image.open(buffer)
+
+    barcode_width, barcode_height = barcode_img.size
+    scale = min(350 / barcode_width, 120 / barcode_height)
+    new_width = int(barcode_width * scale)
+    new_height = int(barcode_height * scale)
+    barcode_img = barcode_img.resize((new_width, new_height))
+    barcode_x = (labels.LABEL_WIDTH - new_width) // 2
+    img.paste(barcode_img, (barcode_x, 50))
+
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 10), title[:35], fill="black", font=font)
+    draw.text((10, 30), f"by {author[:30]}", fill="gray", font=small_font)
+    draw.text((barcode_x, 50 + new_height + 10), barcode_id, fill="black", font=font)
+    return img
+
+
+PATHS = {
+    'imagewriter': imagewriter_label,
+    'native': labels.render_label,
+}
+
+
+def sample_books(count):
+    return [(f'BK{i:08d}', f'Title {i:08d} Volume {i % 7}', f'Author {i % 997}') for i in range(1, count + 1)]
+
+
+def run_path(name, count, results):
+    """Render ``count`` labels with one path in this (fresh) process and report its numbers"""
+    font, small_font = labels.load_fonts(14, 10)
+    template = labels.label_template(small_font)
+    render = PATHS[name]
+    books = sample_books(count)
+
+    render(*books[0], template, font, small_font)   # warm up imports and caches
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for book in books:
+        start = time.perf_counter()
+        render(*book, template, font, small_font)
+        timings.append((time.perf_counter() - start) * 1e6)
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    # A separate pass, as tracing slows every allocation down
+    tracemalloc.start()
+    for book in books[:100]:
+        render(*book, template, font, small_font)
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    results[name] = {
+        'mean_us': sum(timings) / len(timings),
+        'p50_us': percentile(timings, 50),
+        'p99_us': percentile(timings, 99),
+        'rss_growth_kb': rss_growth,
+        'python_peak_kb': python_peak / 1024,
+    }
+
+
+def bar_row(img, y):
+    """Pixel values along row ``y`` of the label in greyscale"""
+    grey = img.convert('L')
+    return [grey.getpixel((x, y)) for x in range(grey.width)]
+
+
+def grey_pixels(row):
+    return sum(1 for value in row if 0 < value < 255)
+
+
+def native_pattern_matches(img, barcode_id):
+    """Whether the bars read back from a native label reproduce the Code128 pattern exactly"""
+    modules = code128_modules(barcode_id)
+    module_width = fit_module_width(modules, labels.LABEL_BARCODE_WIDTH)
+    row = bar_row(img, 50 + labels.LABEL_BARCODE_HEIGHT // 2)
+    dark = [i for i, value in enumerate(row) if value < 128]
+    first = dark[0]
+    width = len(modules) * module_width
+    sampled = ''.join('1' if row[first + i * module_width] < 128 else '0' for i in range(len(modules)))
+    expected_left = (labels.LABEL_WIDTH - (len(modules) + 2 * QUIET_ZONE) * module_width) // 2
+    return (sampled == modules and first == expected_left + QUIET_ZONE * module_width
+            and all(row[x] in (0, 255) for x in range(first, first + width)))
+
+
+def check_bars(count):
+    font, small_font = labels.load_fonts(14, 10)
+    template = labels.label_template(small_font)
+    books = sample_books(count)
+    matches = sum(native_pattern_matches(labels.render_label(*book, template, font, small_font), book[0])
+                  for book in books)
+    grey = {}
+    for name, render in PATHS.items():
+        # Middle of the bars in both layouts
+        y = 50 + (labels.LABEL_BARCODE_HEIGHT // 2 if name == 'native' else 40)
+        grey[name] = sum(grey_pixels(bar_row(render(*book, template, font, small_font), y)) for book in books) / count
+    return matches, grey
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--labels', type=int, default=2000, help='labels rendered per path')
+    parser.add_argument('--check', type=int, default=200, help='labels read back to check the bars')
+    args = parser.parse_args()
+
+    results = multiprocessing.Manager().dict()
+    for name in PATHS:
+        process = multiprocessing.Process(target=run_path, args=(name, args.labels, results))
+        process.start()
+        process.join()
+
+    matches, grey = check_bars(args.check)
+    print(f"{'path':<12} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'RSS +KB':>9} {'py peak KB':>11} {'grey px/row':>12}")
+    for name in PATHS:
+        r = results[name]
+        print(f"{name:<12} {r['mean_us']:>9.0f} {r['p50_us']:>9.0f} {r['p99_us']:>9.0f} "
+              f"{r['rss_growth_kb']:>9} {r['python_peak_kb']:>11.1f} {grey[name]:>12.1f}")
+    speedup = results['imagewriter']['mean_us'] / results['native']['mean_us']
+    print(f"\nnative is {speedup:.1f}x faster per label; "
+          f"{matches}/{args.check} native labels read back module-exact")
+    if matches != args.check:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
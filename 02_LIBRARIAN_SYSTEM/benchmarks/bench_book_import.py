@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bulk catalogue import (app.book_import) against adding books
+one at a time the way create_book does, on a scratch database with the full
+app (FTS and book_changes triggers, library_stats).
+
+The generated CSV mixes in rows that must be rejected: ISBNs already in
+the catalogue, repeats within the file and rows without a title. After the
+import the script checks that books_fts, book_changes and library_stats
+agree with the books table, and exits with status 1 if not.
+
+Usage: python benchmarks/bench_book_import.py [--rows 300000] [--batch-size 5000]
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+from common import seed, cleanup
+
+
+def make_import_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+
+    app = create_app()
+    app.config['BENCH_DB_PATH'] = db_path
+    return app
+
+
+def write_export(path, rows, existing, seed_value=7):
+    """A CSV export of ``rows`` books; returns how many rows should be rejected"""
+    rng = random.Random(seed_value)
+    accepted = set()
+    bad = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['title', 'author', 'publisher', 'isbn', 'barcode_id', 'category', 'total_copies'])
+        for i in range(1, rows + 1):
+            title = f'Imported {rng.randint(0, rows * 10):08d} Part {i}'
+            isbn = f'979-{i:010d}'
+            kind = rng.randrange(200)
+            if kind == 0:
+                isbn = f'978-{rng.randint(1, existing):010d}'   # already catalogued
+            elif kind == 1:
+                isbn = f'979-{max(1, i - 1):010d}'              # repeat of the previous row
+            elif kind == 2:
+                title = ''
+            stored = isbn.replace('-', '')
+            if not title or stored.startswith('978') or stored in accepted:
+                bad += 1
+            else:
+                accepted.add(stored)
+            writer.writerow([title, f'Writer {rng.randint(1, rows // 20 + 1)}', f'House {i % 300}', isbn,
+                             f'IMP{i:09d}', f'Shelf {rng.randrange(40)}', rng.randint(1, 4)])
+    return bad
+
+
+def orm_one_at_a_time(app, count):
+    """Rows per second adding books like api_routes.create_book, with a uniqueness check each"""
+    from app import db
+    from app.models import Book, Category
+    from app.utils import record_book_added
+
+    with app.app_context():
+        category_id = Category.query.first().id
+        start = time.perf_counter()
+        for i in range(count):
+            isbn = f'977{i:010d}'
+            if Book.query.filter_by(isbn=isbn).first() is not None:
+                continue
+            book = Book(title=f'One by one {i}', author='Writer', publisher='House', isbn=isbn,
+                        category_id=category_id, total_copies=1, available_copies=1)
+            db.session.add(book)
+            record_book_added(book)
+            db.session.commit()
+        return count / (time.perf_counter() - start)
+
+
+def check_coherence(app):
+    """Problems found comparing the derived tables with books"""
+    from app import db
+    from app.search import book_index
+    from app.utils import rebuild_library_stats
+    from sqlalchemy import text
+
+    problems = []
+    with app.app_context():
+        books = db.session.execute(text('SELECT count(*) FROM books')).scalar()
+        fts = db.session.execute(text('SELECT count(*) FROM books_fts')).scalar()
+        changes = db.session.execute(text('SELECT count(*) FROM book_changes WHERE deleted = 0')).scalar()
+        if fts != books:
+            problems.append(f'books_fts has {fts} rows for {books} books')
+        if changes != books:
+            problems.append(f'book_changes has {changes} live rows for {books} books')
+        triggers = set(db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+        for name in ('books_fts_after_insert', 'book_changes_after_insert'):
+            if name not in triggers:
+                problems.append(f'trigger {name} is missing')
+        drift = rebuild_library_stats()
+        db.session.rollback()
+        if drift:
+            problems.append(f'library_stats drifted: {drift}')
+        if book_index.built:
+            problems.append('typo index was not dropped for a rebuild')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000, help='rows in the generated export')
+    parser.add_argument('--existing', type=int, default=10000, help='books already in the catalogue')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--orm-rows', type=int, default=2000, help='books added one at a time for comparison')
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='pustak_import_')
+    os.close(fd)
+    os.remove(db_path)
+    fd, csv_path = tempfile.mkstemp(suffix='.csv', prefix='pustak_import_')
+    os.close(fd)
+
+    app = make_import_app(db_path)
+    try:
+        seed(app, books=args.existing, users=10)
+        expected_rejects = write_export(csv_path, args.rows, args.existing)
+
+        from app.book_import import import_books
+        from app.search import rebuild_book_index
+        from app.utils import get_library_stats
+
+        with app.app_context():
+            get_library_stats()     # materialize the counters the import bumps
+            rebuild_book_index()    # built at startup by run.py
+            with open(csv_path, encoding='utf-8-sig', newline='') as stream:
+                report = import_books(stream, 'csv', args.batch_size)
+        print(f"bulk import: {report.read} rows in {report.seconds:.2f}s = {report.rows_per_second:,.0f} rows/s "
+              f"({report.imported} imported, {report.rejected} rejected, "
+              f"{report.categories_created} categories created)")
+
+        orm_rate = orm_one_at_a_time(app, args.orm_rows)
+        print(f"one at a time: {orm_rate:,.0f} rows/s ({args.orm_rows} books)")
+        print(f"\nbulk import is {report.rows_per_second / orm_rate:.0f}x faster")
+
+        problems = check_coherence(app)
+        if report.rejected != expected_rejects:
+            problems.append(f'{report.rejected} rows rejected, expected {expected_rejects}')
+        for problem in problems:
+            print(f"PROBLEM: {problem}")
+        if problems:
+            raise SystemExit(1)
+        print("books_fts, book_changes and library_stats match the books table")
+    finally:
+        cleanup(app)
+        os.remove(csv_path)
+
+
+if __name__ == '__main__':
+    main()
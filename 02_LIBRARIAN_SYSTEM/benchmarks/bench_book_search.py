@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark catalogue search: the FTS5 books_fts index against the old
+LIKE '%q%' filter over title/author/isbn, first page of 20 results.
+
+Usage: python benchmarks/bench_book_search.py [--volumes 10000,100000,1000000]
+"""
+
+import argparse
+import random
+
+from common import make_app, seed, timed, percentile, cleanup
+from app import db, search
+from app.models import Book
+
+PAGE_SIZE = 20
+
+
+def like_page(text):
+    like = Book.query.filter(
+        (Book.title.contains(text)) |
+        (Book.author.contains(text)) |
+        (Book.isbn.contains(text))
+    )
+    return like.order_by(Book.title.asc(), Book.id.asc()).limit(PAGE_SIZE).all()
+
+
+def fts_page(text):
+    query, rank = search.search_books(Book.query, text)
+    return query.order_by(rank, Book.id).limit(PAGE_SIZE).all()
+
+
+def search_terms(volume, rng, count):
+    """A mix of selective and broad searches, the way people type them"""
+    terms = []
+    for _ in range(count):
+        kind = rng.randrange(4)
+        if kind == 0:
+            terms.append(f'Author {rng.randint(1, volume // 10 + 1)}')   # one author
+        elif kind == 1:
+            terms.append(f'Volume {rng.randint(1, volume)}')            # one title
+        elif kind == 2:
+            terms.append(f'978{rng.randint(1, volume):010d}'[:9])      # ISBN prefix
+        else:
+            terms.append(f'Publisher {rng.randint(0, 49)}')             # broad
+    return terms
+
+
+def run(fn, terms, repeat):
+    timings = []
+    for term in terms:
+        _, samples = timed(lambda: fn(term), repeat=repeat)
+        timings.extend(samples)
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--volumes', default='10000,100000,1000000',
+                        help='comma-separated catalogue sizes to benchmark')
+    parser.add_argument('--queries', type=int, default=40, help='distinct search terms per volume')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'books':>9} {'path':>5} {'p50 ms':>9} {'p99 ms':>9}")
+    for volume in [int(v) for v in args.volumes.split(',')]:
+        app = make_app()
+        search.init_app(app)
+        seed(app, books=volume, users=50)
+        try:
+            with app.app_context():
+                if not search.fts_enabled():
+                    raise SystemExit('This SQLite build has no FTS5')
+                terms = search_terms(volume, random.Random(volume), args.queries)
+                for name, fn in (('like', like_page), ('fts', fts_page)):
+                    timings = run(fn, terms, args.repeat)
+                    print(f"{volume:>9} {name:>5} {percentile(timings, 50):>9.2f} {percentile(timings, 99):>9.2f}")
+                    db.session.remove()
+        finally:
+            cleanup(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Benchmark get_dashboard_stats(): SQL statement count and latency as the
+transactions table grows.
+
+Usage: python benchmarks/bench_dashboard_stats.py [--volumes 1000,10000,100000]
+"""
+
+import argparse
+
+from common import make_app, seed, QueryCounter, timed, percentile, cleanup
+from app import db
+from app.utils import get_dashboard_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--volumes', default='1000,10000,100000',
+                        help='comma-separated transaction counts to benchmark')
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'transactions':>12} {'queries':>8} {'p50 ms':>9} {'max ms':>9}")
+    for volume in [int(v) for v in args.volumes.split(',')]:
+        app = make_app()
+        seed(app, books=max(100, volume // 20), users=max(50, volume // 50), transactions=volume)
+        try:
+            with app.app_context():
+                get_dashboard_stats()  # builds the materialized counters row
+                with QueryCounter(db.engine) as counter:
+                    get_dashboard_stats()
+                _, timings = timed(get_dashboard_stats, repeat=args.repeat)
+            print(f"{volume:>12} {counter.count:>8} {percentile(timings, 50):>9.1f} {timings[-1]:>9.1f}")
+        finally:
+            cleanup(app)
+
+
+if __name__ == '__main__':
+    main()
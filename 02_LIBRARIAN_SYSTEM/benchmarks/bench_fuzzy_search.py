@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the typo-tolerant book search: trigram index rebuild time and
+memory, and fuzzy lookup latency for misspelled author names.
+
+Usage: python benchmarks/bench_fuzzy_search.py [--volumes 10000,100000,1000000]
+"""
+
+import argparse
+import random
+import time
+
+from common import make_app, seed, timed, percentile, cleanup
+from app import db, search
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+
+
+def pseudo_word(rng):
+    return ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.4 else '')
+                   for _ in range(rng.randint(1, 4)))
+
+
+def seed_words(app, volume, rng):
+    """Give the seeded books word titles and two-part author names"""
+    vocabulary = [pseudo_word(rng) for _ in range(max(1000, volume // 12))]
+    first_names = [pseudo_word(rng).title() for _ in range(max(200, volume // 200))]
+    last_names = [pseudo_word(rng).title() for _ in range(max(500, volume // 50))]
+    with app.app_context():
+        conn = db.engine.raw_connection()
+        try:
+            conn.executemany(
+                "UPDATE books SET title = ?, author = ? WHERE id = ?",
+                [(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6))).title(),
+                  f'{rng.choice(first_names)} {rng.choice(last_names)}', book_id)
+                 for book_id in range(1, volume + 1)]
+            )
+            conn.commit()
+            return [row[0] for row in conn.execute("SELECT author FROM books ORDER BY random() LIMIT 200")]
+        finally:
+            conn.close()
+
+
+def typo(word, rng):
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--volumes', default='10000,100000,1000000',
+                        help='comma-separated catalogue sizes to benchmark')
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'books':>9} {'rebuild s':>10} {'words':>8} {'index KB':>9} {'p50 ms':>8} {'p99 ms':>8} {'found':>6}")
+    for volume in [int(v) for v in args.volumes.split(',')]:
+        rng = random.Random(volume)
+        app = make_app()
+        search.init_app(app)
+        seed(app, books=volume, users=10)
+        authors = seed_words(app, volume, rng)
+        try:
+            with app.app_context():
+                start = time.perf_counter()
+                search.rebuild_book_index()
+                rebuild_seconds = time.perf_counter() - start
+                stats = search.book_index.stats()
+
+                timings, found = [], 0
+                for author in authors[:args.queries]:
+                    first, last = author.lower().split()
+                    misspelled = f'{first} {typo(last, rng) if len(last) >= 3 else last}'
+                    ids, samples = timed(lambda: search.fuzzy_book_ids(misspelled), repeat=1)
+                    timings.extend(samples)
+                    found += bool(ids)
+                timings.sort()
+            print(f"{volume:>9} {rebuild_seconds:>10.2f} {stats['words']:>8} {stats['posting_bytes'] // 1024:>9} "
+                  f"{percentile(timings, 50):>8.1f} {percentile(timings, 99):>8.1f} {found:>3}/{len(timings)}")
+        finally:
+            cleanup(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check: request every read route against a seeded
+scratch database, run EXPLAIN QUERY PLAN on each SELECT it issues and fail
+if transactions, reservations or notifications are read with a full table
+scan.
+
+Usage: python benchmarks/check_query_plans.py [--transactions 5000] [--verbose]
+Exits with status 1 when a route falls back to a scan.
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from common import seed
+
+from sqlalchemy import event
+
+# Hot tables that must always be reached through an index
+CHECKED_TABLES = ('transactions', 'reservations', 'notifications')
+
+WEB_ROUTES = [
+    '/dashboard',
+    '/books',
+    '/books?search=Title&category=1',
+    '/users',
+    '/users?search=Reader',
+    '/transactions',
+    '/transactions?status=issued',
+    '/transactions?status=overdue',
+    '/transactions?status=returned',
+    '/overdue',
+    '/categories',
+    '/users/json',
+    '/db-viewer',
+]
+
+LIBRARIAN_API_ROUTES = [
+    '/api/books',
+    '/api/books?search=Title',
+    '/api/books/1',
+    '/api/users',
+    '/api/users/1',
+    '/api/transactions',
+    '/api/transactions?status=issued',
+    '/api/transactions/overdue',
+    '/api/categories',
+    '/api/categories/1',
+    '/api/dashboard/stats',
+]
+
+USER_API_ROUTES = [
+    '/api/user/profile',
+    '/api/user/borrowed-books',
+    '/api/user/fines',
+    '/api/user/notifications',
+    '/api/user/notifications?seen=false',
+    '/api/books/available',
+    '/api/books/search?q=Title',
+    '/api/sync/books',
+    '/api/sync/books?since=1',
+]
+
+SCAN_RE = re.compile(r'^SCAN (\w+)(.*)$')
+
+
+def make_checked_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['BENCH_DB_PATH'] = db_path
+    return app
+
+
+def seed_extra(app, users):
+    """A librarian account, some reservations, their notifications and the materialized stats row"""
+    from app import db
+    from app.utils import generate_notifications, get_library_stats
+    from sqlalchemy import text
+
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO users (id, name, email, role, is_active) "
+            "VALUES (:id, 'Librarian', 'librarian@pustak.com', 'librarian', 1)"
+        ), {'id': users + 1})
+        db.session.execute(text(
+            "INSERT INTO reservations (user_id, book_id, status, created_at) "
+            "SELECT id % :users + 1, id, CASE WHEN id % 3 THEN 'pending' ELSE 'fulfilled' END, "
+            "datetime('now') FROM books"
+        ), {'users': users})
+        db.session.commit()
+        # The one-off full rebuild and the notification job are maintenance
+        # paths, not route queries
+        get_library_stats()
+        generate_notifications()
+    return users + 1
+
+
+def explain(connection, statement, parameters):
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    scans = []
+    for detail in plan:
+        match = SCAN_RE.match(detail)
+        if not match or 'INDEX' in match.group(2):
+            continue
+        if match.group(1).rstrip('_0123456789') in CHECKED_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not only failures')
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='pustak_plans_')
+    os.close(fd)
+    os.remove(db_path)
+
+    app = make_checked_app(db_path)
+    users = 200
+    seed(app, books=500, users=users, transactions=args.transactions)
+    librarian_id = seed_extra(app, users)
+
+    from app import db
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        librarian_token = create_access_token(identity=librarian_id, additional_claims={'role': 'librarian'})
+        user_token = create_access_token(identity=1, additional_claims={'role': 'user'})
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = librarian_id
+        sess['user_role'] = 'librarian'
+
+    requests = [(url, {}) for url in WEB_ROUTES]
+    requests += [(url, {'Authorization': f'Bearer {librarian_token}'}) for url in LIBRARIAN_API_ROUTES]
+    requests += [(url, {'Authorization': f'Bearer {user_token}'}) for url in USER_API_ROUTES]
+
+    failures = 0
+    try:
+        with app.app_context():
+            engine = db.engine
+            for url, headers in requests:
+                captured = []
+
+                def capture(conn, cursor, statement, parameters, context, executemany):
+                    if statement.lstrip().upper().startswith('SELECT'):
+                        captured.append((statement, parameters))
+
+                event.listen(engine, 'before_cursor_execute', capture)
+                try:
+                    response = client.get(url, headers=headers)
+                finally:
+                    event.remove(engine, 'before_cursor_execute', capture)
+
+                if response.status_code >= 400:
+                    print(f'?    {url} -> HTTP {response.status_code}, plans not checked')
+                    failures += 1
+                    continue
+
+                route_failures = 0
+                with engine.connect() as connection:
+                    for statement, parameters in captured:
+                        plan = explain(connection, statement, parameters)
+                        if full_scans(plan):
+                            route_failures += 1
+                            print(f'FAIL {url}\n     {" ".join(statement.split())}')
+                            for detail in plan:
+                                print(f'       {detail}')
+                        elif args.verbose:
+                            print(f'     {url}: {"; ".join(plan)}')
+                if not route_failures:
+                    print(f'ok   {url} ({len(captured)} queries)')
+                failures += route_failures
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print(f'\n{len(requests)} routes checked, {failures} problems')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
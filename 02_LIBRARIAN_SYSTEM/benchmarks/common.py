@@ -0,0 +1,136 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway database, a bare Flask
+app bound to it, fast synthetic seeding and a SQL statement counter.
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+from app import db
+
+
+def make_app(db_path=None):
+    """Flask app with only the database extension, bound to a scratch SQLite file"""
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='pustak_bench_')
+        os.close(fd)
+        os.remove(db_path)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['FINE_RATE'] = 5
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+
+    app.config['BENCH_DB_PATH'] = db_path
+    return app
+
+
+def seed(app, books=1000, users=200, transactions=0, categories=12, seed_value=42):
+    """Bulk-insert a synthetic catalogue and loan history straight through sqlite3"""
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        conn = db.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT INTO categories (id, name, description, created_at) VALUES (?, ?, ?, ?)",
+                [(i, f'Category {i}', None, now) for i in range(1, categories + 1)]
+            )
+            cur.executemany(
+                "INSERT INTO users (id, name, email, password_hash, role, is_active, created_at) "
+                "VALUES (?, ?, ?, ?, 'user', 1, ?)",
+                [(i, f'Reader {i}', f'reader{i}@example.com', None,
+                  now - timedelta(days=rng.randint(0, 700))) for i in range(1, users + 1)]
+            )
+            cur.executemany(
+                "INSERT INTO books (id, title, author, publisher, isbn, barcode_id, category_id, "
+                "total_copies, available_copies, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, 3, 3, ?)",
+                [(i, f'Title {rng.randint(0, books * 10):08d} Volume {i}', f'Author {rng.randint(1, books // 10 + 1)}',
+                  f'Publisher {i % 50}', f'978{i:010d}', f'BK{i:08d}', rng.randint(1, categories), now)
+                 for i in range(1, books + 1)]
+            )
+
+            rows = []
+            on_loan = set()
+            for i in range(1, transactions + 1):
+                issue_date = now - timedelta(days=rng.randint(0, 400), seconds=rng.randint(0, 86399))
+                due_date = issue_date + timedelta(days=14)
+                status = rng.choice(('issued', 'overdue', 'returned', 'returned', 'returned'))
+                user_id, book_id = rng.randint(1, users), rng.randint(1, books)
+                if status != 'returned':
+                    # One active loan per user and book (ux_transactions_active_loan)
+                    if (user_id, book_id) in on_loan:
+                        status = 'returned'
+                    on_loan.add((user_id, book_id))
+                return_date = issue_date + timedelta(days=rng.randint(1, 30)) if status == 'returned' else None
+                rows.append((i, user_id, book_id, issue_date, due_date,
+                             return_date, 0.0, status, issue_date))
+            cur.executemany(
+                "INSERT INTO transactions (id, user_id, book_id, issue_date, due_date, return_date, "
+                "fine_amount, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [tuple(v.strftime('%Y-%m-%d %H:%M:%S.%f') if isinstance(v, datetime) else v for v in row)
+                 for row in rows]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine while the context is active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_execute)
+
+
+def timed(fn, repeat=5):
+    """Run ``fn`` ``repeat`` times and return (last result, sorted timings in ms)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, sorted(timings)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def cleanup(app):
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    path = app.config['BENCH_DB_PATH']
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Stress test for issue_book: many threads issue and return copies of one
+book at once against a scratch database, then the loan invariants are
+checked.
+
+- available_copies never goes below zero
+- available_copies + active loans == total_copies
+- no user holds two active loans of the book
+- the materialized library_stats counters match a full rebuild, after the
+  book is moved to another category through the API and then the web form
+
+``--deferred`` bypasses the BEGIN IMMEDIATE write transaction so only the
+conditional UPDATE and the unique index stand between the threads; busy
+errors are expected then and counted, but the invariants must still hold.
+
+Usage: python benchmarks/stress_issue_book.py [--threads 16] [--attempts 200] [--copies 3]
+Exits with status 1 when an invariant is broken.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from common import seed
+
+
+def make_stressed_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+
+    return create_app()
+
+
+def worker(app, attempts, users, book_id, deferred, outcomes, lock, seed_value):
+    from app import db, shared_db
+    from app.models import Transaction
+    from app.utils import issue_book, return_book
+
+    issue = issue_book.__wrapped__ if deferred else issue_book
+    give_back = return_book.__wrapped__ if deferred else return_book
+    rng = random.Random(seed_value)
+
+    def record(outcome):
+        with lock:
+            outcomes[outcome] += 1
+
+    with app.app_context():
+        for _ in range(attempts):
+            try:
+                if rng.random() < 0.3:
+                    loan = Transaction.query.filter(
+                        Transaction.book_id == book_id,
+                        Transaction.status.in_(['issued', 'overdue'])
+                    ).order_by(db.func.random()).first()
+                    db.session.rollback()
+                    if loan is None:
+                        record('return: nothing on loan')
+                        continue
+                    success, message = give_back(loan.id)
+                    record(f'return: {message}')
+                else:
+                    success, message = issue(rng.randint(1, users), book_id)
+                    record(f'issue: {message}')
+            except Exception as exc:
+                db.session.rollback()
+                kind = 'busy' if shared_db.is_busy_error(exc) else type(exc).__name__
+                record(f'error: {kind}')
+        db.session.remove()
+
+
+def recategorise(app, book_id):
+    """Move the book, loan history and all, to two other categories in turn"""
+    from app import db
+    from app.models import Book, Category
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        book = db.session.get(Book, book_id)
+        fields = {'title': book.title, 'author': book.author, 'total_copies': book.total_copies}
+        targets = [c.id for c in Category.query.order_by(Category.id) if c.id != book.category_id][:2]
+        token = create_access_token(identity='1', additional_claims={'role': 'librarian'})
+        db.session.rollback()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    response = client.put(f'/api/books/{book_id}', json={'category_id': targets[0]},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.post(f'/books/{book_id}/edit', data={**fields, 'category_id': targets[1]})
+    assert response.status_code == 302, response.status_code
+    with app.app_context():
+        category_id = db.session.get(Book, book_id).category_id
+        db.session.rollback()
+    assert category_id == targets[1], f'book is in category {category_id}, expected {targets[1]}'
+    print(f'book {book_id}: moved to category {targets[0]} then {targets[1]}')
+
+
+def check_invariants(app, book_id):
+    from app import db
+    from app.models import Book, Transaction
+    from app.utils import rebuild_library_stats
+
+    problems = []
+    with app.app_context():
+        book = db.session.get(Book, book_id)
+        active = Transaction.query.filter(
+            Transaction.book_id == book_id,
+            Transaction.status.in_(['issued', 'overdue'])
+        ).all()
+        if book.available_copies < 0:
+            problems.append(f'available_copies is {book.available_copies}')
+        if book.available_copies + len(active) != book.total_copies:
+            problems.append(f'{book.available_copies} available + {len(active)} on loan '
+                            f'!= {book.total_copies} copies')
+        holders = Counter(loan.user_id for loan in active)
+        for user_id, count in holders.items():
+            if count > 1:
+                problems.append(f'user {user_id} holds {count} active loans')
+        drift = rebuild_library_stats()
+        db.session.rollback()
+        for name, (stored, actual) in drift.items():
+            problems.append(f'library stats {name}: stored {stored}, actual {actual}')
+        print(f'book {book_id}: {book.total_copies} copies, {book.available_copies} available, '
+              f'{len(active)} on loan to {len(holders)} users')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=200, help='operations per thread')
+    parser.add_argument('--copies', type=int, default=3)
+    parser.add_argument('--users', type=int, default=6, help='few users, so duplicate loans are attempted')
+    parser.add_argument('--deferred', action='store_true',
+                        help='skip BEGIN IMMEDIATE and rely on the UPDATE and index alone')
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='pustak_stress_')
+    os.close(fd)
+    os.remove(db_path)
+
+    app = make_stressed_app(db_path)
+    from app import db
+    from app.utils import get_library_stats
+    try:
+        seed(app, books=10, users=args.users)
+
+        book_id = 1
+        with app.app_context():
+            db.session.execute(db.text(
+                "UPDATE books SET total_copies = :copies, available_copies = :copies WHERE id = :id"
+            ), {'copies': args.copies, 'id': book_id})
+            db.session.commit()
+            get_library_stats()
+
+        outcomes, lock = Counter(), threading.Lock()
+        threads = [threading.Thread(target=worker, args=(app, args.attempts, args.users, book_id,
+                                                         args.deferred, outcomes, lock, n))
+                   for n in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for outcome, count in sorted(outcomes.items()):
+            print(f'{count:>7}  {outcome}')
+        recategorise(app, book_id)
+        problems = check_invariants(app, book_id)
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    for problem in problems:
+        print(f'FAIL {problem}')
+    print('invariants hold' if not problems else f'{len(problems)} invariants broken')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""unique partial index on active (user_id, book_id) loans
+
+Revision ID: 2b6d9e4f8a13
+Revises: 9f3c6a2e5b17
+Create Date: 2026-10-17 18:40:31.516207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b6d9e4f8a13'
+down_revision = '9f3c6a2e5b17'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE_LOAN = "status IN ('issued', 'overdue')"
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    if 'ux_transactions_active_loan' in _index_names('transactions'):
+        return
+    
+    duplicates = op.get_bind().execute(sa.text(
+        f"SELECT user_id, book_id, COUNT(*) FROM transactions WHERE {ACTIVE_LOAN} "
+        "GROUP BY user_id, book_id HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        listed = ', '.join(f'user {user_id} / book {book_id} ({count} loans)'
+                           for user_id, book_id, count in duplicates[:20])
+        raise RuntimeError(
+            'Return or merge the duplicate active loans before upgrading: ' + listed
+        )
+    
+    op.create_index('ux_transactions_active_loan', 'transactions', ['user_id', 'book_id'], unique=True,
+                    sqlite_where=sa.text(ACTIVE_LOAN), postgresql_where=sa.text(ACTIVE_LOAN))
+
+
+def downgrade():
+    if 'ux_transactions_active_loan' in _index_names('transactions'):
+        op.drop_index('ux_transactions_active_loan', table_name='transactions')
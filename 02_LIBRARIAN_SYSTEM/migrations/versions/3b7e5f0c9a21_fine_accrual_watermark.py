@@ -0,0 +1,32 @@
+"""fine accrual watermark on transactions
+
+Revision ID: 3b7e5f0c9a21
+Revises: 
+Create Date: 2026-10-17 09:12:44.201733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e5f0c9a21'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    return column in [c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)]
+
+
+def upgrade():
+    # create_app() runs db.create_all(), so fresh databases already have it
+    if not _has_column('transactions', 'fines_computed_through'):
+        with op.batch_alter_table('transactions', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('fines_computed_through', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_column('fines_computed_through')
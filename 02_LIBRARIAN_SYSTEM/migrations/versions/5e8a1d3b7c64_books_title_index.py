@@ -0,0 +1,30 @@
+"""(title, id) index on books for keyset pagination
+
+Revision ID: 5e8a1d3b7c64
+Revises: c41f9b7d2e08
+Create Date: 2026-10-17 14:22:10.845120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a1d3b7c64'
+down_revision = 'c41f9b7d2e08'
+branch_labels = None
+depends_on = None
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    if 'ix_books_title_id' not in _index_names('books'):
+        op.create_index('ix_books_title_id', 'books', ['title', 'id'], unique=False)
+
+
+def downgrade():
+    if 'ix_books_title_id' in _index_names('books'):
+        op.drop_index('ix_books_title_id', table_name='books')
@@ -0,0 +1,35 @@
+"""shared state_entries key/value table
+
+Revision ID: 6c1e8a4f2d90
+Revises: 2b6d9e4f8a13
+Create Date: 2026-10-17 21:05:12.804113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e8a4f2d90'
+down_revision = '2b6d9e4f8a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('state_entries'):
+        return
+    op.create_table('state_entries',
+        sa.Column('namespace', sa.String(length=50), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('value', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('namespace', 'key')
+    )
+    op.create_index('ix_state_entries_expires_at', 'state_entries', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_state_entries_expires_at', table_name='state_entries')
+    op.drop_table('state_entries')
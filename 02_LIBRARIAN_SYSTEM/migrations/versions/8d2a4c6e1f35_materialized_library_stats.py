@@ -0,0 +1,48 @@
+"""materialized library_stats and category_stats tables
+
+Revision ID: 8d2a4c6e1f35
+Revises: 3b7e5f0c9a21
+Create Date: 2026-10-17 11:40:02.518904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2a4c6e1f35'
+down_revision = '3b7e5f0c9a21'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    # Counters are filled on first read or by `flask rebuild-stats`
+    if not _has_table('library_stats'):
+        op.create_table('library_stats',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('total_books', sa.Integer(), nullable=False),
+            sa.Column('total_copies', sa.Integer(), nullable=False),
+            sa.Column('available_copies', sa.Integer(), nullable=False),
+            sa.Column('issued_count', sa.Integer(), nullable=False),
+            sa.Column('overdue_count', sa.Integer(), nullable=False),
+            sa.Column('total_fines', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('category_stats'):
+        op.create_table('category_stats',
+            sa.Column('category_id', sa.Integer(), nullable=False),
+            sa.Column('borrow_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+            sa.PrimaryKeyConstraint('category_id')
+        )
+
+
+def downgrade():
+    op.drop_table('category_stats')
+    op.drop_table('library_stats')
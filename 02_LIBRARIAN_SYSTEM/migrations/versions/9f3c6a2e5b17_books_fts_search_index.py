@@ -0,0 +1,90 @@
+"""books_fts full-text search index with sync triggers
+
+Revision ID: 9f3c6a2e5b17
+Revises: 5e8a1d3b7c64
+Create Date: 2026-10-17 15:10:36.275519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3c6a2e5b17'
+down_revision = '5e8a1d3b7c64'
+branch_labels = None
+depends_on = None
+
+
+# The schema as of this revision, copied from app/search.py so later edits there do not change it
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, publisher, isbn, category,
+        tokenize = 'unicode61', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+        VALUES (new.id, new.title, new.author, new.publisher, new.isbn,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_update
+    AFTER UPDATE OF title, author, publisher, isbn, category_id ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+        INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+        VALUES (new.id, new.title, new.author, new.publisher, new.isbn,
+                (SELECT name FROM categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_after_delete AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+        UPDATE books_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM books WHERE category_id = new.id);
+    END
+    """,
+]
+
+FTS_DROP = [
+    'DROP TRIGGER IF EXISTS books_fts_category_rename',
+    'DROP TRIGGER IF EXISTS books_fts_after_delete',
+    'DROP TRIGGER IF EXISTS books_fts_after_update',
+    'DROP TRIGGER IF EXISTS books_fts_after_insert',
+    'DROP TABLE IF EXISTS books_fts',
+]
+
+FTS_POPULATE = """
+    INSERT INTO books_fts (rowid, title, author, publisher, isbn, category)
+    SELECT b.id, b.title, b.author, b.publisher, b.isbn, c.name
+    FROM books b LEFT JOIN categories c ON c.id = b.category_id
+"""
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    existed = sa.inspect(bind).has_table('books_fts')
+    try:
+        for statement in FTS_DDL:
+            op.execute(statement)
+    except sa.exc.OperationalError:
+        # SQLite built without FTS5: search stays on LIKE
+        return
+    if not existed:
+        op.execute(FTS_POPULATE)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in FTS_DROP:
+        op.execute(statement)
@@ -0,0 +1,58 @@
+"""notifications dedupe_key and per-user indexes
+
+Revision ID: a7d3f1c8e529
+Revises: 6c1e8a4f2d90
+Create Date: 2026-10-17 22:14:47.390562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f1c8e529'
+down_revision = '6c1e8a4f2d90'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ux_notifications_user_dedupe_key', ['user_id', 'dedupe_key'], True),
+    ('ix_notifications_user_created_at', ['user_id', 'created_at'], False),
+    ('ix_notifications_user_seen_created_at', ['user_id', 'seen', 'created_at'], False),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # The mobile backend may already have created the table without dedupe_key
+    if not inspector.has_table('notifications'):
+        op.create_table('notifications',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.Text(), nullable=False),
+            sa.Column('body', sa.Text(), nullable=False),
+            sa.Column('type', sa.Text(), nullable=False),
+            sa.Column('seen', sa.Boolean(), server_default=sa.text('0'), nullable=False),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+            sa.Column('dedupe_key', sa.String(length=100), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+    elif 'dedupe_key' not in {column['name'] for column in inspector.get_columns('notifications')}:
+        op.add_column('notifications', sa.Column('dedupe_key', sa.String(length=100), nullable=True))
+    
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('notifications')}
+    for name, columns, unique in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'notifications', columns, unique=unique)
+
+
+def downgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('notifications')}
+    for name, _, _ in INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name='notifications')
+    # The table itself belongs to the mobile backend's schema as well, so it is kept
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_column('dedupe_key')
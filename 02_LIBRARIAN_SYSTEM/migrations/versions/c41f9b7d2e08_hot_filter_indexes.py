@@ -0,0 +1,45 @@
+"""indexes on the transactions and reservations filter columns
+
+Revision ID: c41f9b7d2e08
+Revises: 8d2a4c6e1f35
+Create Date: 2026-10-17 13:05:47.102318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f9b7d2e08'
+down_revision = '8d2a4c6e1f35'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('transactions', 'ix_transactions_status_due_date', ['status', 'due_date']),
+    ('transactions', 'ix_transactions_user_id_status', ['user_id', 'status']),
+    ('transactions', 'ix_transactions_book_id_status', ['book_id', 'status']),
+    ('transactions', 'ix_transactions_issue_date', ['issue_date']),
+    ('transactions', 'ix_transactions_return_date', ['return_date']),
+    ('transactions', 'ix_transactions_created_at', ['created_at']),
+    ('reservations', 'ix_reservations_book_id_status', ['book_id', 'status']),
+    ('reservations', 'ix_reservations_user_id_status', ['user_id', 'status']),
+]
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() already builds these on fresh databases
+    for table, name, columns in INDEXES:
+        if name not in _index_names(table):
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        if name in _index_names(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,90 @@
+"""user_data_versions table and triggers for conditional GETs
+
+Revision ID: d5b2e7a9c461
+Revises: a7d3f1c8e529
+Create Date: 2026-10-18 09:12:05.662190
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5b2e7a9c461'
+down_revision = 'a7d3f1c8e529'
+branch_labels = None
+depends_on = None
+
+
+# The schema as of this revision, copied from 03_SHARED_RESOURCES/user_versions.py so later
+# edits there do not change it
+GLOBAL_USER_ID = 0
+
+_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+_BUMP_USER = f"""
+    INSERT INTO user_data_versions (user_id, version, updated_at) VALUES ({{user}}, 1, {_NOW})
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+"""
+
+_BUMP_BOOK_HOLDERS = f"""
+    INSERT INTO user_data_versions (user_id, version, updated_at)
+    SELECT user_id, 1, {_NOW} FROM (
+        SELECT user_id FROM transactions WHERE book_id = {{book}} AND status IN ('issued', 'overdue')
+        UNION SELECT user_id FROM reservations WHERE book_id = {{book}} AND status = 'pending'
+    ) WHERE true
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+"""
+
+USER_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS user_data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER
+    )
+"""
+
+
+def _trigger(table, event, body):
+    name = f'user_versions_{table}_{event.lower()}'
+    return name, f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN {body} END'
+
+
+def _user_triggers(table, also=''):
+    return [
+        _trigger(table, 'INSERT', _BUMP_USER.format(user='new.user_id') + also.format(row='new')),
+        _trigger(table, 'UPDATE', _BUMP_USER.format(user='new.user_id') + also.format(row='new')),
+        _trigger(table, 'DELETE', _BUMP_USER.format(user='old.user_id') + also.format(row='old')),
+    ]
+
+
+# table -> [(trigger name, DDL)]; triggers are only created for tables that exist
+TRIGGERS = {
+    'transactions': _user_triggers('transactions'),
+    'reservations': _user_triggers('reservations', _BUMP_BOOK_HOLDERS.format(book='{row}.book_id')),
+    'notifications': _user_triggers('notifications'),
+    'fines': _user_triggers('fines'),
+    'books': [_trigger('books', 'UPDATE', _BUMP_BOOK_HOLDERS.format(book='new.id'))],
+    'categories': [_trigger('categories', 'UPDATE', _BUMP_USER.format(user=GLOBAL_USER_ID))],
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    cursor = op.get_bind().connection.cursor()
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    cursor.execute(USER_VERSIONS_TABLE)
+    for table, triggers in TRIGGERS.items():
+        if table in tables:
+            for _, ddl in triggers:
+                cursor.execute(ddl)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    cursor = op.get_bind().connection.cursor()
+    for triggers in TRIGGERS.values():
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('DROP TABLE IF EXISTS user_data_versions')
@@ -0,0 +1,122 @@
+"""books.updated_at and the book_changes log for mobile catalogue sync
+
+Revision ID: e3a9c5f1b274
+Revises: d5b2e7a9c461
+Create Date: 2026-10-18 11:40:22.918306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c5f1b274'
+down_revision = 'd5b2e7a9c461'
+branch_labels = None
+depends_on = None
+
+
+# The schema as of this revision, copied from 03_SHARED_RESOURCES/book_changes.py so later
+# edits there do not change it
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+_UPSERT = """
+    ON CONFLICT (book_id) DO UPDATE SET
+        seq = excluded.seq, deleted = excluded.deleted, changed_at = excluded.changed_at;
+"""
+
+_RECORD = f"""
+    INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+    VALUES ({{book}}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM book_changes), {{deleted}}, {_NOW})
+""" + _UPSERT
+
+BOOK_CHANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS book_changes (
+        book_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at TEXT NOT NULL
+    )
+"""
+
+BOOK_CHANGES_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS ux_book_changes_seq ON book_changes (seq)'
+
+
+def _trigger(name, event, body, when=None):
+    condition = f' WHEN {when}' if when else ''
+    return name, f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}{condition} BEGIN {body} END'
+
+
+# table -> [(trigger name, DDL)]; triggers are only created for tables that exist
+TRIGGERS = {
+    'books': [
+        _trigger('book_changes_after_insert', 'INSERT ON books', _RECORD.format(book='new.id', deleted=0)),
+        _trigger('book_changes_after_update', 'UPDATE ON books', _RECORD.format(book='new.id', deleted=0)),
+        _trigger('book_changes_after_delete', 'DELETE ON books', _RECORD.format(book='old.id', deleted=1)),
+    ],
+    'categories': [
+        _trigger('book_changes_category_rename', 'UPDATE OF name ON categories', f"""
+            INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+            SELECT id, (SELECT COALESCE(MAX(seq), 0) FROM book_changes) + row_number() OVER (ORDER BY id),
+                   0, {_NOW}
+            FROM books WHERE category_id = new.id
+        """ + _UPSERT, when='new.name IS NOT old.name'),
+    ],
+    'reservations': [
+        _trigger('book_changes_reservation_insert', 'INSERT ON reservations',
+                 _RECORD.format(book='new.book_id', deleted=0),
+                 when="new.status = 'pending' AND new.book_id IN (SELECT id FROM books)"),
+        _trigger('book_changes_reservation_update', 'UPDATE OF status ON reservations',
+                 _RECORD.format(book='new.book_id', deleted=0),
+                 when="old.status IS NOT new.status AND 'pending' IN (old.status, new.status) "
+                      "AND new.book_id IN (SELECT id FROM books)"),
+        _trigger('book_changes_reservation_delete', 'DELETE ON reservations',
+                 _RECORD.format(book='old.book_id', deleted=0),
+                 when="old.status = 'pending' AND old.book_id IN (SELECT id FROM books)"),
+    ],
+}
+
+# Every existing book as one change, in id order
+BOOK_CHANGES_POPULATE = f"""
+    INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+    SELECT id, row_number() OVER (ORDER BY id), 0, {_NOW} FROM books
+"""
+
+
+def _install_book_changes(cursor):
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'books' not in tables:
+        return
+    cursor.execute(BOOK_CHANGES_TABLE)
+    cursor.execute(BOOK_CHANGES_INDEX)
+    for table, triggers in TRIGGERS.items():
+        if table in tables:
+            for _, ddl in triggers:
+                cursor.execute(ddl)
+    if 'book_changes' not in tables:
+        cursor.execute(BOOK_CHANGES_POPULATE)
+
+
+def _uninstall_book_changes(cursor):
+    for triggers in TRIGGERS.values():
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('DROP TABLE IF EXISTS book_changes')
+
+
+def upgrade():
+    # A plain ADD COLUMN: rebuilding books in batch mode would drop its FTS and sync triggers
+    if 'updated_at' not in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('books')}:
+        op.add_column('books', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE books SET updated_at = created_at WHERE updated_at IS NULL')
+    if op.get_bind().dialect.name == 'sqlite':
+        _install_book_changes(op.get_bind().connection.cursor())
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _uninstall_book_changes(op.get_bind().connection.cursor())
+        # Native DROP COLUMN (SQLite 3.35+) keeps the other triggers on books
+        op.execute('ALTER TABLE books DROP COLUMN updated_at')
+    else:
+        op.drop_column('books', 'updated_at')
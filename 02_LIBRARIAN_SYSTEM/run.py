@@ -4,7 +4,11 @@ Pustak Tracker - Library Management System
 Main application entry point
 """
 
+import io
 import os
+import sys
+import json
+import click
 from app import create_app, db
 from app.models import User, Book, Transaction, Category, Reservation
 
@@ -126,17 +130,92 @@ def init_db():
 
 @app.cli.command()
 def calculate_fines():
-    """Calculate overdue fines for all transactions"""
-    from app.utils import calculate_overdue_fines, send_overdue_reminders
+    """Accrue overdue fines (schedule this, e.g. hourly from cron)"""
+    from app.utils import accrue_fines, send_overdue_reminders
     
     print("Calculating overdue fines...")
-    updated_count = calculate_overdue_fines()
+    updated_count = accrue_fines()
     print(f"Updated {updated_count} transactions with new fines")
     
     print("Sending overdue reminders...")
     reminders_sent = send_overdue_reminders()
     print(f"Sent {reminders_sent} reminder notifications")
 
+@app.cli.command()
+def generate_notifications():
+    """Write due-soon, overdue and reservation notifications for the mobile app (schedule from cron)"""
+    from app.utils import generate_notifications as generate
+    
+    added = generate()
+    print(f"Added {added} notifications")
+
+@app.cli.command()
+def rebuild_stats():
+    """Recompute the materialized dashboard statistics and report drift"""
+    from app.utils import rebuild_library_stats
+    
+    print("Rebuilding library statistics...")
+    drift = rebuild_library_stats()
+    db.session.commit()
+    
+    if not drift:
+        print("No drift detected")
+    for name, (stored, actual) in sorted(drift.items()):
+        print(f"  {name}: {stored} -> {actual}")
+    print(f"Corrected {len(drift)} counters")
+
+@app.cli.command()
+def rebuild_search_index():
+    """Repopulate the books_fts full-text search index from the books table"""
+    from app.search import fts_enabled, rebuild_book_search_index
+    
+    if not fts_enabled():
+        print("Full-text search is not available on this database; searches use LIKE")
+        return
+    
+    with db.engine.begin() as connection:
+        indexed = rebuild_book_search_index(connection)
+    print(f"Indexed {indexed} books")
+
+@app.cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format (default: from the file extension, else csv)')
+@click.option('--batch-size', type=int, help='Rows per insert batch and transaction')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write rejected records here as JSON lines')
+def import_books(path, fmt, batch_size, rejects):
+    """Bulk-import books from a CSV or JSON Lines file (- for stdin)"""
+    from app.book_import import format_for_name, import_books as run_import
+    
+    fmt = fmt or format_for_name(path)
+    batch_size = batch_size or app.config['BOOK_IMPORT_BATCH_SIZE']
+    rejects_file = open(rejects, 'w', encoding='utf-8') if rejects else None
+    
+    def on_progress(report):
+        print(f"  {report.read} rows read, {report.imported} imported, {report.rejected} rejected "
+              f"({report.rows_per_second:,.0f} rows/s)")
+    
+    def on_reject(line, reason, record):
+        if rejects_file is not None:
+            rejects_file.write(json.dumps({'line': line, 'reason': reason, 'record': record}) + '\n')
+    
+    print(f"Importing books from {path} ({fmt}, {batch_size} rows per batch)...")
+    try:
+        raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as stream:
+            report = run_import(stream, fmt, batch_size, on_progress, on_reject)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+    
+    print(f"Imported {report.imported} books ({report.categories_created} new categories), "
+          f"rejected {report.rejected}, in {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/s)")
+    for line, reason in report.rejects[:20]:
+        print(f"  line {line}: {reason}")
+    if report.rejected > 20:
+        print(f"  ... {report.rejected - 20} more" + (f", all in {rejects}" if rejects else ""))
+
 @app.cli.command()
 def create_admin():
     """Create a new librarian account"""
@@ -176,6 +255,11 @@ def get_local_ip():
         return 'localhost'
 
 if __name__ == '__main__':
+    # Build the typo-tolerant search index before taking requests
+    from app.search import rebuild_book_index
+    with app.app_context():
+        rebuild_book_index()
+    
     # Check if we're running in development mode
     if os.getenv('FLASK_ENV') != 'production':
         local_ip = get_local_ip()
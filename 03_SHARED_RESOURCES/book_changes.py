@@ -0,0 +1,169 @@
+"""
+Catalogue change log behind the mobile app's delta sync of books.
+
+``book_changes`` keeps one row per book: the sequence number of its latest
+change and whether that change deleted it (a tombstone). Triggers on
+``books`` give a book a fresh sequence number whenever it is inserted,
+updated (including the issue/return ``available_copies`` updates) or
+deleted. A category rename renumbers that category's books, whose payload
+carries the category name, and a reservation entering or leaving
+``pending`` renumbers its book, since pending holds are left out of the
+available count the app is sent. Because SQLite allows one writer at a
+time, numbers are handed out in commit order, so a client that has seen
+everything up to ``n`` only needs the rows above ``n``.
+
+A sync token is that number. Without one (or with one from a log that was
+rebuilt) a sync starts from the beginning, leaving tombstones out. Only the
+latest change per book is kept, so the log is as large as the number of
+books ever catalogued and a sync costs what changed since the token.
+"""
+
+SYNC_PAGE_DEFAULT_LIMIT = 500
+SYNC_PAGE_MAX_LIMIT = 1000
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+_UPSERT = """
+    ON CONFLICT (book_id) DO UPDATE SET
+        seq = excluded.seq, deleted = excluded.deleted, changed_at = excluded.changed_at;
+"""
+
+_RECORD = f"""
+    INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+    VALUES ({{book}}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM book_changes), {{deleted}}, {_NOW})
+""" + _UPSERT
+
+BOOK_CHANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS book_changes (
+        book_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at TEXT NOT NULL
+    )
+"""
+
+BOOK_CHANGES_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS ux_book_changes_seq ON book_changes (seq)'
+
+
+def _trigger(name, event, body, when=None):
+    condition = f' WHEN {when}' if when else ''
+    return name, f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}{condition} BEGIN {body} END'
+
+
+# table -> [(trigger name, DDL)]; triggers are only created for tables that exist
+TRIGGERS = {
+    'books': [
+        _trigger('book_changes_after_insert', 'INSERT ON books', _RECORD.format(book='new.id', deleted=0)),
+        _trigger('book_changes_after_update', 'UPDATE ON books', _RECORD.format(book='new.id', deleted=0)),
+        _trigger('book_changes_after_delete', 'DELETE ON books', _RECORD.format(book='old.id', deleted=1)),
+    ],
+    # The payload carries the category name
+    'categories': [
+        _trigger('book_changes_category_rename', 'UPDATE OF name ON categories', f"""
+            INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+            SELECT id, (SELECT COALESCE(MAX(seq), 0) FROM book_changes) + row_number() OVER (ORDER BY id),
+                   0, {_NOW}
+            FROM books WHERE category_id = new.id
+        """ + _UPSERT, when='new.name IS NOT old.name'),
+    ],
+    # Pending reservations hold copies back from the available count the app is sent
+    'reservations': [
+        _trigger('book_changes_reservation_insert', 'INSERT ON reservations',
+                 _RECORD.format(book='new.book_id', deleted=0),
+                 when="new.status = 'pending' AND new.book_id IN (SELECT id FROM books)"),
+        _trigger('book_changes_reservation_update', 'UPDATE OF status ON reservations',
+                 _RECORD.format(book='new.book_id', deleted=0),
+                 when="old.status IS NOT new.status AND 'pending' IN (old.status, new.status) "
+                      "AND new.book_id IN (SELECT id FROM books)"),
+        _trigger('book_changes_reservation_delete', 'DELETE ON reservations',
+                 _RECORD.format(book='old.book_id', deleted=0),
+                 when="old.status = 'pending' AND old.book_id IN (SELECT id FROM books)"),
+    ],
+}
+
+# Every existing book as one change, in id order
+BOOK_CHANGES_POPULATE = f"""
+    INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+    SELECT id, row_number() OVER (ORDER BY id), 0, {_NOW} FROM books
+"""
+
+# Books with ids above the parameter as one change each, in id order: the work of
+# book_changes_after_insert for a bulk insert made without it
+BOOK_CHANGES_RECORD_INSERTED = f"""
+    INSERT INTO book_changes (book_id, seq, deleted, changed_at)
+    SELECT id, (SELECT COALESCE(MAX(seq), 0) FROM book_changes) + row_number() OVER (ORDER BY id), 0, {_NOW}
+    FROM books WHERE id > ?
+""" + _UPSERT
+
+CHANGES_SQL = """
+    SELECT book_id, seq, deleted FROM book_changes
+    WHERE seq > ? {live_only} ORDER BY seq LIMIT ?
+"""
+
+
+def install(connection):
+    """Create book_changes and its triggers, filling it from ``books`` when first created.
+
+    ``connection`` is a DB-API connection; the caller commits. Does nothing
+    when there is no ``books`` table yet.
+    """
+    cursor = connection.cursor()
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'books' not in tables:
+        return
+    cursor.execute(BOOK_CHANGES_TABLE)
+    cursor.execute(BOOK_CHANGES_INDEX)
+    for table, triggers in TRIGGERS.items():
+        if table in tables:
+            for _, ddl in triggers:
+                cursor.execute(ddl)
+    if 'book_changes' not in tables:
+        cursor.execute(BOOK_CHANGES_POPULATE)
+
+
+def uninstall(connection):
+    cursor = connection.cursor()
+    for triggers in TRIGGERS.values():
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('DROP TABLE IF EXISTS book_changes')
+
+
+def parse_token(value):
+    """The sequence number in a sync token, or None for none; raises ValueError if malformed"""
+    if value in (None, ''):
+        return None
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError('Invalid sync token')
+    return int(value)
+
+
+def page_limit(value):
+    return min(max(value or SYNC_PAGE_DEFAULT_LIMIT, 1), SYNC_PAGE_MAX_LIMIT)
+
+
+def read_changes(connection, since, limit):
+    """One page of the log after token ``since``.
+
+    Returns a dict with ``changed`` (ids of books to upsert), ``deleted``
+    (ids to drop), ``next_token``, ``has_more`` and ``reset``. ``reset`` is
+    True when the client must discard its catalogue and rebuild it from
+    this and the following pages.
+    """
+    cursor = connection.cursor()
+    latest = cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM book_changes').fetchone()[0]
+    reset = since is None or since > latest
+    if reset:
+        since = 0
+    rows = cursor.execute(CHANGES_SQL.format(live_only='AND deleted = 0' if reset else ''),
+                          (since, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'changed': [book_id for book_id, _, deleted in rows if not deleted],
+        'deleted': [book_id for book_id, _, deleted in rows if deleted],
+        # A full sync that finds nothing is still current as of ``latest``
+        'next_token': str(rows[-1][1] if rows else (latest if reset else since)),
+        'has_more': has_more,
+        'reset': reset,
+    }
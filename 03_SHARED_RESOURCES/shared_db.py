@@ -0,0 +1,235 @@
+"""
+Common connection factory for the shared pustak_tracker.db.
+
+The librarian app (SQLAlchemy) and the mobile backend (sqlite3) both open the
+database through this module, so they agree on WAL journaling, the busy
+timeout and how write transactions start:
+
+* ``connect()`` returns a configured sqlite3 connection, and
+  ``connect_readonly()`` a read-only one for read routing.
+* ``configure_engine()`` applies the same settings to a SQLAlchemy engine and
+  lets a session ask for ``BEGIN IMMEDIATE``.
+* ``retry_on_busy()`` re-runs a write transaction with exponential backoff
+  when SQLite still reports ``database is locked`` after the busy timeout.
+
+Time spent waiting for the write lock is recorded in ``lock_metrics``.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.request
+
+BUSY_TIMEOUT_MS = 5000
+
+# Applied once to every new connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',   # 256 MB
+    'PRAGMA cache_size = -16000',     # 16 MB
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+)
+
+# For read-only connections, which may not change the journal mode
+READ_ONLY_PRAGMAS = (
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -16000',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA query_only = ON',
+)
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05   # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 1.0
+
+# Execution option a SQLAlchemy connection carries to start with BEGIN IMMEDIATE
+BEGIN_MODE_OPTION = 'sqlite_begin'
+
+# Connection.info keys set at BEGIN: whether it was IMMEDIATE, and total_changes at that point
+_BEGAN_IMMEDIATE = 'shared_db_began_immediate'
+_CHANGES_AT_BEGIN = 'shared_db_changes_at_begin'
+
+
+class LockWaitMetrics:
+    """Thread-safe counters for write-lock waits, retries and give-ups"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.lock_waits = 0
+            self.lock_wait_seconds = 0.0
+            self.max_lock_wait_seconds = 0.0
+            self.busy_retries = 0
+            self.backoff_seconds = 0.0
+            self.busy_failures = 0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.lock_waits += 1
+            self.lock_wait_seconds += seconds
+            self.max_lock_wait_seconds = max(self.max_lock_wait_seconds, seconds)
+
+    def record_retry(self, delay):
+        with self._lock:
+            self.busy_retries += 1
+            self.backoff_seconds += delay
+
+    def record_failure(self):
+        with self._lock:
+            self.busy_failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'lock_waits': self.lock_waits,
+                'lock_wait_ms_total': round(self.lock_wait_seconds * 1000, 3),
+                'lock_wait_ms_avg': round(self.lock_wait_seconds * 1000 / self.lock_waits, 3)
+                if self.lock_waits else 0.0,
+                'lock_wait_ms_max': round(self.max_lock_wait_seconds * 1000, 3),
+                'busy_retries': self.busy_retries,
+                'backoff_ms_total': round(self.backoff_seconds * 1000, 3),
+                'busy_failures': self.busy_failures,
+            }
+
+
+lock_metrics = LockWaitMetrics()
+
+
+def configure_connection(conn, pragmas=CONNECTION_PRAGMAS):
+    """Apply the shared PRAGMAs to an open sqlite3 connection"""
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+def connect(database, pragmas=CONNECTION_PRAGMAS, **kwargs):
+    """A sqlite3 connection to ``database`` with the shared PRAGMAs applied"""
+    kwargs.setdefault('timeout', BUSY_TIMEOUT_MS / 1000)
+    return configure_connection(sqlite3.connect(database, **kwargs), pragmas)
+
+
+def connect_readonly(database, pragmas=READ_ONLY_PRAGMAS, immutable=False, **kwargs):
+    """A ``mode=ro`` URI connection to ``database``.
+
+    ``immutable`` additionally skips all locking and change detection, which
+    is only safe for a file nothing else will write to, such as a snapshot.
+    """
+    uri = 'file:' + urllib.request.pathname2url(os.path.abspath(database)) + '?mode=ro'
+    if immutable:
+        uri += '&immutable=1'
+    kwargs.setdefault('timeout', BUSY_TIMEOUT_MS / 1000)
+    return configure_connection(sqlite3.connect(uri, uri=True, **kwargs), pragmas)
+
+
+def begin_immediate(conn):
+    """Start a write transaction on a sqlite3 connection, timing the lock wait.
+
+    ``BEGIN IMMEDIATE`` takes the write lock up front, so the busy timeout is
+    spent here rather than on a deferred transaction's first write, where a
+    stale WAL snapshot fails at once instead of waiting.
+    """
+    start = time.perf_counter()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+    finally:
+        lock_metrics.record_wait(time.perf_counter() - start)
+
+
+def is_busy_error(exc):
+    """True for SQLITE_BUSY/SQLITE_LOCKED, raw or wrapped by SQLAlchemy"""
+    exc = getattr(exc, 'orig', None) or exc
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(fn, on_retry=None, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                  max_delay=RETRY_MAX_DELAY):
+    """Call ``fn()``, retrying with jittered exponential backoff while the database is busy.
+
+    ``fn`` must be a whole write transaction that can safely run again;
+    ``on_retry`` (usually a rollback) runs before each new attempt.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as exc:
+            if not is_busy_error(exc):
+                raise
+            if attempt + 1 >= attempts:
+                lock_metrics.record_failure()
+                raise
+            if on_retry is not None:
+                on_retry()
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            lock_metrics.record_retry(delay)
+            time.sleep(delay)
+
+
+def run_write(conn, work, **retry_options):
+    """Run ``work(conn)`` as one retried ``BEGIN IMMEDIATE`` transaction on a sqlite3 connection"""
+    def attempt():
+        begin_immediate(conn)
+        try:
+            result = work(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return result
+
+    return retry_on_busy(attempt, **retry_options)
+
+
+def holds_write_lock(connection):
+    """True when a configured engine connection's transaction began IMMEDIATE or has written rows.
+
+    A transaction that has only read can be ended and restarted with
+    ``BEGIN IMMEDIATE`` without losing anything; one that holds the write
+    lock belongs to whoever started it.
+    """
+    info = connection.info
+    return bool(info.get(_BEGAN_IMMEDIATE)) or (
+        connection.connection.dbapi_connection.total_changes != info.get(_CHANGES_AT_BEGIN)
+    )
+
+
+def configure_engine(engine, pragmas=CONNECTION_PRAGMAS):
+    """Apply the shared settings to a SQLAlchemy SQLite engine.
+
+    pysqlite's own transaction handling is switched off so SQLAlchemy emits
+    BEGIN itself: ``BEGIN IMMEDIATE`` (timed) when the connection carries the
+    ``sqlite_begin='immediate'`` execution option, plain ``BEGIN`` otherwise.
+    """
+    from sqlalchemy import event
+
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        configure_connection(dbapi_connection, pragmas)
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(connection):
+        immediate = connection.get_execution_options().get(BEGIN_MODE_OPTION) == 'immediate'
+        connection.info[_BEGAN_IMMEDIATE] = immediate
+        connection.info[_CHANGES_AT_BEGIN] = connection.connection.dbapi_connection.total_changes
+        if immediate:
+            start = time.perf_counter()
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+            finally:
+                lock_metrics.record_wait(time.perf_counter() - start)
+        else:
+            connection.exec_driver_sql('BEGIN')
+
+    return engine
@@ -0,0 +1,177 @@
+"""
+Per-user data versions for conditional GETs on the mobile read endpoints.
+
+Triggers on the shared tables keep a counter per user in
+``user_data_versions``: any change to a user's transactions, reservations,
+notifications or fines bumps it, and so does a change to a book they hold
+or have reserved (available copies, title...). Row 0 is bumped when a
+category is renamed and applies to everyone. Because the counters are kept
+by SQLite itself, writes from the librarian app, the mobile backend and
+raw SQL all count.
+
+Some payloads also change with the clock: a loan turns overdue at its due
+date and its fine grows at each day boundary after that. The version
+therefore also includes the number of the user's overdue loans and their
+total whole days overdue.
+
+``conditional_get`` wraps a Flask view so it answers ``304 Not Modified``
+from the version alone, before running its queries, and otherwise tags the
+response with ``ETag`` and ``Last-Modified``.
+"""
+
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+
+GLOBAL_USER_ID = 0
+
+_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+_BUMP_USER = f"""
+    INSERT INTO user_data_versions (user_id, version, updated_at) VALUES ({{user}}, 1, {_NOW})
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+"""
+
+# Everyone holding or waiting for a book sees it in their borrowed list
+_BUMP_BOOK_HOLDERS = f"""
+    INSERT INTO user_data_versions (user_id, version, updated_at)
+    SELECT user_id, 1, {_NOW} FROM (
+        SELECT user_id FROM transactions WHERE book_id = {{book}} AND status IN ('issued', 'overdue')
+        UNION SELECT user_id FROM reservations WHERE book_id = {{book}} AND status = 'pending'
+    ) WHERE true
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+"""
+
+USER_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS user_data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER
+    )
+"""
+
+
+def _trigger(table, event, body):
+    name = f'user_versions_{table}_{event.lower()}'
+    return name, f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN {body} END'
+
+
+def _user_triggers(table, also=''):
+    return [
+        _trigger(table, 'INSERT', _BUMP_USER.format(user='new.user_id') + also.format(row='new')),
+        _trigger(table, 'UPDATE', _BUMP_USER.format(user='new.user_id') + also.format(row='new')),
+        _trigger(table, 'DELETE', _BUMP_USER.format(user='old.user_id') + also.format(row='old')),
+    ]
+
+
+# table -> [(trigger name, DDL)]; triggers are only created for tables that exist
+TRIGGERS = {
+    'transactions': _user_triggers('transactions'),
+    'reservations': _user_triggers('reservations', _BUMP_BOOK_HOLDERS.format(book='{row}.book_id')),
+    'notifications': _user_triggers('notifications'),
+    'fines': _user_triggers('fines'),
+    'books': [_trigger('books', 'UPDATE', _BUMP_BOOK_HOLDERS.format(book='new.id'))],
+    'categories': [_trigger('categories', 'UPDATE', _BUMP_USER.format(user=GLOBAL_USER_ID))],
+}
+
+VERSION_SQL = """
+    SELECT COALESCE(SUM(CASE WHEN user_id = ? THEN version END), 0),
+           COALESCE(SUM(CASE WHEN user_id = 0 THEN version END), 0),
+           MAX(updated_at)
+    FROM user_data_versions WHERE user_id IN (?, 0)
+"""
+
+# Overdue loans, their whole days overdue and the last day boundary crossed (julian day)
+CLOCK_SQL = """
+    SELECT COUNT(*),
+           COALESCE(SUM(CAST(julianday(?) - julianday(due_date) AS INTEGER)), 0),
+           MAX(julianday(due_date) + CAST(julianday(?) - julianday(due_date) AS INTEGER))
+    FROM transactions
+    WHERE user_id = ? AND status IN ('issued', 'overdue') AND julianday(due_date) < julianday(?)
+"""
+
+
+def install(connection):
+    """Create the versions table and the triggers of every shared table present.
+
+    ``connection`` is a DB-API connection (sqlite3, or the one under a
+    SQLAlchemy connection); the caller commits.
+    """
+    cursor = connection.cursor()
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    cursor.execute(USER_VERSIONS_TABLE)
+    for table, triggers in TRIGGERS.items():
+        if table in tables:
+            for _, ddl in triggers:
+                cursor.execute(ddl)
+
+
+def uninstall(connection):
+    cursor = connection.cursor()
+    for triggers in TRIGGERS.values():
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('DROP TABLE IF EXISTS user_data_versions')
+
+
+def read_version(connection, user_id, now=None):
+    """``(tag, last_modified)`` for a user's data as of ``now``.
+
+    ``tag`` changes whenever any of the user's mobile payloads may have;
+    ``last_modified`` is an aware UTC datetime, or None if nothing was ever
+    recorded for the user. Returns None when the versions table is missing.
+    """
+    now = (now or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S.%f')
+    cursor = connection.cursor()
+    try:
+        user_version, global_version, updated_at = cursor.execute(VERSION_SQL, (user_id, user_id)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    overdue, overdue_days, boundary = cursor.execute(CLOCK_SQL, (now, now, user_id, now)).fetchone()
+
+    stamps = [updated_at] if updated_at is not None else []
+    if boundary is not None:
+        stamps.append(round((boundary - 2440587.5) * 86400))
+    last_modified = datetime.fromtimestamp(max(stamps), timezone.utc) if stamps else None
+    return f'{user_id}.{user_version}.{global_version}.{overdue}.{overdue_days}', last_modified
+
+
+def conditional_get(get_connection, get_user_id):
+    """Decorator for a per-user GET view (placed below ``jwt_required``).
+
+    ``get_connection()`` returns a DB-API connection to read the version
+    from and ``get_user_id()`` the caller's id. The ETag also covers the
+    path and query string, since one version serves several endpoints.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import make_response, request
+
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            version = read_version(get_connection(), int(get_user_id()))
+            if version is None:
+                return view(*args, **kwargs)
+            tag, last_modified = version
+            etag = f'{tag}.{zlib.crc32(request.full_path.encode()):08x}'
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since)
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator